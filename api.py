@@ -1,10 +1,160 @@
-from flask import Flask, jsonify, send_from_directory, request
-from src.thresholds import TEMP_THRESHOLD, HUMIDITY_THRESHOLD, evaluate_sensor
-from src.sensor_db import get_recent_data, store_remote_data, get_latest_per_pi
+from flask import Flask, Response, jsonify, send_from_directory, request
+from werkzeug.serving import WSGIRequestHandler
+from src.sensor_db import (
+    init_db, iter_recent_data, get_recent_data, get_rollup_data, get_filled_data, choose_resolution,
+    ROLLUPS, FILL_METHODS,
+    store_remote_data, store_remote_batch, add_insert_listener,
+)
+from src import live_cache, sensor_db, metrics, profiling
+from src.broadcast import Broadcaster
+from src.retention import RetentionWorker
+from src.deadband import Deadband
+from src.gzip_request import GunzipRequestMiddleware
+from src.history_format import COLUMNAR_MIMETYPE, BINARY_MIMETYPE, encode_columnar, to_binary
+import os
 import socket
+import time
+import json
+import logging
 
 app = Flask(__name__)
 
+#Clients may gzip their uploads; inflate them before Flask sees the body
+app.wsgi_app = GunzipRequestMiddleware(app.wsgi_app)
+
+#Open /stream clients each process serves at once. Every one holds a
+#request thread for as long as it stays connected, so keep this well
+#under API_THREADS (serve.py) or dashboards starve /remote-data ingest;
+#clients past the cap get a 503 and retry
+MAX_STREAMS = int(os.getenv("API_MAX_STREAMS", 4))
+
+#Pushes changed /live entries to every open /stream
+live_events = Broadcaster(max_subscribers=MAX_STREAMS)
+
+#Seconds between keep-alive comments on an idle /stream
+STREAM_HEARTBEAT = 15
+
+#Seconds a refused /stream client is told to wait before reconnecting
+STREAM_RETRY_AFTER = 5
+
+#Seconds between checks for readings stored by other processes
+LIVE_FOLLOW_INTERVAL = float(os.getenv("LIVE_FOLLOW_INTERVAL", 1.0))
+
+def publish_live(pis):
+    """Send the updated /live entries of pis to /stream clients."""
+    if pis and len(live_events):
+        live_events.publish(live_cache.entries(pis))
+
+def on_insert(readings):
+    """Insert listener: keep the /live index current and push what changed."""
+    publish_live(live_cache.update(readings))
+
+add_insert_listener(on_insert)
+
+def start_background_tasks():
+    """
+    Threads every serving process runs beside the app: a follower that
+    picks up readings other processes store, and retention (enforced by
+    one process at a time). Returns a function that stops them.
+    """
+    follower = live_cache.Follower(LIVE_FOLLOW_INTERVAL, on_change=publish_live)
+    retention = RetentionWorker(lock_path=f"{sensor_db.DB_PATH}.retention.lock")
+    follower.start()
+    retention.start()
+
+    def stop():
+        follower.stop()
+        retention.stop()
+        sensor_db.close_connection()
+
+    return stop
+
+#Response body sizes for the routes dashboards poll
+RESPONSE_BYTES = metrics.histogram(
+    "http_response_bytes", "Size of response bodies", ["route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216),
+)
+_SIZED_ROUTES = {"get_live": RESPONSE_BYTES.labels("/live"),
+                 "get_history": RESPONSE_BYTES.labels("/history")}
+
+#Seconds without a reading before a Pi counts as offline. Pis reporting by
+#exception (DEADBAND=1, read from the shared environment) can stay quiet
+#for a whole heartbeat while nothing changes, so the limit is that plus
+#a margin; OFFLINE_AFTER overrides it
+OFFLINE_MARGIN = 30
+
+def offline_after(deadband):
+    return (deadband.heartbeat if deadband.enabled else 0) + OFFLINE_MARGIN
+
+OFFLINE_AFTER = float(os.getenv("OFFLINE_AFTER", offline_after(Deadband.from_env())))
+
+LAST_SEEN = metrics.gauge("sensor_last_seen_seconds", "Seconds since each Pi's newest reading", ["pi_id"])
+metrics.gauge(
+    "sensor_offline_after_seconds", "sensor_last_seen_seconds beyond which a Pi counts as offline"
+).set(OFFLINE_AFTER)
+
+def _collect_last_seen():
+    now = time.time()
+    LAST_SEEN.clear()
+    for pi, ts in live_cache.last_seen().items():
+        LAST_SEEN.labels(pi).set(now - ts)
+
+metrics.add_collector(_collect_last_seen)
+
+def _counted(chunks, histogram):
+    #Our JSON is ASCII-only, so characters are bytes
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        histogram.observe(size)
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+@app.after_request
+def record_response_size(response):
+    histogram = _SIZED_ROUTES.get(request.endpoint)
+    if histogram is not None and response.status_code == 200:
+        if response.is_streamed:
+            response.response = _counted(response.response, histogram)
+        else:
+            histogram.observe(response.calculate_content_length() or 0)
+    return response
+
+#Largest number of readings accepted in one /remote-data/batch request
+MAX_BATCH_SIZE = 5000
+
+#Raw rows /history returns by default, and the most one request may ask for
+HISTORY_LIMIT = 10000
+HISTORY_MAX_LIMIT = 1000000
+
+#Filled history: default points per series, and the finest step allowed
+HISTORY_FILL_POINTS = 1000
+HISTORY_FILL_MIN_STEP = 10
+
+#/history encodings, by ?format= name
+HISTORY_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "columnar": COLUMNAR_MIMETYPE,
+    "binary": BINARY_MIMETYPE,
+}
+_FORMAT_BY_MIMETYPE = {mimetype: name for name, mimetype in HISTORY_FORMATS.items()}
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_duration(text):
+    """Seconds in a window like "600", "10m", "1h" or "7d"."""
+    text = text.strip().lower()
+    unit = _DURATION_UNITS.get(text[-1:])
+    number = text[:-1] if unit else text
+    seconds = int(float(number) * (unit or 1))
+    if seconds <= 0:
+        raise ValueError(f"window must be positive: {text}")
+    return seconds
+
 def get_host_ip():
 	s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 	try:
@@ -18,10 +168,52 @@ HOST_IP = get_host_ip()
 @app.route("/live", methods=["GET"])
 def get_live():
 	try:
-		return jsonify(get_latest_per_pi()), 200
+		#Served from memory, O(number of Pis)
+		return jsonify(live_cache.snapshot()), 200
 	except Exception as e:
 		return jsonify({"error": str(e)}), 500
 
+@app.route("/config", methods=["GET"])
+def get_config():
+	"""Settings the dashboard needs to interpret /live."""
+	return jsonify({"offline_after": OFFLINE_AFTER}), 200
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+	"""Prometheus text format (values are for the process that answers)."""
+	return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+@app.route("/stream", methods=["GET"])
+def stream():
+	"""
+	Server-Sent Events: a "snapshot" event with the whole /live payload,
+	then a "live" event with the changed entries whenever readings are
+	stored. Waiting clients block on their own queue, never the database.
+	"""
+	subscription = live_events.subscribe()
+	if subscription is None:
+		response = jsonify({"error": "Too many open streams, retry later"})
+		response.status_code = 503
+		response.headers["Retry-After"] = str(STREAM_RETRY_AFTER)
+		return response
+	snapshot = live_cache.snapshot()
+
+	def events():
+		yield "retry: 5000\n\n" + _sse("snapshot", snapshot)
+		for entries in live_events.listen(subscription, STREAM_HEARTBEAT):
+			yield _sse("live", entries) if entries is not None else ": ping\n\n"
+
+	response = Response(events(), mimetype="text/event-stream")
+	#Runs when the client goes away, even before the first event
+	response.call_on_close(lambda: live_events.unsubscribe(subscription))
+	response.headers["Cache-Control"] = "no-cache"
+	#Stop reverse proxies from holding events back
+	response.headers["X-Accel-Buffering"] = "no"
+	return response
+
 @app.route("/remote-data", methods=["POST"])
 def receive_remote_data():
     """Endpoint for client Pis to send their sensor data"""
@@ -34,9 +226,39 @@ def receive_remote_data():
         if request.remote_addr == HOST_IP:
             data["pi_id"] = "host"
         
-        #Store the remote data in database
-        store_remote_data(data)
+        #Store the remote data in database; only a stored reading gets a 200
+        try:
+            store_remote_data(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         return jsonify({"status": "success"}), 200
+    except Exception as e:
+        logging.error(f"Failed to store remote data: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/remote-data/batch", methods=["POST"])
+def receive_remote_batch():
+    """Endpoint for client Pis to upload many readings in one request"""
+    try:
+        data = request.get_json()
+
+        #Accept a bare list or {"readings": [...]}
+        if isinstance(data, dict):
+            data = data.get("readings")
+        if not isinstance(data, list) or not data:
+            return jsonify({"error": "Expected a non-empty list of readings"}), 400
+        if len(data) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Batch too large (max {MAX_BATCH_SIZE} readings)"}), 413
+
+        #Anything coming from host machine becomes pi_id = "host"
+        if request.remote_addr == HOST_IP:
+            for item in data:
+                if isinstance(item, dict):
+                    item["pi_id"] = "host"
+
+        #Store all valid readings in one transaction
+        summary = store_remote_batch(data)
+        return jsonify(summary), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -44,14 +266,151 @@ def receive_remote_data():
 def serve_dashboard():
     return send_from_directory(".", "index.html")
 
+def _encode_rows(rows, ndjson, rows_per_chunk=200):
+    """
+    Encode rows as a JSON array (or NDJSON) a chunk at a time, so memory
+    stays flat no matter how many rows are streamed.
+    """
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+    try:
+        if not ndjson:
+            yield "["
+        parts = []
+        first = True
+        for row in rows:
+            if ndjson:
+                parts.append(dumps(row) + "\n")
+            else:
+                parts.append(dumps(row) if first else "," + dumps(row))
+                first = False
+            if len(parts) >= rows_per_chunk:
+                yield "".join(parts)
+                parts = []
+        yield "".join(parts)
+        if not ndjson:
+            yield "]"
+    except Exception as e:
+        #Headers are already sent; all we can do is stop and log
+        logging.error(f"History stream aborted: {e}")
+
 @app.route("/history", methods=["GET"])
 def get_history():
+    """
+    Latest raw rows, streamed. Supports:
+      ?limit=N&before=<id>   keyset pagination; pass the id of the last row
+                             of a page as before to get the next page
+      ?window=7d&resolution=auto|raw|minute|hour|day
+                             the rows (or rollup buckets) covering a window
+      ?since=<id>            only rows inserted after that id; the response's
+                             X-History-Cursor header is the cursor for the next call
+      ?window=1d&fill=previous|linear[&step=1m]
+                             raw rows resampled every step per Pi and sensor,
+                             carrying readings forward or interpolating between
+                             them; for Pis that only report changes (deadband)
+      ?format=json|ndjson|columnar|binary
+                             or the matching Accept header; see src/history_format.py
+                             for the columnar and binary layouts
+    Raw rows and buckets carry their time twice: "ts" in epoch seconds and
+    "timestamp" as ISO-8601 in the host's local time.
+    """
     try:
-        #Modified to include pi_id in query
-        data = get_recent_data(limit=10000)  #Increased limit for multiple Pis
-        return jsonify(data), 200
+        window = request.args.get("window")
+        pi_id = request.args.get("pi_id")
+        limit = request.args.get("limit", HISTORY_LIMIT, type=int)
+        before = request.args.get("before", type=int)
+        cursor = request.args.get("since", type=int)
+        fill = request.args.get("fill")
+        fmt = request.args.get("format") or _FORMAT_BY_MIMETYPE[
+            request.accept_mimetypes.best_match(_FORMAT_BY_MIMETYPE, default="application/json")
+        ]
+        if fmt not in HISTORY_FORMATS:
+            return jsonify({"error": f"Invalid format: {fmt}"}), 400
+        if not 0 < limit <= HISTORY_MAX_LIMIT:
+            return jsonify({"error": f"limit must be between 1 and {HISTORY_MAX_LIMIT}"}), 400
+
+        since = None
+        resolution = "raw"
+        if fill is not None:
+            if fill not in FILL_METHODS:
+                return jsonify({"error": f"Invalid fill: {fill}"}), 400
+            if window is None or before is not None or cursor is not None:
+                return jsonify({"error": "fill needs a window and can't be paged"}), 400
+            if request.args.get("resolution", "raw") not in ("raw", "auto"):
+                return jsonify({"error": "fill only applies to raw readings"}), 400
+        if window is not None:
+            try:
+                seconds = parse_duration(window)
+            except ValueError:
+                return jsonify({"error": f"Invalid window: {window}"}), 400
+
+            resolution = "raw" if fill else request.args.get("resolution", "auto")
+            if resolution == "auto":
+                resolution = choose_resolution(seconds)
+            if resolution != "raw" and resolution not in ROLLUPS:
+                return jsonify({"error": f"Invalid resolution: {resolution}"}), 400
+            since = int(time.time()) - seconds
+
+        if fill is not None:
+            step = request.args.get("step")
+            try:
+                step = parse_duration(step) if step else -(-seconds // HISTORY_FILL_POINTS)
+            except ValueError:
+                return jsonify({"error": f"Invalid step: {step}"}), 400
+            step = max(step, HISTORY_FILL_MIN_STEP)
+            rows = get_filled_data(since, step, fill, pi_id=pi_id)
+        elif resolution != "raw":
+            #Bucketed data is small whatever the window
+            rows = get_rollup_data(resolution, since, pi_id=pi_id)
+        elif cursor is not None:
+            #Deltas are small, so build them whole to know the next cursor up front
+            rows = get_recent_data(limit, pi_id=pi_id, since=since, after=cursor)
+        else:
+            try:
+                rows = iter_recent_data(limit=limit, pi_id=pi_id, since=since, before=before)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
+        if fmt == "columnar":
+            body = encode_columnar(rows)
+        elif fmt == "binary":
+            rows = list(rows)
+            try:
+                body = to_binary(rows)
+            except ValueError as e:
+                #Something outgrew a fixed-width field; the columnar JSON
+                #carries the same data, and the Content-Type says which it is
+                logging.warning(f"Binary history unavailable, sending columnar: {e}")
+                fmt = "columnar"
+                body = encode_columnar(rows)
+        else:
+            body = _encode_rows(rows, ndjson=fmt == "ndjson")
+        response = Response(body, mimetype=HISTORY_FORMATS[fmt])
+        response.vary.add("Accept")
+        if cursor is not None and resolution == "raw":
+            response.headers["X-History-Cursor"] = str(max((r["id"] for r in rows), default=cursor))
+        response.headers["X-History-Resolution"] = resolution
+        if fill is not None:
+            response.headers["X-History-Step"] = str(step)
+        return response, 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+#Time every route when PROFILE is set; a no-op otherwise
+profiling.instrument_app(app)
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    #Create or upgrade the schema before serving
+    init_db()
+    live_cache.warm()
+
+    #Follow other processes' writes and trim old rows in the background
+    stop_background_tasks = start_background_tasks()
+
+    #HTTP/1.1 so client sessions can keep their connection open
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
+
+    try:
+        #Development server; see serve.py for the production one
+        app.run(host="0.0.0.0", port=int(os.getenv("API_PORT", 5000)))
+    finally:
+        stop_background_tasks()
@@ -1,15 +1,43 @@
+import os
 import time
 import requests
 import json
 import socket
+import threading
+from datetime import datetime
 from src.sensors import SensorReader, read_values
-from src.thresholds import TEMP_THRESHOLD, HUMIDITY_THRESHOLD, evaluate_sensor
+from src.thresholds import evaluate_sensor
+from src.spool import Spool
+from src.http_client import make_session, post_json
+from src.deadband import Deadband
 
 class DataSender:
-    def __init__(self, host_url, pi_id, interval=10):
+    #Spooled readings the host refused, one JSON line each in the spool directory
+    REJECTED_FILE = "rejected.jsonl"
+    #Answers that refuse the batch itself, so retrying it can never succeed.
+    #Anything else (429, 408, 404, 5xx...) leaves the spool for a later try
+    REFUSED_STATUSES = (400, 413, 422)
+
+    def __init__(self, host_url, pi_id, interval=10, spool_dir=None,
+                 spool_max_bytes=50 * 1024 * 1024, batch_size=500, batches_per_second=1.0,
+                 compress=None, deadband=None):
         self.host_url = host_url
         self.pi_id = pi_id
         self.interval = interval
+
+        #One pooled keep-alive session for every upload; gzip is optional
+        self.session = make_session()
+        self.compress = os.getenv("UPLOAD_GZIP", "0") == "1" if compress is None else compress
+
+        #Readings the host hasn't acknowledged wait here until it is back
+        self.spool = Spool(spool_dir or os.getenv("SPOOL_DIR", f"spool/{pi_id}"), max_bytes=spool_max_bytes)
+        self.batch_size = batch_size
+        self.batches_per_second = batches_per_second #Drain rate limit
+        self._drainer = None
+        self.rejected = 0 #Spooled readings the host refused
+
+        #Sensors whose reading barely moved are left out of the upload
+        self.deadband = deadband or Deadband.from_env()
         
     def test_connection(self):
         try:
@@ -34,31 +62,13 @@ class DataSender:
             print(f"Connection test error: {e}")
             return False
 
-    def send_data(self, sensor_data):
+    def _post(self, path, payload, retries=0):
+        """POST to the host; its response, or None if it couldn't be reached."""
         try:
-            #Add evaluation and Pi ID to data
-            sensor_data["temp_status"] = evaluate_sensor(
-                sensor_data.get("temperature"), *TEMP_THRESHOLD
-            )
-            sensor_data["humidity_status"] = evaluate_sensor(
-                sensor_data.get("humidity"), *HUMIDITY_THRESHOLD
-            )
-            sensor_data["pi_id"] = self.pi_id
-            
-            print(f"[{self.pi_id}] Sending data: {sensor_data}")
-            
-            #Send to host
-            response = requests.post(
-                f"{self.host_url}/remote-data",
-                json=sensor_data,
-                timeout=10
+            return post_json(
+                self.session, f"{self.host_url}{path}", payload,
+                retries=retries, compress=self.compress
             )
-            
-            if response.status_code == 200:
-                print(f"[{self.pi_id}] Data sent successfully")
-            else:
-                print(f"[{self.pi_id}] Failed to send data: {response.status_code}")
-                
         except requests.exceptions.ConnectTimeout:
             print(f"[{self.pi_id}] Connection timeout - host not reachable")
         except requests.exceptions.ConnectionError:
@@ -67,6 +77,110 @@ class DataSender:
             print(f"[{self.pi_id}] Network error: {e}")
         except Exception as e:
             print(f"[{self.pi_id}] Error sending data: {e}")
+        return None
+
+    def _rejected_items(self, records, response):
+        """(record, error) for each reading of a batch the host refused."""
+        if response.status_code in self.REFUSED_STATUSES:
+            #The host will never accept this batch; don't retry it forever
+            return [(record, f"HTTP {response.status_code}") for record in records]
+        try:
+            errors = response.json().get("errors") or []
+            return [(records[e["index"]], e.get("error")) for e in errors]
+        except (ValueError, AttributeError, KeyError, IndexError, TypeError):
+            #Nothing itemised to go on: everything the host took is delivered
+            return []
+
+    def _keep_rejected(self, rejected):
+        #Refused readings are set aside, not retried: the host would refuse
+        #them again. One JSON line each, beside the spool
+        path = os.path.join(self.spool.directory, self.REJECTED_FILE)
+        with open(path, "a") as f:
+            for record, error in rejected:
+                f.write(json.dumps({"record": record, "error": error}) + "\n")
+        self.rejected += len(rejected)
+        print(f"[{self.pi_id}] Host rejected {len(rejected)} spooled reading(s), kept in {path}: {rejected[0][1]}")
+
+    def send_data(self, sensor_data):
+        #Add evaluation and Pi ID to data
+        #Limits come from this Pi's profile, reloaded when the file changes
+        sensor_data["temp_status"] = evaluate_sensor(
+            sensor_data.get("temperature"), sensor="temperature", pi_id=self.pi_id
+        )
+        sensor_data["humidity_status"] = evaluate_sensor(
+            sensor_data.get("humidity"), sensor="humidity", pi_id=self.pi_id
+        )
+        sensor_data["pi_id"] = self.pi_id
+
+        for sensor, status_key in (("temperature", "temp_status"), ("humidity", "humidity_status")):
+            if sensor in sensor_data and not self.deadband.check(
+                sensor, sensor_data[sensor], sensor_data[status_key]
+            ):
+                for key in (sensor, status_key, f"{sensor}_min", f"{sensor}_max"):
+                    sensor_data.pop(key, None)
+        if "temperature" not in sensor_data and "humidity" not in sensor_data:
+            print(f"[{self.pi_id}] No change beyond the deadband, not sending")
+            return
+
+        #Stamp it here so spooled readings keep their real time
+        sensor_data.setdefault("timestamp", datetime.now().astimezone().isoformat())
+        
+        print(f"[{self.pi_id}] Sending data: {sensor_data}")
+        
+        #Keep order: while a backlog exists, new readings queue behind it.
+        #No retries here: a failed reading is spooled and retried by the drainer
+        if self.spool.is_empty():
+            response = self._post("/remote-data", sensor_data)
+            if response is not None and response.status_code == 200:
+                print(f"[{self.pi_id}] Data sent successfully")
+                return
+            if response is not None:
+                print(f"[{self.pi_id}] Failed to send data: {response.status_code}")
+
+        self.spool.append(sensor_data)
+        self.start_draining()
+
+    def start_draining(self):
+        """Upload the spool in the background unless that is already happening."""
+        if self._drainer is not None and self._drainer.is_alive():
+            return
+        self._drainer = threading.Thread(target=self.drain_spool, daemon=True)
+        self._drainer.start()
+
+    def drain_spool(self):
+        """
+        Send spooled readings in large batches, at most batches_per_second,
+        until the spool is empty or the host stops taking them. Readings
+        the host refuses (the whole batch with one of REFUSED_STATUSES, or
+        items listed in its errors) are kept in REJECTED_FILE rather than
+        retried.
+        Returns the number of readings delivered.
+        """
+        sent = 0
+        while True:
+            records, position = self.spool.read_batch(self.batch_size)
+            if not records:
+                break
+
+            started = time.monotonic()
+            response = self._post("/remote-data/batch", records, retries=3)
+            if response is None:
+                break
+            if response.status_code != 200 and response.status_code not in self.REFUSED_STATUSES:
+                print(f"[{self.pi_id}] Failed to send data: {response.status_code}")
+                break
+            rejected = self._rejected_items(records, response)
+            if rejected:
+                self._keep_rejected(rejected)
+            self.spool.ack(position)
+            sent += len(records) - len(rejected)
+
+            #Rate limit so recovery doesn't flood the host
+            time.sleep(max(0.0, 1.0 / self.batches_per_second - (time.monotonic() - started)))
+
+        if sent:
+            print(f"[{self.pi_id}] Delivered {sent} spooled readings")
+        return sent
 
 def main():
     HOST_URL = "http://192.168.86.183:5000"  #Host Pi's IP address
@@ -79,7 +193,9 @@ def main():
     sender = DataSender(HOST_URL, PI_ID)
     
     #Create sensor reader that sends data to host
-    reader = SensorReader(interval=10, callback=sender.send_data)
+    reader = SensorReader(
+        interval=10, callback=sender.send_data, samples=int(os.getenv("SENSOR_SAMPLES", 1))
+    )
     reader.start()
     
     try:
@@ -89,6 +205,7 @@ def main():
         print(f"\n[{PI_ID}] Stopping...")
         reader.stop()
         reader.join()
+        sender.spool.close()
         print(f"[{PI_ID}] Shutdown complete.")
 
 if __name__ == "__main__":
@@ -1,8 +1,17 @@
+import os
 import subprocess
 import time
 import signal
 import sys
 
+#"dev" runs Flask's development server (api.py), "production" runs
+#gunicorn (serve.py)
+API_SERVER = os.getenv("API_SERVER", "dev")
+API_SCRIPTS = {"dev": "api.py", "production": "serve.py"}
+
+#Seconds to let processes shut down gracefully before killing them
+STOP_TIMEOUT = float(os.getenv("STOP_TIMEOUT", 20))
+
 #Keep track of processes
 processes = []
 
@@ -19,7 +28,9 @@ def stop_processes():
         except Exception:
             pass
     #Give them time to close
-    time.sleep(2)
+    deadline = time.monotonic() + STOP_TIMEOUT
+    while time.monotonic() < deadline and any(p.poll() is None for p in processes):
+        time.sleep(0.2)
     for p in processes:
         if p.poll() is None:
             p.kill()
@@ -27,8 +38,10 @@ def stop_processes():
 
 def main():
     try:
-        #Start api.py
-        start_process("api.py")
+        #Start the API server
+        if API_SERVER not in API_SCRIPTS:
+            raise SystemExit(f"API_SERVER must be one of {', '.join(API_SCRIPTS)}, not {API_SERVER!r}")
+        start_process(API_SCRIPTS[API_SERVER])
         
         #Start main.py
         start_process("main.py")
@@ -1,13 +1,18 @@
 # main.py
 
+import os
 import time
+import signal
 import socket
-import requests
 from src.sensors import SensorReader
-from src.thresholds import process_sensor_reading
+from src.thresholds import evaluate_sensor_reading
 from src import shared_state
 from src.GPIO_environment_control import apply_environment_control, shutdown_devices
-from src.sensor_db import init_db
+from src.sensor_db import init_db, store_results
+from src.write_behind import WriteBehindQueue
+from src.http_client import make_session, post_json
+from src.deadband import Deadband
+from src import metrics, profiling
 from datetime import datetime
 
 try:
@@ -22,6 +27,14 @@ except ImportError:
 # ----------------------------
 SERVER_URL = "http://192.168.1.78:5000/remote-data"  # Replace with Flask server IP
 
+# Background queues for DB writes and uploads, so the sensor thread never waits
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", 1000))
+WRITE_QUEUE_OVERFLOW = os.getenv("WRITE_QUEUE_OVERFLOW", "drop_oldest")  # block | drop_oldest | drop_newest
+SHUTDOWN_FLUSH_TIMEOUT = 15  # seconds to wait for queued work on exit
+UPLOAD_GZIP = os.getenv("UPLOAD_GZIP", "0") == "1"  # gzip request bodies (host inflates them)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9101))  # /metrics for this process; 0 disables
+SENSOR_SAMPLES = int(os.getenv("SENSOR_SAMPLES", 1))  # reads per interval, filtered into one report
+
 def get_pi_id():
     """
     Generates a unique Pi ID using the last octet of the LAN IP.
@@ -38,51 +51,119 @@ def get_pi_id():
     except Exception:
         return socket.gethostname()
 
-PI_ID = get_pi_id()
-print(f"[main] Pi ID set to: {PI_ID}")
+# This process's readings are the host's: store_results files them under
+# "host", and the API does the same for anything sent from the host machine.
+# Status evaluation and GPIO limits use that same id, so the threshold
+# profile applied is the one rescore and /history see
+PI_ID = "host"
+print(f"[main] Pi ID set to: {PI_ID} (LAN id {get_pi_id()})")
 
 # ----------------------------
 # Helper functions
 # ----------------------------
-def send_to_server(result):
+def _server_payload(result):
     payload = result.copy()
     payload["pi_id"] = PI_ID
     
     ts = payload.get("timestamp")
     if isinstance(ts, datetime):
         payload["timestamp"] = ts.isoformat()
+    return payload
+
+# One pooled keep-alive connection for all uploads
+_session = make_session()
+
+@profiling.stage("send_to_server")
+def send_to_server(result):
+    payload = _server_payload(result)
     
     try:
-        resp = requests.post(SERVER_URL, json=payload, timeout=5)
+        resp = post_json(_session, SERVER_URL, payload, timeout=5, compress=UPLOAD_GZIP)
         resp.raise_for_status()
     except Exception as e:
         print(f"[WARN] Failed to send data to server: {e}")
 
+@profiling.stage("send_batch_to_server")
+def send_batch_to_server(results):
+    payload = [_server_payload(r) for r in results]
+
+    try:
+        resp = post_json(_session, f"{SERVER_URL}/batch", payload, timeout=5, compress=UPLOAD_GZIP)
+        resp.raise_for_status()
+    except Exception as e:
+        print(f"[WARN] Failed to send {len(payload)} readings to server: {e}")
+
+@profiling.stage("persist_results")
+def persist_results(results):
+    # One transaction for everything the writer picked up
+    store_results([dict(r, pi_id=PI_ID) for r in results])
+
+def upload_results(results):
+    if len(results) == 1:
+        send_to_server(results[0])
+    else:
+        send_batch_to_server(results)
+
+db_queue = WriteBehindQueue(
+    persist_results, maxsize=WRITE_QUEUE_SIZE, overflow=WRITE_QUEUE_OVERFLOW, name="db-writer"
+)
+upload_queue = WriteBehindQueue(
+    upload_results, maxsize=WRITE_QUEUE_SIZE, overflow=WRITE_QUEUE_OVERFLOW, name="uploader"
+)
+
+# Queue health, read at scrape time
+_queue_items = metrics.gauge("write_queue_items", "Items waiting in a write-behind queue", ["queue"])
+_queue_dropped = metrics.counter("write_queue_dropped_total", "Items dropped on queue overflow", ["queue"])
+_queue_failed = metrics.counter("write_queue_failed_total", "Items whose handler call raised", ["queue"])
+for _q in (db_queue, upload_queue):
+    _queue_items.labels(_q.name).set_function(_q.__len__)
+    _queue_dropped.labels(_q.name).set_function(lambda q=_q: q.dropped)
+    _queue_failed.labels(_q.name).set_function(lambda q=_q: q.failed)
+
+#Readings that barely moved are neither stored nor uploaded (DEADBAND=1)
+deadband = Deadband.from_env()
+
+#One reading's trip through the pipeline; sampled in PROFILE=cprofile mode
+@profiling.stage("handle_sensor_data", root=True)
 def handle_sensor_data(sensor_data):
     shared_state.latest_data = sensor_data
-    results = process_sensor_reading(sensor_data)
+    results = evaluate_sensor_reading(sensor_data, PI_ID)
 
-    control_actions = apply_environment_control(sensor_data)
+    control_actions = apply_environment_control(sensor_data, PI_ID)
     print("[GPIO CONTROL]", control_actions)
 
     if USE_LIGHTS:
         lights.update_display(sensor_data)
 
+    # Persistence and upload happen on the queue workers
     for r in results:
         print(f"{r['timestamp']} | {r['sensor']}: {r['value']} -> {r['status']}")
-        send_to_server(r)
+        if not deadband.check(r["sensor"], r["value"], r["status"]):
+            continue
+        db_queue.put(r)
+        upload_queue.put(r)
 
 # ----------------------------
 # Main
 # ----------------------------
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
 def main():
+    # host.py stops us with SIGTERM; shut down the same way as Ctrl+C
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+
     init_db()
+    if METRICS_PORT:
+        metrics.start_http_server(METRICS_PORT)
+    db_queue.start()
+    upload_queue.start()
     print("[main] Starting SensorReader")
 
     if USE_LIGHTS:
         lights.init_joystick()
 
-    reader = SensorReader(interval=10, callback=handle_sensor_data)
+    reader = SensorReader(interval=10, callback=handle_sensor_data, samples=SENSOR_SAMPLES)
     reader.start()
 
     try:
@@ -93,6 +174,13 @@ def main():
         reader.stop()
         reader.join()
 
+        # Write out and upload whatever is still queued
+        for q in (db_queue, upload_queue):
+            if not q.stop(timeout=SHUTDOWN_FLUSH_TIMEOUT):
+                print(f"[main] {q.name}: gave up with {len(q)} item(s) unflushed")
+            if q.dropped:
+                print(f"[main] {q.name}: dropped {q.dropped} item(s) on overflow")
+
         if USE_LIGHTS:
             lights.clear()
 
@@ -0,0 +1,76 @@
+import os
+import logging
+import api
+from src import sensor_db
+
+#Production server for api.py: gunicorn with threaded workers, set up
+#from the environment. host.py runs this when API_SERVER=production.
+#  SIGHUP  - start fresh workers, then retire the old ones gracefully
+#  SIGTERM - stop accepting, let requests finish (API_GRACEFUL_TIMEOUT)
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+def load_options():
+    """gunicorn settings from API_* environment variables."""
+    return {
+        "bind": os.getenv("API_BIND", "0.0.0.0:5000"),
+        #Processes; each has its own live cache and SQLite connections
+        "workers": int(os.getenv("API_WORKERS", 2)),
+        #Requests each process serves at once. Open /stream clients hold a
+        #thread each, up to API_MAX_STREAMS (api.py); the rest serve ingest
+        "threads": int(os.getenv("API_THREADS", 16)),
+        "worker_class": "gthread",
+        #A worker silent for this long is killed and replaced
+        "timeout": int(os.getenv("API_TIMEOUT", 30)),
+        "graceful_timeout": int(os.getenv("API_GRACEFUL_TIMEOUT", 15)),
+        "keepalive": int(os.getenv("API_KEEPALIVE", 5)),
+        #Recycle workers now and then so slow leaks can't build up
+        "max_requests": int(os.getenv("API_MAX_REQUESTS", 0)),
+        "max_requests_jitter": int(os.getenv("API_MAX_REQUESTS_JITTER", 0)),
+        "accesslog": os.getenv("API_ACCESS_LOG") or None,
+        "on_starting": on_starting,
+        "post_worker_init": post_worker_init,
+        "worker_exit": worker_exit,
+    }
+
+def on_starting(server):
+    #Migrate once in the master, before any worker exists, and drop the
+    #connection so nothing SQLite is open across fork()
+    api.init_db()
+    sensor_db.close_connection()
+
+def post_worker_init(worker):
+    api.live_cache.warm()
+    worker.stop_background_tasks = api.start_background_tasks()
+    logging.info(f"API worker {worker.pid} ready")
+
+def worker_exit(server, worker):
+    #Runs in the worker as it exits, after in-flight requests finished
+    stop = getattr(worker, "stop_background_tasks", None)
+    if stop is not None:
+        stop()
+
+if BaseApplication is not None:
+    class APIServer(BaseApplication):
+        def __init__(self, app, options):
+            self.application = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+def main():
+    if BaseApplication is None:
+        raise SystemExit("serve.py needs gunicorn: pip install -r requirements.txt")
+    APIServer(api.app, load_options()).run()
+
+if __name__ == "__main__":
+    main()
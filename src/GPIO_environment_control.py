@@ -1,5 +1,12 @@
-from gpiozero import OutputDevice
-from src.thresholds import TEMP_THRESHOLD, HUMIDITY_THRESHOLD, evaluate_sensor
+import os
+from functools import partial
+from src.thresholds import PROFILES, evaluate_sensor
+from src.actuators import Actuator
+from src import hardware, metrics, profiling
+
+ACTIONS = metrics.counter("gpio_actions_total", "Control decisions applied", ["control", "action"])
+SWITCHES = metrics.counter("gpio_switches_total", "Relay on/off transitions", ["device"])
+STATE = metrics.gauge("gpio_device_on", "1 while a relay is on", ["device"])
 
 # -------------------------------
 # GPIO Pin Assignments (BCM Mode)
@@ -12,58 +19,123 @@ FAN_PIN = 13
 # -------------------------------
 # Devices (GPIO Controlled)
 # -------------------------------
-humidifier = OutputDevice(HUMIDIFIER_PIN, active_high=True, initial_value=False)
-dehumidifier = OutputDevice(DEHUMIDIFIER_PIN, active_high=True, initial_value=False)
-heater = OutputDevice(HEATER_PIN, active_high=True, initial_value=False)
-fan = OutputDevice(FAN_PIN, active_high=True, initial_value=False)
+#Pins are claimed on the first write to each device (see src/hardware.py);
+#humidifier, dehumidifier, heater and fan are still module attributes
+DEVICE_PINS = {
+    "humidifier": HUMIDIFIER_PIN,
+    "dehumidifier": DEHUMIDIFIER_PIN,
+    "heater": HEATER_PIN,
+    "fan": FAN_PIN,
+}
+
+def _device(name):
+    return hardware.output_device(DEVICE_PINS[name])
+
+def __getattr__(name):
+    if name in DEVICE_PINS:
+        return _device(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# -------------------------------
+# Actuators (state cache + dwell)
+# -------------------------------
+#A running device stays on until the reading is this far back inside
+#the limits, instead of stopping the moment it crosses them
+HYSTERESIS = {
+    "temperature": float(os.getenv("TEMP_HYSTERESIS", 0.5)),
+    "humidity": float(os.getenv("HUMIDITY_HYSTERESIS", 2.0)),
+}
+#Shortest time (seconds) a relay stays on, or off, once switched
+MIN_ON = float(os.getenv("ACTUATOR_MIN_ON", 60))
+MIN_OFF = float(os.getenv("ACTUATOR_MIN_OFF", 60))
+
+DEVICE_NAMES = tuple(DEVICE_PINS)
+
+def make_actuators(min_on=MIN_ON, min_off=MIN_OFF):
+    """An Actuator for each device, by name."""
+    return {
+        #A device set on this module (tests) is used as is
+        name: Actuator(name, globals().get(name), min_on, min_off, open_device=partial(_device, name))
+        for name in DEVICE_NAMES
+    }
+
+actuators = make_actuators()
+
+def switch_counts():
+    """On/off transitions made by each device since start."""
+    return {name: a.switches for name, a in actuators.items()}
+
+for _name in DEVICE_NAMES:
+    SWITCHES.labels(_name).set_function(lambda name=_name: actuators[name].switches)
+    STATE.labels(_name).set_function(lambda name=_name: int(bool(actuators[name].state)))
 
 # -------------------------------
 # Control Logic
 # -------------------------------
-def control_humidity(hum_value):
-    status = evaluate_sensor(hum_value, *HUMIDITY_THRESHOLD)
-
-    if status == "INVALID":
-        heater.off()
-        fan.off()
-        return "INVALID"
-    elif status == "LOW":
-        humidifier.on()
-        dehumidifier.off()
-        return "HUMIDIFYING"
+def _with_hysteresis(status, value, sensor, pi_id, raising, lowering):
+    #Only a STABLE reading is overridden: a device that is running keeps
+    #running until the value is clear of the band
+    band = HYSTERESIS[sensor]
+    if status != "STABLE" or value is None or band <= 0:
+        return status
+    low, high = PROFILES.limits(sensor, pi_id)
+    if actuators[raising].state and value < low + band:
+        return "LOW"
+    if actuators[lowering].state and value > high - band:
+        return "HIGH"
+    return status
+
+def _switch(on_name, off_name):
+    #The opposing relay only goes on once its counterpart is really off;
+    #while the counterpart's minimum on time runs, both hold as they are
+    actuators[off_name].off()
+    if not actuators[off_name].state:
+        actuators[on_name].on()
+
+def _running(raising, lowering, raise_action, lower_action, idle_action):
+    #The action the relays are actually carrying out, which lags the
+    #decision while a minimum on/off time holds a relay
+    if actuators[raising].state:
+        return raise_action
+    if actuators[lowering].state:
+        return lower_action
+    return idle_action
+
+def control_humidity(hum_value, pi_id=None):
+    status = evaluate_sensor(hum_value, sensor="humidity", pi_id=pi_id)
+    status = _with_hysteresis(status, hum_value, "humidity", pi_id, "humidifier", "dehumidifier")
+
+    if status == "LOW":
+        _switch("humidifier", "dehumidifier")
     elif status == "HIGH":
-        humidifier.off()
-        dehumidifier.on()
-        return "DEHUMIDIFYING"
+        _switch("dehumidifier", "humidifier")
     else:
-        humidifier.off()
-        dehumidifier.off()
-        return "STABLE"
-
-
-def control_temperature(temp_value):
-    status = evaluate_sensor(temp_value, *TEMP_THRESHOLD)
-    
-    if status == "INVALID":
-        heater.off()
-        fan.off()
-        return "INVALID"
-    elif status == "LOW":
-        heater.on()
-        fan.off()
-        return "HEATING"
+        actuators["humidifier"].off()
+        actuators["dehumidifier"].off()
+    idle = "INVALID" if status == "INVALID" else "STABLE"
+    return _running("humidifier", "dehumidifier", "HUMIDIFYING", "DEHUMIDIFYING", idle)
+
+
+def control_temperature(temp_value, pi_id=None):
+    status = evaluate_sensor(temp_value, sensor="temperature", pi_id=pi_id)
+    status = _with_hysteresis(status, temp_value, "temperature", pi_id, "heater", "fan")
+
+    if status == "LOW":
+        _switch("heater", "fan")
     elif status == "HIGH":
-        fan.on()
-        heater.off()
-        return "COOLING"
+        _switch("fan", "heater")
     else:
-        fan.off()
-        heater.off()
-        return "STABLE"
+        actuators["fan"].off()
+        actuators["heater"].off()
+    idle = "INVALID" if status == "INVALID" else "STABLE"
+    return _running("heater", "fan", "HEATING", "COOLING", idle)
 
-def apply_environment_control(sensor_data):
-    t_action = control_temperature(sensor_data.get("temperature"))
-    h_action = control_humidity(sensor_data.get("humidity"))
+@profiling.stage("apply_environment_control")
+def apply_environment_control(sensor_data, pi_id=None):
+    t_action = control_temperature(sensor_data.get("temperature"), pi_id)
+    h_action = control_humidity(sensor_data.get("humidity"), pi_id)
+    ACTIONS.labels("temperature", t_action).inc()
+    ACTIONS.labels("humidity", h_action).inc()
 
     return {
         "temperature_action": t_action,
@@ -71,7 +143,8 @@ def apply_environment_control(sensor_data):
     }
 
 def shutdown_devices():
-    heater.off()
-    fan.off()
-    humidifier.off()
-    dehumidifier.off()
+    #Skips the minimum on time: everything goes off now. Devices never
+    #written are still off from when they were opened (or never were)
+    for a in actuators.values():
+        if a.device is not None:
+            a.off(force=True)
@@ -0,0 +1,56 @@
+import time
+
+class Actuator:
+    """
+    Remembers what a relay was last set to, so GPIO is only written on a
+    real change, and keeps it in each state for a minimum time so a
+    reading hovering on a threshold can't cycle it every few seconds.
+    """
+
+    def __init__(self, name, device=None, min_on=0.0, min_off=0.0, clock=time.monotonic, open_device=None):
+        self.name = name
+        #Without a device, open_device() supplies it at the first write
+        self.device = device
+        self.open_device = open_device
+        self.min_on = min_on
+        self.min_off = min_off
+        self.clock = clock
+        #None until the first write, which is always made
+        self.state = None
+        self.changed_at = float("-inf")
+        self.switches = 0 #on/off transitions made
+        self.held = 0 #requested changes delayed by the minimum times
+
+    def set(self, on, force=False):
+        """
+        Ask for the device on or off. Returns True if GPIO was written;
+        a change asked for too soon after the last one is skipped (the
+        caller asks again next reading) unless force is given.
+        """
+        on = bool(on)
+        if on == self.state:
+            return False
+        now = self.clock()
+        if not force and self.state is not None:
+            dwell = self.min_on if self.state else self.min_off
+            if now - self.changed_at < dwell:
+                self.held += 1
+                return False
+
+        if self.device is None:
+            self.device = self.open_device()
+        if on:
+            self.device.on()
+        else:
+            self.device.off()
+        if self.state is not None:
+            self.switches += 1
+        self.state = on
+        self.changed_at = now
+        return True
+
+    def on(self, force=False):
+        return self.set(True, force)
+
+    def off(self, force=False):
+        return self.set(False, force)
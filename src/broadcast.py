@@ -0,0 +1,61 @@
+import queue
+import threading
+
+#Fan-out of small events from one producer to many subscribers. Each
+#subscriber gets its own bounded queue; publishing never blocks, and a
+#subscriber that falls behind loses its oldest events rather than
+#slowing the producer down. With max_subscribers set, subscribe refuses
+#new subscribers (returns None) once that many are listening.
+
+class Broadcaster:
+    def __init__(self, queue_size=100, max_subscribers=None):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.dropped = 0
+        self.refused = 0
+
+    def subscribe(self):
+        """New queue that receives every event published from now on, or None if full."""
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                self.refused += 1
+                return None
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            while True:
+                try:
+                    q.put_nowait(event)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def listen(self, q, heartbeat=15.0):
+        """
+        Events arriving on a subscribed queue, yielding None whenever
+        heartbeat seconds pass without one.
+        """
+        while True:
+            try:
+                yield q.get(timeout=heartbeat)
+            except queue.Empty:
+                yield None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._subscribers)
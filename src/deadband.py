@@ -0,0 +1,66 @@
+import os
+import time
+from src import metrics
+
+#Report-by-exception for readings sent upstream. A sensor's reading is
+#forwarded only if it moved more than that sensor's delta from the last
+#one forwarded, its status changed, or HEARTBEAT seconds passed since
+#the last one went out. Off unless DEADBAND=1:
+#  DEADBAND_TEMPERATURE  delta in degrees C (default 0.2)
+#  DEADBAND_HUMIDITY     delta in %RH (default 1.0)
+#  DEADBAND_HEARTBEAT    seconds between forced reports (default 300)
+#The host's /history?fill=previous|linear turns the sparse rows back
+#into a continuous series, and with DEADBAND=1 in its environment it
+#waits a heartbeat (plus a margin) before showing a quiet Pi offline.
+
+DEFAULT_DELTAS = {
+    "temperature": 0.2,
+    "humidity": 1.0,
+}
+DEFAULT_HEARTBEAT = 300.0
+
+SUPPRESSED = metrics.counter("deadband_suppressed_total", "Readings held back inside the deadband", ["sensor"])
+
+class Deadband:
+    def __init__(self, deltas=None, heartbeat=DEFAULT_HEARTBEAT, enabled=True, clock=time.monotonic):
+        self.deltas = dict(DEFAULT_DELTAS if deltas is None else deltas)
+        self.heartbeat = heartbeat
+        self.enabled = enabled
+        self.clock = clock
+        #sensor -> (value, status, when) of the last reading forwarded
+        self._sent = {}
+        self.suppressed = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            deltas={
+                sensor: float(os.getenv(f"DEADBAND_{sensor.upper()}", delta))
+                for sensor, delta in DEFAULT_DELTAS.items()
+            },
+            heartbeat=float(os.getenv("DEADBAND_HEARTBEAT", DEFAULT_HEARTBEAT)),
+            enabled=os.getenv("DEADBAND", "0") == "1",
+        )
+
+    def check(self, sensor, value, status):
+        """True if this reading should be forwarded (and remember it if so)."""
+        if not self.enabled:
+            return True
+        now = self.clock()
+        last = self._sent.get(sensor)
+        delta = self.deltas.get(sensor)
+        if last is not None and delta is not None:
+            last_value, last_status, last_when = last
+            if status == last_status and now - last_when < self.heartbeat:
+                if (value is None and last_value is None) or (
+                    value is not None and last_value is not None and abs(value - last_value) <= delta
+                ):
+                    self.suppressed += 1
+                    SUPPRESSED.labels(sensor).inc()
+                    return False
+        self._sent[sensor] = (value, status, now)
+        return True
+
+    def reset(self):
+        """Forget what was sent, so the next reading of every sensor goes out."""
+        self._sent.clear()
@@ -0,0 +1,45 @@
+import io
+import json
+import zlib
+
+#Largest body we will inflate a gzipped request to
+MAX_DECOMPRESSED_BYTES = 16 * 1024 * 1024
+
+class GunzipRequestMiddleware:
+    """
+    WSGI middleware that inflates "Content-Encoding: gzip" request bodies
+    so the app sees plain JSON. Bodies that inflate past max_size are
+    refused to guard against zip bombs.
+    """
+
+    def __init__(self, app, max_size = MAX_DECOMPRESSED_BYTES):
+        self.app = app
+        self.max_size = max_size
+
+    def __call__(self, environ, start_response):
+        if environ.get("HTTP_CONTENT_ENCODING", "").strip().lower() != "gzip":
+            return self.app(environ, start_response)
+
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        compressed = environ["wsgi.input"].read(length) if length else environ["wsgi.input"].read()
+
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = inflater.decompress(compressed, self.max_size + 1)
+        except zlib.error:
+            return self._error(start_response, "400 Bad Request", "Invalid gzip body")
+        if len(body) > self.max_size or inflater.unconsumed_tail:
+            return self._error(start_response, "413 Request Entity Too Large", "Decompressed body too large")
+
+        environ["wsgi.input"] = io.BytesIO(body)
+        environ["CONTENT_LENGTH"] = str(len(body))
+        del environ["HTTP_CONTENT_ENCODING"]
+        return self.app(environ, start_response)
+
+    def _error(self, start_response, status, message):
+        body = json.dumps({"error": message}).encode()
+        start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(body)))])
+        return [body]
@@ -0,0 +1,49 @@
+import threading
+
+#One place that opens the Pi's hardware, and only when something first
+#uses it: importing a module that *can* drive the Sense HAT or a relay
+#no longer opens either, so the API never touches them. Tests swap in
+#gpiozero's mock pins (tests/conftest.py) and fake devices.
+#  sense_hat()       the shared SenseHat, or None without one
+#  output_device(n)  the gpiozero OutputDevice on BCM pin n (starts off)
+
+_lock = threading.Lock()
+_UNSET = object()
+_sense = _UNSET
+_outputs = {}
+
+def sense_hat():
+    """The Sense HAT every module shares, opened on first call; None if absent."""
+    global _sense
+    if _sense is _UNSET:
+        with _lock:
+            if _sense is _UNSET:
+                try:
+                    from sense_hat import SenseHat
+                    hat = SenseHat()
+                    hat.clear()
+                except (ImportError, OSError) as e:
+                    #Not on a Pi (or no HAT); callers fall back to fake data
+                    print(f"[hardware] Warning: No Sense HAT detected ({e})")
+                    hat = None
+                _sense = hat
+    return _sense
+
+def output_device(pin):
+    """The OutputDevice on a BCM pin, claimed on first call and kept."""
+    device = _outputs.get(pin)
+    if device is None:
+        with _lock:
+            device = _outputs.get(pin)
+            if device is None:
+                from gpiozero import OutputDevice
+                device = _outputs[pin] = OutputDevice(pin, active_high=True, initial_value=False)
+    return device
+
+def close():
+    """Release every GPIO pin claimed so far."""
+    with _lock:
+        devices = list(_outputs.values())
+        _outputs.clear()
+    for device in devices:
+        device.close()
@@ -0,0 +1,157 @@
+import json
+import struct
+import sys
+from array import array
+
+#Compact encodings of /history rows. Both group the rows into one series
+#per (pi_id, sensor), oldest point first, and replace the repeated pi_id
+#and status strings with indexes into small dictionaries. Times come from
+#each row's epoch "ts", as sensor_db returns it.
+#
+#Columnar JSON:
+#  {"pis": [...], "statuses": [...],
+#   "series": [{"pi": 0, "sensor": "temperature",
+#               "t": [epoch, ...], "v": [value, ...], "s": [status index, ...]}]}
+#Raw rows add an "id" array; rollup rows add "min", "max" and "n" arrays.
+#
+#Binary (all little-endian):
+#  header  "SHB1", u16 pi count, u16 status count, u16 series count
+#  strings u8 length + UTF-8 bytes, for every pi then every status
+#  series u16 pi index, u8 length + UTF-8 sensor name, u32 point count,
+#          then count x u32 epoch, count x f32 value (NaN for none),
+#          count x u8 status index
+
+COLUMNAR_MIMETYPE = "application/vnd.sensor-history.columnar+json"
+BINARY_MIMETYPE = "application/vnd.sensor-history.binary"
+
+MAGIC = b"SHB1"
+_HEADER = struct.Struct("<4sHHH")
+_SERIES = struct.Struct("<H")
+_COUNT = struct.Struct("<I")
+
+def _group(rows):
+    """(pis, statuses, {(pi index, sensor): [row, ...] oldest first})."""
+    pis = {}
+    statuses = {}
+    series = {}
+    for row in rows:
+        pi = pis.setdefault(row["pi_id"], len(pis))
+        statuses.setdefault(row["status"], len(statuses))
+        series.setdefault((pi, row["sensor"]), []).append(row)
+    for points in series.values():
+        #Rows come newest first
+        points.reverse()
+    return list(pis), statuses, dict(sorted(series.items()))
+
+def to_columnar(rows):
+    pis, statuses, grouped = _group(rows)
+    series = []
+    for (pi, sensor), points in grouped.items():
+        entry = {
+            "pi": pi,
+            "sensor": sensor,
+            "t": [p["ts"] for p in points],
+            "v": [p["value"] for p in points],
+            "s": [statuses[p["status"]] for p in points],
+        }
+        if points and "id" in points[0]:
+            entry["id"] = [p["id"] for p in points]
+        if points and "count" in points[0]:
+            entry["min"] = [p["min"] for p in points]
+            entry["max"] = [p["max"] for p in points]
+            entry["n"] = [p["count"] for p in points]
+        series.append(entry)
+    return {"pis": pis, "statuses": list(statuses), "series": series}
+
+def _pack_string(text):
+    data = text.encode()
+    return bytes([len(data)]) + data
+
+def _little_endian(arr):
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+_U8_MAX = 0xFF
+_U16_MAX = 0xFFFF
+_U32_MAX = 0xFFFFFFFF
+
+def _check_binary(pis, statuses, grouped):
+    #Everything the fixed-width fields can't hold, up front, so a payload
+    #is either encoded whole or refused with ValueError
+    if len(pis) > _U16_MAX or len(grouped) > _U16_MAX:
+        raise ValueError("too many Pis or series for binary history")
+    if len(statuses) > _U8_MAX + 1:
+        raise ValueError("too many statuses for binary history")
+    for name in (*pis, *statuses, *(sensor for _, sensor in grouped)):
+        if len(name.encode()) > _U8_MAX:
+            raise ValueError(f"name too long for binary history: {name[:20]}...")
+    for points in grouped.values():
+        times = [p["ts"] for p in points]
+        if min(times) < 0 or max(times) > _U32_MAX:
+            raise ValueError("timestamp out of range for binary history")
+        if len(points) > _U32_MAX:
+            raise ValueError("too many points for binary history")
+
+def to_binary(rows):
+    """
+    Encode rows in the binary layout. Raises ValueError if anything
+    doesn't fit its field (see _check_binary); callers fall back to
+    another format.
+    """
+    pis, statuses, grouped = _group(rows)
+    _check_binary(pis, statuses, grouped)
+    parts = [_HEADER.pack(MAGIC, len(pis), len(statuses), len(grouped))]
+    parts.extend(_pack_string(name) for name in pis)
+    parts.extend(_pack_string(name) for name in statuses)
+    for (pi, sensor), points in grouped.items():
+        parts.append(_SERIES.pack(pi) + _pack_string(sensor) + _COUNT.pack(len(points)))
+        parts.append(_little_endian(array("I", (p["ts"] for p in points))))
+        parts.append(_little_endian(array("f", (
+            float("nan") if p["value"] is None else p["value"] for p in points
+        ))))
+        parts.append(bytes(statuses[p["status"]] for p in points))
+    return b"".join(parts)
+
+def from_binary(data):
+    """Decode to_binary output into the columnar layout (without ids or rollup extras)."""
+    view = memoryview(data)
+    magic, n_pis, n_statuses, n_series = _HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("not a binary history payload")
+    pos = _HEADER.size
+
+    def string():
+        nonlocal pos
+        length = view[pos]
+        text = bytes(view[pos + 1:pos + 1 + length]).decode()
+        pos += 1 + length
+        return text
+
+    def column(typecode, count):
+        nonlocal pos
+        arr = array(typecode)
+        arr.frombytes(view[pos:pos + arr.itemsize * count])
+        if sys.byteorder == "big":
+            arr.byteswap()
+        pos += arr.itemsize * count
+        return arr.tolist()
+
+    pis = [string() for _ in range(n_pis)]
+    statuses = [string() for _ in range(n_statuses)]
+    series = []
+    for _ in range(n_series):
+        (pi,) = _SERIES.unpack_from(view, pos)
+        pos += _SERIES.size
+        sensor = string()
+        (count,) = _COUNT.unpack_from(view, pos)
+        pos += _COUNT.size
+        t = column("I", count)
+        v = [None if x != x else x for x in column("f", count)]
+        s = list(view[pos:pos + count])
+        pos += count
+        series.append({"pi": pi, "sensor": sensor, "t": t, "v": v, "s": s})
+    return {"pis": pis, "statuses": statuses, "series": series}
+
+def encode_columnar(rows):
+    return json.dumps(to_columnar(rows), separators=(",", ":"))
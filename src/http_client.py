@@ -0,0 +1,49 @@
+import gzip
+import json
+import time
+import random
+import requests
+from requests.adapters import HTTPAdapter
+
+#Responses worth retrying: rate limited or the server/proxy is restarting
+RETRY_STATUSES = (429, 502, 503, 504)
+
+#Bodies smaller than this aren't worth the CPU to compress
+GZIP_MIN_BYTES = 512
+GZIP_LEVEL = 5
+
+def make_session(pool_size = 4):
+    """A pooled keep-alive session; retries are handled by post_json."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def backoff_delay(attempt, base = 0.5, cap = 10.0):
+    #"Full jitter": spreads retries so a fleet doesn't reconnect in lockstep
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def post_json(session, url, payload, timeout = (3.05, 10), retries = 3,
+              backoff = 0.5, compress = False):
+    """
+    POST payload as JSON (gzipped when compress is set and it is big
+    enough), retrying connection errors and RETRY_STATUSES with jittered
+    exponential backoff. Returns the last response, or raises the last
+    network error.
+    """
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    headers = {"Content-Type": "application/json"}
+    if compress and len(body) >= GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+
+    for attempt in range(retries + 1):
+        try:
+            response = session.post(url, data=body, headers=headers, timeout=timeout)
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == retries:
+                raise
+        time.sleep(backoff_delay(attempt, backoff))
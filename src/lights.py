@@ -1,14 +1,20 @@
-try:
-    from sense_hat import SenseHat
-    sense = SenseHat()
-    sense.clear()
-except OSError:
-    sense = None
-    print("[lights] Warning: No Sense HAT detected")
+import threading
+from src import hardware, profiling
+
+def __getattr__(name):
+    #lights.sense is the shared Sense HAT, opened on first use
+    if name == "sense":
+        return hardware.sense_hat()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _sense():
+    #A sense set on this module (tests) wins over the shared one
+    return globals().get("sense") or hardware.sense_hat()
 
 _display_mode = "temperature"
 
 def init_joystick():
+    sense = _sense()
     if sense is not None:
         sense.stick.direction_any = _joystick_event
 
@@ -100,50 +106,132 @@ _digits = {
     ]
 }
 
-def draw_digits(x, y, digit, colour):
-    pattern = _digits.get(digit)
-    if not pattern:
-        return
-    for row in range(5):
-        for col in range(3):
-            if pattern[row][col]:
-                sense.set_pixel(x+col, y+row, colour)
-            else:
-                sense.set_pixel(x+col, y+row, [0,0,0])
+# -------------------------------
+# Frames
+# -------------------------------
+#Each screen is built once as the 64 pixels set_pixels takes, so showing
+#a value is one framebuffer write instead of ~30 set_pixel calls
+_MODE_COLOURS = {
+    "temperature": (0, 0, 255),
+    "humidity": (0, 255, 0),
+}
+_OFF = (0, 0, 0)
+
+def _build_frame(mode, text):
+    colour = _MODE_COLOURS[mode]
+    frame = [_OFF] * 64
+    for x, digit in zip((0, 4), text):
+        pattern = _digits.get(digit)
+        if not pattern:
+            continue
+        for row in range(5):
+            for col in range(3):
+                if pattern[row][col]:
+                    frame[(1 + row) * 8 + x + col] = colour
+    #Mode indicator, top right
+    frame[7] = colour
+    return tuple(frame)
+
+#Every two-digit value in both modes; anything else is built on demand
+_frames = {
+    (mode, f"{n:02d}"): _build_frame(mode, f"{n:02d}")
+    for mode in _MODE_COLOURS
+    for n in range(100)
+}
+
+def _frame_key(data):
+    value = data.get(_display_mode)
+    if value is None:
+        return None
+    return (_display_mode, f"{int(round(value)):02d}"[-2:])
+
+# -------------------------------
+# Display thread
+# -------------------------------
+_ERROR = "E"
+
+class _Display(threading.Thread):
+    """
+    Draws the newest submitted reading off the caller's thread. Readings
+    that arrive while a frame is being written replace each other, and
+    a frame identical to the one on screen isn't written again.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True, name="display")
+        self._pending = None
+        self._wake = threading.Event()
+        self._running = True
+        self.shown = None
+
+    def submit(self, data):
+        self._pending = data
+        self._wake.set()
 
+    def run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if not self._running:
+                return
+            #Not cleared after reading, so a submit racing this can't be lost;
+            #redrawing the same data is skipped below anyway
+            data = self._pending
+            if data is not None:
+                try:
+                    self._render(data)
+                except Exception as e:
+                    print(f"[Display] Render failed: {e}")
 
+    @profiling.stage("render_display")
+    def _render(self, data):
+        key = _frame_key(data) or _ERROR
+        if key == self.shown:
+            return
+        sense = _sense()
+        if key is _ERROR:
+            sense.show_letter('E', text_colour = [255, 0, 0])
+        else:
+            frame = _frames.get(key)
+            if frame is None:
+                frame = _frames[key] = _build_frame(*key)
+            sense.set_pixels(frame)
+        self.shown = key
+
+    def stop(self, timeout=None):
+        self._running = False
+        self._wake.set()
+        self.join(timeout)
+
+_display = None
+_display_lock = threading.Lock()
+
+def _get_display():
+    global _display
+    with _display_lock:
+        if _display is None or not _display.is_alive():
+            _display = _Display()
+            _display.start()
+        return _display
+
+@profiling.stage("update_display")
 def update_display(data):
-    if sense is None:
+    if _sense() is None:
         if _display_mode in data and data[_display_mode] is not None:
             print(f"[Display: {_display_mode} {data[_display_mode]:.1f}]")
         else:
             print("[Display] ERR")
         return
 
-    sense.clear()
-
-    if _display_mode == "temperature":
-        value = data.get("temperature")
-        colour = [0, 0, 255]
-    else:
-        value = data.get("humidity")
-        colour = [0, 255, 0]
-
-    if value is None:
-        sense.show_letter('E', text_colour = [255, 0, 0])
-        return
-
-    num = int(round(value))
-    text = f"{num:02d}"[-2:]
-
-    draw_digits(0, 1, text[0], colour)
-    draw_digits(4, 1, text[1], colour)
-
-    if _display_mode == "temperature":
-        sense.set_pixel(7, 0, [0, 0, 255])
-    else:
-        sense.set_pixel(7, 0, [0, 255, 0])
+    #Returns at once; the display thread does the drawing
+    _get_display().submit(data)
 
 def clear():
+    global _display
+    with _display_lock:
+        display, _display = _display, None
+    if display is not None:
+        display.stop(timeout=1)
+    sense = _sense()
     if sense is not None:
         sense.clear()
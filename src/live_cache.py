@@ -0,0 +1,127 @@
+import threading
+import logging
+from src import sensor_db
+
+#In-process index of the newest reading per Pi and sensor, so /live
+#never has to query the database.
+
+_lock = threading.Lock()
+_latest = {}      #pi_id -> /live entry (replaced, never mutated, once published)
+_latest_key = {}  #(pi_id, sensor) -> (epoch, id) of the reading held
+_cursor = 0       #Newest reading id seen by warm() or the Follower
+_warmed = False
+
+def update(readings):
+    """
+    Apply stored readings (sensor_db insert listener). The same reading
+    may arrive more than once (listener and Follower); returns the Pis
+    whose entry actually changed.
+    """
+    changed = set()
+    with _lock:
+        for reading in readings:
+            if reading["sensor"] not in sensor_db.LIVE_FIELDS:
+                continue
+
+            #Backfilled batches can arrive out of order; keep the newest
+            key = (reading["pi_id"], reading["sensor"])
+            order = (reading["ts"], reading["id"])
+            if order <= _latest_key.get(key, (float("-inf"), 0)):
+                continue
+            _latest_key[key] = order
+            changed.add(reading["pi_id"])
+
+            #Copy-on-write so snapshots handed out earlier never change
+            pi = reading["pi_id"]
+            entry = {pi: dict(_latest.get(pi, {"pi_id": pi}))}
+            sensor_db.apply_latest(entry, reading)
+            _latest[pi] = entry[pi]
+    return changed
+
+def warm():
+    """Load the latest reading of every Pi from the database."""
+    global _warmed, _cursor
+    #Taken first: rows landing in between are re-read, never skipped
+    cursor = sensor_db.latest_id()
+    readings = sensor_db.get_latest_readings()
+    update(readings)
+    with _lock:
+        _cursor = max(_cursor, cursor)
+    _warmed = True
+    logging.info(f"Live cache warmed with {len(readings)} readings")
+
+def snapshot():
+    """Current /live payload, sorted by pi_id."""
+    if not _warmed:
+        warm()
+    with _lock:
+        return [_latest[pi] for pi in sorted(_latest)]
+
+def entries(pi_ids):
+    """Current /live entries for the given Pis."""
+    with _lock:
+        return [_latest[pi] for pi in sorted(pi_ids) if pi in _latest]
+
+def last_seen():
+    """Epoch of the newest reading held for each Pi."""
+    seen = {}
+    with _lock:
+        for (pi, _), (ts, _) in _latest_key.items():
+            seen[pi] = max(ts, seen.get(pi, ts))
+    return seen
+
+def catch_up(batch=1000):
+    """Apply readings stored since the last call, by any process. Returns changed Pis."""
+    global _cursor
+    if not _warmed:
+        warm()
+    changed = set()
+    while True:
+        readings = sensor_db.get_new_readings(_cursor, limit=batch)
+        if not readings:
+            break
+        changed |= update(readings)
+        with _lock:
+            _cursor = max(_cursor, readings[-1]["id"])
+        if len(readings) < batch:
+            break
+    return changed
+
+class Follower(threading.Thread):
+    """
+    Keeps this process's index current with readings other processes
+    (server workers, main.py) store. Polls PRAGMA data_version, so an
+    idle database costs one pragma per interval. on_change is called
+    with the Pis whose entry changed.
+    """
+    def __init__(self, interval=1.0, on_change=None):
+        super().__init__(daemon=True, name="live-cache-follower")
+        self.interval = interval
+        self.on_change = on_change
+        self._stop_event = threading.Event()
+
+    def run(self):
+        version = None
+        while not self._stop_event.wait(self.interval):
+            try:
+                current = sensor_db.data_version()
+                if current == version:
+                    continue
+                version = current
+                changed = catch_up()
+                if changed and self.on_change is not None:
+                    self.on_change(changed)
+            except Exception as e:
+                logging.error(f"Live cache follower failed: {e}")
+        sensor_db.close_connection()
+
+    def stop(self):
+        self._stop_event.set()
+
+def reset():
+    global _warmed, _cursor
+    with _lock:
+        _latest.clear()
+        _latest_key.clear()
+        _cursor = 0
+        _warmed = False
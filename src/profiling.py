@@ -0,0 +1,271 @@
+import argparse
+import atexit
+import collections
+import cProfile
+import functools
+import glob
+import itertools
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from src import metrics
+
+#Opt-in timing of the sensor pipeline and the API routes, for finding
+#out why a Pi misses its reading interval. Off unless PROFILE is set:
+#  PROFILE=timers    time every stage (count, total, p95, max)
+#  PROFILE=cprofile  as timers, plus a cProfile of every PROFILE_SAMPLE-th
+#                    call of a root stage, dumped to PROFILE_DIR
+#With PROFILE unset, stage() hands back the undecorated function, so
+#the pipeline runs exactly as it would without this module.
+#
+#Stage stats go to PROFILE_DIR/stages-<pid>.json now and then and at
+#exit; `python -m src.profiling summary` prints the slowest stages.
+
+MODES = ("off", "timers", "cprofile")
+
+STAGE_SECONDS = metrics.histogram("profile_stage_seconds", "Seconds spent in a profiled stage", ["stage"])
+
+#Samples kept per stage for the p95
+RECENT_SAMPLES = 1024
+#Seconds between stats file writes while running
+FLUSH_INTERVAL = 60
+
+#cProfile can only run one profile at a time in a process
+_cprofile_lock = threading.Lock()
+
+class StageStats:
+    __slots__ = ("count", "total", "max", "recent", "lock")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=RECENT_SAMPLES)
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+            self.recent.append(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            recent = sorted(self.recent)
+            count, total, longest = self.count, self.total, self.max
+        p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+        return {"count": count, "total": total, "max": longest, "p95": p95}
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    try:
+        return default if value is None else int(value)
+    except ValueError:
+        logging.warning(f"Ignoring {name}={value!r}: not an integer; using {default}")
+        return default
+
+class Profiler:
+    def __init__(self, mode="off", sample_every=100, directory="profiles", keep=20):
+        if mode not in MODES:
+            raise ValueError(f"profiling mode must be one of {MODES}, not {mode!r}")
+        self.mode = mode
+        self.sample_every = max(1, int(sample_every))
+        self.directory = directory
+        self.keep = keep
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    @classmethod
+    def from_env(cls):
+        #A diagnostics switch must never stop the service: bad settings
+        #are logged and profiling stays off (or on its defaults)
+        mode = os.getenv("PROFILE", "off").strip().lower() or "off"
+        if mode not in MODES:
+            logging.warning(f"Ignoring PROFILE={mode!r}: expected one of {', '.join(MODES)}; profiling is off")
+            mode = "off"
+        return cls(
+            mode=mode,
+            sample_every=_env_int("PROFILE_SAMPLE", 100),
+            directory=os.getenv("PROFILE_DIR", "profiles"),
+            keep=_env_int("PROFILE_KEEP", 20),
+        )
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def _stats_for(self, name):
+        with self._lock:
+            return self._stages.setdefault(name, StageStats())
+
+    def stage(self, name, root=False):
+        """
+        Decorator timing every call of the function as stage name.
+
+        Root stages are the entry points (one per reading or request);
+        only they are sampled with cProfile, and finishing one is what
+        triggers the periodic stats write.
+        """
+        def decorate(func):
+            if not self.enabled:
+                return func
+
+            stats = self._stats_for(name)
+            observe = STAGE_SECONDS.labels(name).observe
+            calls = itertools.count(1)
+            sampled = root and self.mode == "cprofile"
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                profile = None
+                if sampled and next(calls) % self.sample_every == 0 and _cprofile_lock.acquire(blocking=False):
+                    profile = cProfile.Profile()
+                start = time.perf_counter()
+                try:
+                    if profile is None:
+                        return func(*args, **kwargs)
+                    try:
+                        return profile.runcall(func, *args, **kwargs)
+                    finally:
+                        _cprofile_lock.release()
+                finally:
+                    elapsed = time.perf_counter() - start
+                    stats.add(elapsed)
+                    observe(elapsed)
+                    if profile is not None:
+                        self._dump(name, profile)
+                    elif root:
+                        self._maybe_flush()
+
+            return wrapper
+        return decorate
+
+    def instrument_app(self, app):
+        """Time every Flask view as a root stage named route:<endpoint>."""
+        if not self.enabled:
+            return app
+        for endpoint, view in list(app.view_functions.items()):
+            app.view_functions[endpoint] = self.stage(f"route:{endpoint}", root=True)(view)
+        return app
+
+    def snapshot(self):
+        with self._lock:
+            stages = dict(self._stages)
+        return {name: stats.snapshot() for name, stats in stages.items()}
+
+    def write_stats(self):
+        if not self.enabled:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"stages-{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"pid": os.getpid(), "written": time.time(), "stages": self.snapshot()}, f)
+        os.replace(tmp, path)
+        self._last_flush = time.monotonic()
+        return path
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self._flush()
+
+    def _flush(self):
+        try:
+            self.write_stats()
+        except OSError as e:
+            logging.error(f"Failed to write profiling stats: {e}")
+
+    def _dump(self, name, profile):
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+        path = os.path.join(self.directory, f"{safe}-{os.getpid()}-{time.time_ns()}.prof")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(path)
+            self._rotate()
+        except OSError as e:
+            logging.error(f"Failed to write profile {path}: {e}")
+        self._flush()
+
+    def _rotate(self):
+        dumps = sorted(glob.glob(os.path.join(self.directory, "*.prof")), key=lambda path: (_mtime(path), path))
+        for path in dumps[:max(0, len(dumps) - self.keep)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                #Another process rotated it first
+                pass
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0.0
+
+def load_stats(directory):
+    """Stage stats from every stages-*.json in directory, merged by stage."""
+    merged = {}
+    for path in glob.glob(os.path.join(directory, "stages-*.json")):
+        try:
+            with open(path) as f:
+                stages = json.load(f)["stages"]
+        except (OSError, ValueError, KeyError):
+            continue
+        for name, s in stages.items():
+            m = merged.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0, "p95": 0.0})
+            m["count"] += s["count"]
+            m["total"] += s["total"]
+            m["max"] = max(m["max"], s["max"])
+            #Percentiles can't be combined; report the worst process
+            m["p95"] = max(m["p95"], s["p95"])
+    return merged
+
+def format_summary(stages, top=15):
+    """Table of the stages with the most total time, slowest first."""
+    rows = sorted(stages.items(), key=lambda item: item[1]["total"], reverse=True)[:top]
+    if not rows:
+        return "No stage stats recorded."
+    width = max(len("stage"), *(len(name) for name, _ in rows))
+    lines = [f"{'stage':<{width}}  {'calls':>8}  {'total s':>10}  {'mean ms':>9}  {'p95 ms':>9}  {'max ms':>9}"]
+    for name, s in rows:
+        mean = s["total"] / s["count"] if s["count"] else 0.0
+        lines.append(
+            f"{name:<{width}}  {s['count']:>8}  {s['total']:>10.3f}  {mean * 1000:>9.2f}"
+            f"  {s['p95'] * 1000:>9.2f}  {s['max'] * 1000:>9.2f}"
+        )
+    return "\n".join(lines)
+
+#Process-wide profiler configured from the environment
+PROFILER = Profiler.from_env()
+
+stage = PROFILER.stage
+instrument_app = PROFILER.instrument_app
+
+if PROFILER.enabled:
+    atexit.register(PROFILER._flush)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.profiling")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summary", help="print the slowest stages and functions")
+    summary.add_argument("--dir", default=os.getenv("PROFILE_DIR", "profiles"))
+    summary.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    print(format_summary(load_stats(args.dir), args.top))
+
+    dumps = glob.glob(os.path.join(args.dir, "*.prof"))
+    if dumps:
+        print(f"\nSlowest functions across {len(dumps)} sampled profile(s):")
+        stats = pstats.Stats(*dumps)
+        #Otherwise print_stats starts by listing every dump file
+        stats.files = []
+        stats.sort_stats("cumulative").print_stats(args.top)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import logging
+import time
+import numpy as np
+from src import sensor_db
+from src.thresholds import PROFILES, STATUSES, evaluate_sensor_codes
+
+#Re-evaluate stored readings against the current thresholds, so history
+#reads the same as if they had always been in force:
+#  python -m src.rescore [--pi pi-12] [--chunk 100000] [--dry-run]
+#Readings are read in id order a chunk at a time, classified with numpy
+#against each Pi's profile and only the rows whose status changed are
+#written back, one transaction per chunk. Rollup status counts follow
+#via a trigger.
+
+#Readings per read/write round
+CHUNK = 100000
+
+def rescore(chunk=CHUNK, pi_id=None, dry_run=False, profiles=None):
+    """
+    Reclassify every stored reading (or one Pi's) and save the changes.
+    Sensors without thresholds keep their status. Returns a dict with
+    the rows scanned and changed and the seconds it took.
+    """
+    started = time.perf_counter()
+    profiles = profiles or PROFILES.current()
+    sensor_names = {i: name for name, i in sensor_db.get_lookup("sensors").items()}
+    pi_names = {i: name for name, i in sensor_db.get_lookup("pis").items()}
+    statuses = sensor_db.get_lookup("statuses")
+    #Index into STATUSES -> status_id
+    status_ids = np.array([statuses[name] for name in STATUSES], dtype=np.int64)
+    key_stride = max(sensor_names, default=0) + 1
+
+    scanned = changed = 0
+    after_id = 0
+    while True:
+        rows = sensor_db.get_stored_statuses(after_id, chunk, pi_id)
+        if not rows:
+            break
+        ids, pi_ids, sensor_ids, values, old = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        pi_ids = np.array(pi_ids, dtype=np.int64)
+        sensor_ids = np.array(sensor_ids, dtype=np.int64)
+        values = np.array(values, dtype=float)
+        old = np.array(old, dtype=np.int64)
+
+        #Limits for each distinct (pi, sensor) in the chunk, spread to rows
+        keys, inverse = np.unique(pi_ids * key_stride + sensor_ids, return_inverse=True)
+        lows = np.full(len(keys), np.nan)
+        highs = np.full(len(keys), np.nan)
+        for i, key in enumerate(keys.tolist()):
+            sensor = sensor_names.get(key % key_stride)
+            if sensor in profiles.defaults:
+                lows[i], highs[i] = profiles.limits(sensor, pi_names.get(key // key_stride))
+        lows, highs = lows[inverse], highs[inverse]
+        scored = ~np.isnan(lows)
+
+        new = old.copy()
+        new[scored] = status_ids[evaluate_sensor_codes(values[scored], lows[scored], highs[scored])]
+
+        moved = new != old
+        if not dry_run and moved.any():
+            sensor_db.update_statuses(list(zip(new[moved].tolist(), ids[moved].tolist())))
+
+        scanned += len(rows)
+        changed += int(moved.sum())
+        after_id = int(ids[-1])
+        logging.info(f"Rescored {scanned} readings, {changed} changed")
+
+    return {"scanned": scanned, "changed": changed, "seconds": time.perf_counter() - started}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-evaluate stored readings against the current thresholds")
+    parser.add_argument("--pi", help="only rescore this Pi's readings")
+    parser.add_argument("--chunk", type=int, default=CHUNK, help="readings per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="count changes without writing them")
+    args = parser.parse_args(argv)
+
+    #The status trigger arrived with schema v4
+    sensor_db.init_db()
+    result = rescore(chunk=args.chunk, pi_id=args.pi, dry_run=args.dry_run)
+    verb = "would change" if args.dry_run else "changed"
+    print(f"Rescored {result['scanned']} readings in {result['seconds']:.1f}s; {verb} {result['changed']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import os
+import time
+import threading
+import logging
+from src import sensor_db, metrics
+
+#Default days each tier is kept (None = forever); override with
+#RETENTION_RAW_DAYS, RETENTION_MINUTE_DAYS, RETENTION_HOUR_DAYS, RETENTION_DAY_DAYS
+#set to a positive number of days, or "forever"/"none" to keep everything
+DEFAULT_RETENTION_DAYS = {
+    "raw": 7,
+    "minute": 90,
+    "hour": None,
+    "day": None,
+}
+
+ROWS_DELETED = metrics.counter("retention_rows_deleted_total", "Rows removed by retention", ["tier"])
+BYTES_RECLAIMED = metrics.counter("retention_bytes_reclaimed_total", "Bytes returned to the filesystem by retention")
+LAST_RUN = metrics.gauge("retention_last_run_timestamp_seconds", "Unix time the last retention run finished")
+LAST_RUN_SECONDS = metrics.gauge("retention_last_run_duration_seconds", "Seconds the last retention run took")
+
+def load_policy():
+    """Days to keep for each tier, from the environment."""
+    policy = {}
+    for tier, default in DEFAULT_RETENTION_DAYS.items():
+        value = os.getenv(f"RETENTION_{tier.upper()}_DAYS")
+        if value is None:
+            policy[tier] = default
+        elif value.strip().lower() in ("", "none", "forever"):
+            policy[tier] = None
+        else:
+            days = float(value)
+            if days <= 0:
+                raise ValueError(f"RETENTION_{tier.upper()}_DAYS must be a positive number of days or 'forever', got {value!r}")
+            policy[tier] = days
+    return policy
+
+def enforce_retention(policy, now=None, batch_size=500, pause=0.05):
+    """
+    Delete everything older than each tier's limit and vacuum the freed
+    space. Returns rows removed per tier and bytes reclaimed, which also
+    go to the retention_* metrics.
+    """
+    now = time.time() if now is None else now
+    started = time.monotonic()
+    rows = {}
+
+    for tier, days in policy.items():
+        if days is None:
+            continue
+        cutoff = int(now - days * 86400)
+        rows[tier] = sensor_db.delete_before(tier, cutoff, batch_size=batch_size, pause=pause)
+
+    freed = sensor_db.incremental_vacuum(pause=pause) if any(rows.values()) else 0
+    seconds = time.monotonic() - started
+
+    for tier, removed in rows.items():
+        ROWS_DELETED.labels(tier).inc(removed)
+    BYTES_RECLAIMED.inc(freed)
+    LAST_RUN.set(time.time())
+    LAST_RUN_SECONDS.set(seconds)
+
+    return {
+        "rows": rows,
+        "bytes": freed,
+        "seconds": round(seconds, 3),
+    }
+
+class RetentionWorker(threading.Thread):
+    def __init__(self, interval = 3600, policy = None, lock_path = None):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.policy = policy if policy is not None else load_policy()
+        self.last_stats = None #Result of the most recent run
+        #With several server processes each runs a worker, but only the
+        #one holding this file lock enforces; another takes over if it exits
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._stop_event = threading.Event()
+
+    def _acquire(self):
+        """True once this process holds lock_path (or none is needed)."""
+        if self.lock_path is None or self._lock_file is not None:
+            return True
+        import fcntl
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    #Runs retention every interval until stopped
+    def run(self):
+        logging.info(f"Retention policy (days): {self.policy}")
+        while not self._stop_event.is_set():
+            try:
+                if self._acquire():
+                    self.last_stats = enforce_retention(self.policy)
+                    logging.info(f"Retention run: {self.last_stats}")
+            except Exception as e:
+                logging.error(f"Retention run failed: {e}")
+            finally:
+                sensor_db.close_connection()
+            self._stop_event.wait(self.interval)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def stop(self):
+        self._stop_event.set()
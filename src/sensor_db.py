@@ -1,168 +1,1040 @@
+import os
 import sqlite3
 import logging
+import threading
+import time
 from datetime import datetime
+from functools import lru_cache
+from src import metrics
 
-DB_PATH = "src/sensor_data.db"
+DB_PATH = os.getenv("SENSOR_DB_PATH", "src/sensor_data.db")
 
-def init_db():
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
+#Per-connection settings. WAL lets readers run alongside the writer and
+#synchronous=NORMAL only fsyncs at checkpoints instead of on every commit.
+PRAGMAS = {
+    #Only takes effect on a new file; init_db converts older ones
+    "auto_vacuum": "INCREMENTAL",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -8000,  #Negative means KiB, so ~8MB of page cache
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,  #ms to wait for a lock before raising
+}
+
+_local = threading.local()
+
+STORE_SECONDS = metrics.histogram("sensor_db_store_seconds", "Seconds to store one batch of readings")
+QUERY_SECONDS = metrics.histogram("sensor_db_query_seconds", "Seconds to run a read query", ["query"])
+ACCEPTED = metrics.counter("sensor_readings_accepted_total", "Remote readings stored", ["pi_id"])
+REJECTED = metrics.counter("sensor_readings_rejected_total", "Remote payloads rejected", ["pi_id"])
+_QUERY_TIMERS = {name: QUERY_SECONDS.labels(name) for name in ("recent", "rollup", "latest")}
+
+#Callbacks run with the stored readings after every successful commit
+_insert_listeners = []
+
+def _open_connection(path):
+    con = sqlite3.connect(path, timeout=PRAGMAS["busy_timeout"] / 1000)
+    con.row_factory = sqlite3.Row
+    for name, value in PRAGMAS.items():
+        con.execute(f"PRAGMA {name}={value}")
+    return con
+
+def get_connection():
+    """Return this thread's connection to DB_PATH, opening it on first use."""
+    con = getattr(_local, "con", None)
+    if con is not None and _local.path == DB_PATH:
+        return con
+
+    #DB_PATH changed (e.g. tests) so drop the stale connection
+    if con is not None:
+        close_connection()
+
+    con = _open_connection(DB_PATH)
+    _local.con = con
+    _local.path = DB_PATH
+    _local.lookups = {table: {} for table in LOOKUP_TABLES}
+    return con
+
+def close_connection():
+    """Close this thread's connection, if it has one."""
+    con = getattr(_local, "con", None)
+    if con is not None:
+        _local.con = None
+        _local.path = None
+        _local.lookups = None
+        con.close()
+
+#Connections inherited over fork(), kept referenced so they are never
+#closed (or used) in the child
+_inherited = []
+
+def _reset_after_fork():
+    #SQLite handles must not cross fork(); the child (e.g. a server
+    #worker) opens its own on first use
+    global _local
+    con = getattr(_local, "con", None)
+    if con is not None:
+        _inherited.append(con)
+    _local = threading.local()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+# -------------------------------
+# Schema
+# -------------------------------
+#Bumped whenever a migration is added below. Stored in PRAGMA user_version.
+SCHEMA_VERSION = 4
+
+#Small-integer lookup tables for the repeated text columns
+LOOKUP_TABLES = ("pis", "sensors", "statuses")
 
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS sensor_data (
+#Fixed ids for the values we always write, so rows stay small and stable
+_SEED_LOOKUPS = {
+    "pis": ["host"],
+    "sensors": ["temperature", "humidity"],
+    "statuses": ["LOW", "STABLE", "HIGH", "INVALID"],
+}
+
+_MIGRATION_CHUNK = 5000
+
+#Status ids fixed by the seed order above
+STATUS_IDS = {name: i + 1 for i, name in enumerate(_SEED_LOOKUPS["statuses"])}
+
+#Rollup tables and their bucket size in seconds, finest first
+ROLLUPS = {
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+#Per-bucket aggregate columns, in insert order
+_ROLLUP_COLUMNS = (
+    "n", "n_values", "sum", "min", "max",
+    "n_low", "n_stable", "n_high", "n_invalid",
+)
+
+def _to_epoch(ts):
+    """UTC epoch seconds for a datetime (naive means local time)."""
+    return int(ts.timestamp())
+
+@lru_cache(maxsize=4096)
+def _to_iso(epoch):
+    """ISO-8601 string in the host's local time, with its UTC offset."""
+    return datetime.fromtimestamp(epoch).astimezone().isoformat()
+
+def _lookup_id(con, table, name):
+    #Ids are cached per connection; new names are added inside the
+    #caller's transaction
+    cache = _local.lookups[table]
+    lookup_id = cache.get(name)
+    if lookup_id is None:
+        if name is None:
+            raise sqlite3.IntegrityError(f"NOT NULL constraint failed: {table}.name")
+        con.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+        lookup_id = con.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()[0]
+        cache[name] = lookup_id
+    return lookup_id
+
+def _schema_version(con):
+    version = con.execute("PRAGMA user_version").fetchone()[0]
+    if version == 0:
+        #Databases created before versioning have a plain sensor_data table
+        row = con.execute(
+            "SELECT type FROM sqlite_master WHERE name = 'sensor_data'"
+        ).fetchone()
+        if row is not None and row[0] == "table":
+            return 1
+    return version
+
+def _migrate_to_v2(con):
+    """
+    Move to integer UTC timestamps and lookup ids with a (pi, sensor, ts)
+    index. sensor_data becomes a view with the old columns so ad-hoc SQL
+    keeps working.
+    """
+    legacy = _schema_version(con) == 1
+    if legacy:
+        con.execute("ALTER TABLE sensor_data RENAME TO sensor_data_v1")
+
+    for table in LOOKUP_TABLES:
+        con.execute(f"""
+            CREATE TABLE {table} (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        """)
+        con.executemany(
+            f"INSERT INTO {table} (name) VALUES (?)",
+            [(name,) for name in _SEED_LOOKUPS[table]]
+        )
+
+    con.execute("""
+        CREATE TABLE readings (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            sensor TEXT NOT NULL,
-            value REAL,
-            status TEXT NOT NULL,
-            pi_id TEXT NOT NULL DEFAULT 'host'
+            ts INTEGER NOT NULL,
+            pi_id INTEGER NOT NULL REFERENCES pis (id),
+            sensor_id INTEGER NOT NULL REFERENCES sensors (id),
+            status_id INTEGER NOT NULL REFERENCES statuses (id),
+            value REAL
         )
     """)
-    con.commit()
-    con.close()
+    con.execute("CREATE INDEX idx_readings_pi_sensor_ts ON readings (pi_id, sensor_id, ts)")
+    con.execute("CREATE INDEX idx_readings_ts ON readings (ts)")
+
+    con.execute("""
+        CREATE VIEW sensor_data AS
+        SELECT r.id,
+               strftime('%Y-%m-%dT%H:%M:%S', r.ts, 'unixepoch', 'localtime') AS timestamp,
+               s.name AS sensor,
+               r.value,
+               st.name AS status,
+               p.name AS pi_id
+        FROM readings r
+        JOIN sensors s ON s.id = r.sensor_id
+        JOIN statuses st ON st.id = r.status_id
+        JOIN pis p ON p.id = r.pi_id
+    """)
+
+    #Inserts through the old table name still work (naive text is local time)
+    con.execute("""
+        CREATE TRIGGER sensor_data_insert INSTEAD OF INSERT ON sensor_data
+        BEGIN
+            INSERT OR IGNORE INTO pis (name) VALUES (COALESCE(NEW.pi_id, 'host'));
+            INSERT OR IGNORE INTO sensors (name) VALUES (NEW.sensor);
+            INSERT OR IGNORE INTO statuses (name) VALUES (NEW.status);
+            INSERT INTO readings (ts, pi_id, sensor_id, status_id, value) VALUES (
+                CASE
+                    WHEN typeof(NEW.timestamp) IN ('integer', 'real')
+                        THEN CAST(NEW.timestamp AS INTEGER)
+                    WHEN NEW.timestamp GLOB '*Z' OR NEW.timestamp GLOB '*[+-][0-9][0-9]:[0-9][0-9]'
+                        THEN CAST(strftime('%s', NEW.timestamp) AS INTEGER)
+                    ELSE CAST(strftime('%s', NEW.timestamp, 'utc') AS INTEGER)
+                END,
+                (SELECT id FROM pis WHERE name = COALESCE(NEW.pi_id, 'host')),
+                (SELECT id FROM sensors WHERE name = NEW.sensor),
+                (SELECT id FROM statuses WHERE name = NEW.status),
+                NEW.value
+            );
+        END
+    """)
+
+    if not legacy:
+        return
+
+    #Copy old rows across in chunks, keeping their ids
+    copied = 0
+    bad_timestamps = 0
+    last_id = 0
+    while True:
+        rows = con.execute("""
+            SELECT id, timestamp, sensor, value, status, pi_id
+            FROM sensor_data_v1
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        """, (last_id, _MIGRATION_CHUNK)).fetchall()
+        if not rows:
+            break
+
+        converted = []
+        for row in rows:
+            try:
+                ts = _to_epoch(datetime.fromisoformat(row["timestamp"]))
+            except (TypeError, ValueError):
+                ts = 0
+                bad_timestamps += 1
+            converted.append((
+                row["id"],
+                ts,
+                _lookup_id(con, "pis", row["pi_id"]),
+                _lookup_id(con, "sensors", row["sensor"]),
+                _lookup_id(con, "statuses", row["status"]),
+                row["value"],
+            ))
+
+        con.executemany("""
+            INSERT INTO readings (id, ts, pi_id, sensor_id, status_id, value)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, converted)
+        copied += len(rows)
+        last_id = rows[-1]["id"]
+
+    con.execute("DROP TABLE sensor_data_v1")
+    logging.info(f"Migrated {copied} rows to schema v2")
+    if bad_timestamps:
+        logging.warning(f"{bad_timestamps} rows had unreadable timestamps and were stored at epoch 0")
+
+def _backfill_rollups(con):
+    """Rebuild every rollup table from the raw readings."""
+    status_counts = ", ".join(
+        f"SUM(status_id = {STATUS_IDS[name]})" for name in ("LOW", "STABLE", "HIGH", "INVALID")
+    )
+    for name, size in ROLLUPS.items():
+        con.execute(f"DELETE FROM rollup_{name}")
+        con.execute(f"""
+            INSERT INTO rollup_{name} (bucket, pi_id, sensor_id, {", ".join(_ROLLUP_COLUMNS)})
+            SELECT ts - ts % {size}, pi_id, sensor_id,
+                   COUNT(*), COUNT(value), TOTAL(value), MIN(value), MAX(value),
+                   {status_counts}
+            FROM readings
+            GROUP BY 1, 2, 3
+        """)
+
+def _migrate_to_v3(con):
+    """
+    Add minute/hour/day rollups (count, min, max, sum and status counts
+    per pi, sensor and bucket). Triggers keep them current on insert;
+    deleting raw rows leaves them untouched so they can outlive them.
+    """
+    upserts = []
+    for name, size in ROLLUPS.items():
+        con.execute(f"""
+            CREATE TABLE rollup_{name} (
+                bucket INTEGER NOT NULL,
+                pi_id INTEGER NOT NULL,
+                sensor_id INTEGER NOT NULL,
+                n INTEGER NOT NULL,
+                n_values INTEGER NOT NULL,
+                sum REAL NOT NULL,
+                min REAL,
+                max REAL,
+                n_low INTEGER NOT NULL,
+                n_stable INTEGER NOT NULL,
+                n_high INTEGER NOT NULL,
+                n_invalid INTEGER NOT NULL,
+                PRIMARY KEY (bucket, pi_id, sensor_id)
+            ) WITHOUT ROWID
+        """)
+        upserts.append(f"""
+            INSERT INTO rollup_{name} (bucket, pi_id, sensor_id, {", ".join(_ROLLUP_COLUMNS)})
+            VALUES (
+                NEW.ts - NEW.ts % {size}, NEW.pi_id, NEW.sensor_id,
+                1, NEW.value IS NOT NULL, COALESCE(NEW.value, 0), NEW.value, NEW.value,
+                NEW.status_id = {STATUS_IDS["LOW"]}, NEW.status_id = {STATUS_IDS["STABLE"]},
+                NEW.status_id = {STATUS_IDS["HIGH"]}, NEW.status_id = {STATUS_IDS["INVALID"]}
+            )
+            ON CONFLICT (bucket, pi_id, sensor_id) DO UPDATE SET
+                n = n + 1,
+                n_values = n_values + excluded.n_values,
+                sum = sum + excluded.sum,
+                min = COALESCE(MIN(min, excluded.min), min, excluded.min),
+                max = COALESCE(MAX(max, excluded.max), max, excluded.max),
+                n_low = n_low + excluded.n_low,
+                n_stable = n_stable + excluded.n_stable,
+                n_high = n_high + excluded.n_high,
+                n_invalid = n_invalid + excluded.n_invalid;
+        """)
+
+    con.execute(f"""
+        CREATE TRIGGER readings_rollup AFTER INSERT ON readings
+        BEGIN
+            {"".join(upserts)}
+        END
+    """)
+
+    _backfill_rollups(con)
+
+def _migrate_to_v4(con):
+    """
+    Keep rollup status counts right when a stored reading's status is
+    changed (e.g. rescored after the thresholds moved).
+    """
+    moves = []
+    for name, size in ROLLUPS.items():
+        counts = ",\n".join(
+            f"n_{status.lower()} = n_{status.lower()}"
+            f" + (NEW.status_id = {STATUS_IDS[status]}) - (OLD.status_id = {STATUS_IDS[status]})"
+            for status in ("LOW", "STABLE", "HIGH", "INVALID")
+        )
+        moves.append(f"""
+            UPDATE rollup_{name} SET {counts}
+            WHERE bucket = OLD.ts - OLD.ts % {size}
+              AND pi_id = OLD.pi_id AND sensor_id = OLD.sensor_id;
+        """)
+
+    con.execute(f"""
+        CREATE TRIGGER readings_status_update AFTER UPDATE OF status_id ON readings
+        WHEN OLD.status_id != NEW.status_id
+        BEGIN
+            {"".join(moves)}
+        END
+    """)
+
+#Migration that brings the schema up to each version, in order
+_MIGRATIONS = {
+    2: _migrate_to_v2,
+    3: _migrate_to_v3,
+    4: _migrate_to_v4,
+}
+
+#Seconds init_db waits for another process's migration before giving up;
+#upgrading a large old database can take far longer than busy_timeout
+MIGRATION_LOCK_TIMEOUT = float(os.getenv("SENSOR_DB_MIGRATION_TIMEOUT", 3600))
+
+def _execute_when_free(con, sql, timeout):
+    """
+    Run sql, retrying for up to timeout seconds while another connection
+    holds the lock (each attempt already waits busy_timeout).
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return con.execute(sql)
+        except sqlite3.OperationalError as e:
+            message = str(e)
+            if "locked" not in message and "busy" not in message:
+                raise
+            if time.monotonic() >= deadline:
+                raise
+            logging.info(f"Database busy, waiting to run {sql.split()[0]}")
+            time.sleep(0.1)
+
+def init_db():
+    """Create the database or upgrade it in place to SCHEMA_VERSION."""
+    con = get_connection()
+
+    #Take the write lock before checking so two processes can't both
+    #migrate; whoever waits re-reads user_version and finds it current
+    _execute_when_free(con, "BEGIN IMMEDIATE", MIGRATION_LOCK_TIMEOUT)
+    try:
+        version = _schema_version(con)
+        #Only the process that upgrades converts, so it runs once
+        convert = version < SCHEMA_VERSION and con.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            migrate = _MIGRATIONS.get(target)
+            if migrate is not None:
+                logging.info(f"Migrating database to schema v{target}")
+                migrate(con)
+        con.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        con.commit()
+    except Exception:
+        con.rollback()
+        _local.lookups = {table: {} for table in LOOKUP_TABLES}
+        raise
+
+    #Older files need one full VACUUM before incremental vacuum works
+    if convert:
+        logging.info("Converting database to incremental auto-vacuum")
+        con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        _execute_when_free(con, "VACUUM", MIGRATION_LOCK_TIMEOUT)
+
     logging.info(f"Database initialized at {DB_PATH}")
 
-def store_result(result, pi_id="host"):
+# -------------------------------
+# Retention
+# -------------------------------
+#Retention tiers and the table (and time column) each one covers
+RETENTION_TABLES = {
+    "raw": ("readings", "ts"),
+    **{name: (f"rollup_{name}", "bucket") for name in ROLLUPS},
+}
+
+def delete_before(tier, cutoff, batch_size=500, pause=0.05):
+    """
+    Delete rows of a retention tier older than epoch cutoff, one small
+    transaction per batch so writers are never held up for long.
+    Returns the number of rows removed.
+    """
+    table, column = RETENTION_TABLES[tier]
+    key = "id" if tier == "raw" else "bucket, pi_id, sensor_id"
+    con = get_connection()
+    removed = 0
+
+    while True:
+        with con:
+            cur = con.execute(f"""
+                DELETE FROM {table}
+                WHERE ({key}) IN (
+                    SELECT {key} FROM {table}
+                    WHERE {column} < ?
+                    ORDER BY {column}
+                    LIMIT ?
+                )
+            """, (cutoff, batch_size))
+        removed += cur.rowcount
+        if cur.rowcount < batch_size:
+            return removed
+        time.sleep(pause)
+
+def incremental_vacuum(chunk_pages=256, pause=0.05):
+    """Return free pages to the filesystem in chunks. Returns bytes freed."""
+    con = get_connection()
+    page_size = con.execute("PRAGMA page_size").fetchone()[0]
+    before = con.execute("PRAGMA page_count").fetchone()[0]
+
+    free = con.execute("PRAGMA freelist_count").fetchone()[0]
+    while free > 0:
+        #Rows must be consumed for the pragma to free every page
+        con.execute(f"PRAGMA incremental_vacuum({chunk_pages})").fetchall()
+        remaining = con.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free:
+            break  #Not in incremental mode, nothing more to give back
+        free = remaining
+        time.sleep(pause)
+
+    after = con.execute("PRAGMA page_count").fetchone()[0]
+    return (before - after) * page_size
+
+# -------------------------------
+# Writes
+# -------------------------------
+def add_insert_listener(callback):
+    """
+    Call callback(readings) after each commit that stores readings.
+    Each reading is a dict with ts (epoch), timestamp (ISO), sensor,
+    value, status and pi_id.
+    """
+    if callback not in _insert_listeners:
+        _insert_listeners.append(callback)
+
+def remove_insert_listener(callback):
+    if callback in _insert_listeners:
+        _insert_listeners.remove(callback)
+
+def _notify_insert(results, rows, first_id):
+    readings = [
+        {
+            "id": first_id + i,
+            "ts": row[0],
+            "timestamp": _to_iso(row[0]),
+            "sensor": r["sensor"],
+            "value": r["value"],
+            "status": r["status"],
+            "pi_id": r.get("pi_id", "host"),
+        }
+        for i, (r, row) in enumerate(zip(results, rows))
+    ]
+    for callback in list(_insert_listeners):
+        try:
+            callback(readings)
+        except Exception as e:
+            logging.error(f"Insert listener {callback!r} failed: {e}")
+
+def store_results(results):
+    """
+    Insert many result rows in a single transaction.
+    Each result may carry its own pi_id (defaults to "host").
+    Raises on failure so callers can report it.
+    """
+    if not results:
+        return 0
+
+    con = get_connection()
+    started = time.perf_counter()
     try:
-        con = sqlite3.connect(DB_PATH)
-        cur = con.cursor()
+        with con:
+            rows = [
+                (
+                    _to_epoch(r["timestamp"]),
+                    _lookup_id(con, "pis", r.get("pi_id", "host")),
+                    _lookup_id(con, "sensors", r["sensor"]),
+                    _lookup_id(con, "statuses", r["status"]),
+                    r["value"],
+                )
+                for r in results
+            ]
+            con.executemany("""
+                INSERT INTO readings (ts, pi_id, sensor_id, status_id, value)
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+            #One write transaction, so the ids are consecutive
+            first_id = con.execute("SELECT last_insert_rowid()").fetchone()[0] - len(rows) + 1
+        STORE_SECONDS.observe(time.perf_counter() - started)
+    except Exception:
+        #Any ids added in the rolled back transaction are gone again
+        _local.lookups = {table: {} for table in LOOKUP_TABLES}
+        raise
 
-        cur.execute("""
-            INSERT INTO sensor_data (timestamp, sensor, value, status, pi_id)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
-            result["timestamp"].isoformat(),
-            result["sensor"],
-            result["value"],
-            result["status"],
-            pi_id
-        ))
+    if _insert_listeners:
+        _notify_insert(results, rows, first_id)
+    return len(rows)
 
-        con.commit()
-        con.close()
+def store_result(result, pi_id="host"):
+    try:
+        store_results([dict(result, pi_id=pi_id)])
         logging.info(f"Stored result in DB from {pi_id}: {result}")
     except Exception as e:
         logging.error(f"Failed to store result: {e}")
 
+def _parse_timestamp(ts):
+    if isinstance(ts, datetime):
+        return ts
+    if isinstance(ts, str):
+        try:
+            return datetime.fromisoformat(ts)
+        except ValueError:
+            pass
+    return datetime.now()
+
+def _check_value(value):
+    #Readings are numbers, or None when the sensor returned nothing usable
+    if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+        raise ValueError(f"invalid value: {value!r}")
+    return value
+
+def parse_remote_data(data):
+    """
+    Turn one remote payload into result rows (supports two payload formats).
+    Raises ValueError if the payload is not a reading.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("reading must be a JSON object")
+
+    pi_id = data.get("pi_id", "unknown")
+    if not isinstance(pi_id, str) or not pi_id:
+        raise ValueError(f"invalid pi_id: {pi_id!r}")
+
+    # Case A: client sent a processed result row:
+    # {timestamp, sensor, value, status, pi_id}
+    if "sensor" in data and "value" in data:
+        if not isinstance(data["sensor"], str):
+            raise ValueError(f"invalid sensor: {data['sensor']!r}")
+        return [{
+            "timestamp": _parse_timestamp(data.get("timestamp")),
+            "sensor": data["sensor"],
+            "value": _check_value(data["value"]),
+            "status": str(data.get("status", "UNKNOWN")),
+            "pi_id": pi_id,
+        }]
+
+    # Case B: client sent combined raw readings:
+    timestamp = _parse_timestamp(data.get("timestamp"))
+    results = []
+
+    if "temperature" in data:
+        results.append({
+            "timestamp": timestamp,
+            "sensor": "temperature",
+            "value": _check_value(data["temperature"]),
+            "status": str(data.get("temp_status", "UNKNOWN")),
+            "pi_id": pi_id,
+        })
+
+    if "humidity" in data:
+        results.append({
+            "timestamp": timestamp,
+            "sensor": "humidity",
+            "value": _check_value(data["humidity"]),
+            "status": str(data.get("humidity_status", "UNKNOWN")),
+            "pi_id": pi_id,
+        })
+
+    if not results:
+        raise ValueError("reading has no sensor values")
+    return results
+
+def _payload_pi(data):
+    pi_id = data.get("pi_id") if isinstance(data, dict) else None
+    return pi_id if isinstance(pi_id, str) else "unknown"
+
 def store_remote_data(data):
-    """Store data received from remote Pis (supports two payload formats)."""
+    """
+    Store data received from remote Pis (supports two payload formats).
+    Returns the rows stored; raises ValueError for a payload that can't
+    be stored, and lets database errors through, so the caller never
+    reports a reading as stored when it wasn't.
+    """
     try:
-        pi_id = data.get("pi_id", "unknown")
-
-        # Case A: client sent a processed result row:
-        # {timestamp, sensor, value, status, pi_id}
-        if "sensor" in data and "value" in data:
-            ts = data.get("timestamp")
-            if isinstance(ts, str):
-                try:
-                    ts = datetime.fromisoformat(ts)
-                except ValueError:
-                    ts = datetime.now()
-            elif ts is None:
-                ts = datetime.now()
-
-            result = {
-                "timestamp": ts,
-                "sensor": data["sensor"],
-                "value": data["value"],
-                "status": data.get("status", "UNKNOWN"),
-            }
-            store_result(result, pi_id)
-            return  # done
-
-        # Case B: client sent combined raw readings:
-        timestamp = datetime.now()
-
-        if "temperature" in data:
-            temp_result = {
-                "timestamp": timestamp,
-                "sensor": "temperature",
-                "value": data["temperature"],
-                "status": data.get("temp_status", "UNKNOWN"),
-            }
-            store_result(temp_result, pi_id)
-
-        if "humidity" in data:
-            humidity_result = {
-                "timestamp": timestamp,
-                "sensor": "humidity",
-                "value": data["humidity"],
-                "status": data.get("humidity_status", "UNKNOWN"),
-            }
-            store_result(humidity_result, pi_id)
+        results = parse_remote_data(data)
+    except ValueError as e:
+        REJECTED.labels(_payload_pi(data)).inc()
+        logging.error(f"Rejected remote data: {e}")
+        raise
+    stored = store_results(results)
+    ACCEPTED.labels(results[0]["pi_id"]).inc(len(results))
+    logging.info(f"Stored {len(results)} result(s) in DB from {results[0]['pi_id']}")
+    return stored
 
-    except Exception as e:
-        logging.error(f"Failed to store remote data: {e}")
+def store_remote_batch(items):
+    """
+    Validate a list of remote payloads and store every valid one in a
+    single transaction. Invalid items are skipped and reported by index.
+    """
+    results = []
+    errors = []
+
+    for index, item in enumerate(items):
+        try:
+            results.extend(parse_remote_data(item))
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+            REJECTED.labels(_payload_pi(item)).inc()
+
+    stored = store_results(results)
+    for r in results:
+        ACCEPTED.labels(r["pi_id"]).inc()
+    logging.info(f"Stored batch: {stored} rows, {len(errors)} rejected item(s)")
+
+    return {
+        "accepted": len(items) - len(errors),
+        "rejected": len(errors),
+        "rows": stored,
+        "errors": errors,
+    }
+
+# -------------------------------
+# Reads
+# -------------------------------
+def _row_to_dict(row):
+    return {
+        "id": row["id"],
+        "ts": row["ts"],
+        "timestamp": _to_iso(row["ts"]),
+        "sensor": row["sensor"],
+        "value": row["value"],
+        "status": row["status"],
+        "pi_id": row["pi_id"],
+    }
 
-def get_recent_data(limit=10000, pi_id=None):
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row 
+def iter_recent_data(limit=10000, pi_id=None, since=None, before=None, after=None, chunk=500):
+    """
+    Newest raw rows first, optionally for one Pi, from epoch since and/or
+    strictly older than the row with id before (keyset pagination: pass
+    the id of the last row of one page to get the next). after=<id> keeps
+    only rows inserted after that one; ids only grow, so the largest id a
+    client has seen is a cursor for "what's new".
+
+    The query runs now, so a bad cursor raises ValueError here; rows are
+    then yielded chunk by chunk straight off the cursor.
+    """
+    con = get_connection()
     cur = con.cursor()
-    
+
+    where = []
+    params = []
     if pi_id:
         #Get data for specific Pi
-        cur.execute("""
-            SELECT timestamp, sensor, value, status, pi_id
-            FROM sensor_data
-            WHERE pi_id = ?
-            ORDER BY timestamp DESC
+        where.append("p.name = ?")
+        params.append(pi_id)
+    if since is not None:
+        where.append("r.ts >= ?")
+        params.append(since)
+    if before is not None:
+        row = con.execute("SELECT ts FROM readings WHERE id = ?", (before,)).fetchone()
+        if row is None:
+            raise ValueError(f"unknown or expired cursor: {before}")
+        #Written so the ts index still bounds the scan
+        where.append("r.ts <= ? AND (r.ts < ? OR r.id < ?)")
+        params.extend([row["ts"], row["ts"], before])
+    if after is not None:
+        where.append("r.id > ?")
+        params.append(after)
+
+    #Times the query up to its first row; the rest is streamed
+    with _QUERY_TIMERS["recent"].time():
+        cur.execute(f"""
+            SELECT r.id, r.ts, s.name AS sensor, r.value, st.name AS status, p.name AS pi_id
+            FROM readings r
+            JOIN sensors s ON s.id = r.sensor_id
+            JOIN statuses st ON st.id = r.status_id
+            JOIN pis p ON p.id = r.pi_id
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY r.ts DESC, r.id DESC
             LIMIT ?
-        """, (pi_id, limit))
-    else:
-        #Get all recent data
+        """, (*params, limit))
+
+    def rows():
+        while True:
+            batch = cur.fetchmany(chunk)
+            if not batch:
+                return
+            for row in batch:
+                yield _row_to_dict(row)
+
+    return rows()
+
+def get_recent_data(limit=10000, pi_id=None, since=None, before=None, after=None):
+    """Newest raw rows first, as a list (see iter_recent_data)."""
+    return list(iter_recent_data(limit, pi_id=pi_id, since=since, before=before, after=after))
+
+#Ways /history can fill the gaps between sparse (deadbanded) readings
+FILL_METHODS = ("previous", "linear")
+
+#Readings are never carried further than this, so a Pi that went quiet
+#shows as a gap instead of a flat line
+FILL_MAX_GAP = int(os.getenv("HISTORY_FILL_MAX_GAP", 900))
+
+def _fill_series(points, start, end, step, method, max_gap=FILL_MAX_GAP):
+    """
+    Resample one series of (ts, id, value, status) tuples, oldest first,
+    onto start, start + step, ... up to end. "previous" carries each
+    reading forward until the next one; "linear" interpolates the value
+    between neighbours (the status is still the earlier reading's).
+    Returns (ts, id, value, status) tuples with the id of the reading
+    each point came from.
+    """
+    filled = []
+    i = -1
+    for t in range(start, end + 1, step):
+        while i + 1 < len(points) and points[i + 1][0] <= t:
+            i += 1
+        if i < 0 or t - points[i][0] > max_gap:
+            continue
+        ts, reading_id, value, status = points[i]
+        if method == "linear" and i + 1 < len(points) and value is not None:
+            next_ts, _, next_value, _ = points[i + 1]
+            if next_value is not None and next_ts - ts <= max_gap:
+                value = value + (next_value - value) * (t - ts) / (next_ts - ts)
+        filled.append((t, reading_id, value, status))
+    return filled
+
+def get_filled_data(since, step, method="previous", pi_id=None, until=None, max_gap=FILL_MAX_GAP):
+    """
+    Raw readings from epoch since resampled every step seconds per Pi and
+    sensor (see _fill_series), newest first like get_recent_data. The
+    last reading before since seeds each series so it starts on time.
+    """
+    if method not in FILL_METHODS:
+        raise ValueError(f"fill must be one of {', '.join(FILL_METHODS)}")
+    until = int(time.time()) if until is None else until
+    #Grid on multiples of step so repeated calls line up
+    start = since + (-since % step)
+    con = get_connection()
+
+    pi_filter = "AND p.name = ?" if pi_id else ""
+    pi_params = (pi_id,) if pi_id else ()
+    select = """
+        SELECT r.id, r.ts, s.name AS sensor, r.value, st.name AS status, p.name AS pi_id
+        FROM readings r
+        JOIN sensors s ON s.id = r.sensor_id
+        JOIN statuses st ON st.id = r.status_id
+        JOIN pis p ON p.id = r.pi_id
+    """
+    series = {}
+    with _QUERY_TIMERS["recent"].time():
+        #Newest reading of each series in the max_gap before the window
+        for pair in con.execute(f"""
+            SELECT p.id AS pi, s.id AS sensor FROM pis p, sensors s WHERE 1 {pi_filter}
+        """, pi_params).fetchall():
+            seed = con.execute(f"""
+                {select}
+                WHERE r.pi_id = ? AND r.sensor_id = ? AND r.ts < ? AND r.ts >= ?
+                ORDER BY r.ts DESC, r.id DESC
+                LIMIT 1
+            """, (pair["pi"], pair["sensor"], start, start - max_gap)).fetchone()
+            if seed is not None:
+                series[(seed["pi_id"], seed["sensor"])] = [
+                    (seed["ts"], seed["id"], seed["value"], seed["status"])
+                ]
+        for row in con.execute(f"""
+            {select}
+            WHERE r.ts >= ? AND r.ts <= ? {pi_filter}
+            ORDER BY r.ts, r.id
+        """, (start, until, *pi_params)):
+            series.setdefault((row["pi_id"], row["sensor"]), []).append(
+                (row["ts"], row["id"], row["value"], row["status"])
+            )
+
+    rows = [
+        (ts, reading_id, sensor, value, status, pi)
+        for (pi, sensor), points in series.items()
+        for ts, reading_id, value, status in _fill_series(points, start, until, step, method, max_gap)
+    ]
+    rows.sort(key=lambda r: (r[0], r[1]), reverse=True)
+    return [
+        {"id": reading_id, "ts": ts, "timestamp": _to_iso(ts), "sensor": sensor, "value": value, "status": status, "pi_id": pi}
+        for ts, reading_id, sensor, value, status, pi in rows
+    ]
+
+
+#Fewest buckets a window must span before a rollup is used for it
+HISTORY_MIN_POINTS = 100
+
+def choose_resolution(window_seconds, min_points=HISTORY_MIN_POINTS):
+    """Coarsest rollup that still gives min_points buckets, else "raw"."""
+    for name, size in reversed(ROLLUPS.items()):
+        if window_seconds // size >= min_points:
+            return name
+    return "raw"
+
+def _dominant_status(row):
+    counts = {name: row[f"n_{name.lower()}"] for name in ("LOW", "STABLE", "HIGH", "INVALID")}
+    status = max(counts, key=counts.get)
+    return status if counts[status] else "UNKNOWN"
+
+def get_rollup_data(resolution, since, pi_id=None):
+    """
+    Bucketed history from epoch since, newest bucket first. value is the
+    bucket mean and status the most common status in it.
+    """
+    if resolution not in ROLLUPS:
+        raise ValueError(f"unknown resolution: {resolution}")
+
+    con = get_connection()
+    cur = con.cursor()
+
+    where = ["b.bucket >= ?"]
+    params = [since - since % ROLLUPS[resolution]]
+    if pi_id:
+        where.append("p.name = ?")
+        params.append(pi_id)
+
+    with _QUERY_TIMERS["rollup"].time():
+        cur.execute(f"""
+            SELECT b.*, s.name AS sensor, p.name AS pi_name
+            FROM rollup_{resolution} b
+            JOIN sensors s ON s.id = b.sensor_id
+            JOIN pis p ON p.id = b.pi_id
+            WHERE {" AND ".join(where)}
+            ORDER BY b.bucket DESC, p.name, s.name
+        """, params)
+        rows = cur.fetchall()
+
+    return [
+        {
+            "ts": row["bucket"],
+            "timestamp": _to_iso(row["bucket"]),
+            "sensor": row["sensor"],
+            "value": row["sum"] / row["n_values"] if row["n_values"] else None,
+            "status": _dominant_status(row),
+            "pi_id": row["pi_name"],
+            "min": row["min"],
+            "max": row["max"],
+            "count": row["n"],
+            "status_counts": {
+                name: row[f"n_{name.lower()}"] for name in ("LOW", "STABLE", "HIGH", "INVALID")
+            },
+        }
+        for row in rows
+    ]
+
+#Keys each sensor fills in on a /live entry
+LIVE_FIELDS = {
+    "temperature": ("temperature", "temp_status", "temp_timestamp"),
+    "humidity": ("humidity", "humidity_status", "humidity_timestamp"),
+}
+
+def apply_latest(latest, reading):
+    """Merge one reading into a {pi_id: live entry} dict."""
+    fields = LIVE_FIELDS.get(reading["sensor"])
+    if fields is None:
+        return
+
+    pi = reading["pi_id"]
+    if pi not in latest:
+        latest[pi] = {"pi_id": pi}
+
+    value_key, status_key, timestamp_key = fields
+    latest[pi][value_key] = reading["value"]
+    latest[pi][status_key] = reading["status"]
+    latest[pi][timestamp_key] = reading["timestamp"]
+
+def get_latest_readings():
+    """Latest reading for every (pi, sensor) pair, with epoch ts."""
+    con = get_connection()
+    cur = con.cursor()
+
+    #One index seek per (pi, sensor) pair instead of grouping the whole table
+    with _QUERY_TIMERS["latest"].time():
         cur.execute("""
-            SELECT timestamp, sensor, value, status, pi_id
-            FROM sensor_data
-            ORDER BY timestamp DESC
-            LIMIT ?
-        """, (limit,))
-        
-    rows = cur.fetchall()
-    con.close()
-    return [dict(row) for row in rows]
+            SELECT r.id, r.ts, s.name AS sensor, r.value, st.name AS status, p.name AS pi_id
+            FROM pis p
+            CROSS JOIN sensors s
+            JOIN readings r ON r.id = (
+                SELECT id FROM readings
+                WHERE pi_id = p.id AND sensor_id = s.id
+                ORDER BY ts DESC, id DESC
+                LIMIT 1
+            )
+            JOIN statuses st ON st.id = r.status_id
+            ORDER BY p.name, s.name
+        """)
+        rows = cur.fetchall()
 
+    return [_row_to_dict(row) for row in rows]
 
-#Get latest DB write for the cards
-def get_latest_per_pi():
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
+def latest_id():
+    """Id of the newest reading (0 if there are none)."""
+    return get_connection().execute("SELECT COALESCE(MAX(id), 0) FROM readings").fetchone()[0]
+
+def data_version():
+    """
+    Changes whenever another connection (thread or process) commits, so
+    pollers can skip querying when nothing happened.
+    """
+    return get_connection().execute("PRAGMA data_version").fetchone()[0]
+
+def get_new_readings(after_id, limit=1000):
+    """Readings with id greater than after_id, oldest first, with epoch ts."""
+    cur = get_connection().execute("""
+        SELECT r.id, r.ts, s.name AS sensor, r.value, st.name AS status, p.name AS pi_id
+        FROM readings r
+        JOIN sensors s ON s.id = r.sensor_id
+        JOIN statuses st ON st.id = r.status_id
+        JOIN pis p ON p.id = r.pi_id
+        WHERE r.id > ?
+        ORDER BY r.id
+        LIMIT ?
+    """, (after_id, limit))
+    return [_row_to_dict(row) for row in cur.fetchall()]
+
+# -------------------------------
+# Rescoring
+# -------------------------------
+def get_lookup(table):
+    """Name to id for every row of a lookup table."""
+    if table not in LOOKUP_TABLES:
+        raise ValueError(f"Unknown lookup table: {table}")
+    return {name: i for i, name in get_connection().execute(f"SELECT id, name FROM {table}")}
+
+def get_stored_statuses(after_id=0, limit=50000, pi_id=None):
+    """
+    Raw (id, pi_id, sensor_id, value, status_id) tuples for readings after
+    after_id, in id order. Plain tuples, since callers load them
+    straight into arrays.
+    """
+    con = get_connection()
     cur = con.cursor()
+    cur.row_factory = None
+    where, params = "id > ?", [after_id]
+    if pi_id is not None:
+        where += " AND pi_id = (SELECT id FROM pis WHERE name = ?)"
+        params.append(pi_id)
+    cur.execute(f"""
+        SELECT id, pi_id, sensor_id, value, status_id FROM readings
+        WHERE {where}
+        ORDER BY id
+        LIMIT ?
+    """, (*params, limit))
+    return cur.fetchall()
 
-    cur.execute("""
-        SELECT s1.timestamp, s1.sensor, s1.value, s1.status, s1.pi_id
-        FROM sensor_data s1
-        JOIN (
-            SELECT pi_id, sensor, MAX(timestamp) AS max_ts
-            FROM sensor_data
-            GROUP BY pi_id, sensor
-        ) s2
-        ON s1.pi_id = s2.pi_id
-        AND s1.sensor = s2.sensor
-        AND s1.timestamp = s2.max_ts
-        ORDER BY s1.pi_id, s1.sensor
-    """)
+def update_statuses(changes):
+    """
+    Set status_id for each (status_id, id) pair in one transaction. The
+    readings_status_update trigger moves the rollup counts to match.
+    """
+    con = get_connection()
+    with con:
+        con.executemany("UPDATE readings SET status_id = ? WHERE id = ?", changes)
+    return len(changes)
 
-    rows = cur.fetchall()
-    con.close()
+# -------------------------------
+# Metrics
+# -------------------------------
+#COUNT(*) walks an index, so scrapes reuse the count for this many seconds
+ROW_COUNT_TTL = 60
+_row_count = {"rows": 0, "at": float("-inf"), "path": None}
 
-    latest = {}
+def _file_bytes():
+    return sum(os.path.getsize(p) for p in (DB_PATH, DB_PATH + "-wal") if os.path.exists(p))
 
-    for r in rows:
-        pi = r["pi_id"]
+def _count_rows():
+    if time.monotonic() - _row_count["at"] >= ROW_COUNT_TTL or _row_count["path"] != DB_PATH:
+        _row_count["rows"] = get_connection().execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+        _row_count["at"] = time.monotonic()
+        _row_count["path"] = DB_PATH
+    return _row_count["rows"]
 
-        if pi not in latest:
-            latest[pi] = {"pi_id": pi}
+#Read when metrics are scraped, never on the write path
+metrics.gauge("sensor_db_file_bytes", "Size of the database file and its WAL").set_function(_file_bytes)
+metrics.gauge("sensor_db_rows", f"Raw readings stored (refreshed every {ROW_COUNT_TTL}s)").set_function(_count_rows)
 
-        if r["sensor"] == "temperature":
-            latest[pi]["temperature"] = r["value"]
-            latest[pi]["temp_status"] = r["status"]
-            latest[pi]["temp_timestamp"] = r["timestamp"]
+#Get latest DB write for the cards
+def get_latest_per_pi():
+    latest = {}
 
-        elif r["sensor"] == "humidity":
-            latest[pi]["humidity"] = r["value"]
-            latest[pi]["humidity_status"] = r["status"]
-            latest[pi]["humidity_timestamp"] = r["timestamp"]
+    for reading in get_latest_readings():
+        apply_latest(latest, reading)
 
     return list(latest.values())
-
-	
@@ -1,15 +1,32 @@
 import time
 import threading
 import math
+import statistics
+from src import hardware, metrics, profiling
 
-try:
-    from sense_hat import SenseHat
-    sense = SenseHat()
-except OSError:
-    #If not using RPi, make fake one (testing)
-    sense = None
+READ_SECONDS = metrics.histogram("sensor_read_seconds", "Seconds to read the Sense HAT")
+CALLBACK_SECONDS = metrics.histogram("sensor_callback_seconds", "Seconds spent handling one reading")
+OVERRUNS = metrics.counter("sensor_schedule_overruns_total", "Reading slots missed because work ran long")
 
+#Fields read_values returns, filtered when oversampling
+FIELDS = ("temperature", "humidity")
+
+#MAD to standard deviation for normally distributed noise
+_MAD_SCALE = 1.4826
+
+def __getattr__(name):
+    #sensors.sense is the shared Sense HAT, opened on first use
+    if name == "sense":
+        return hardware.sense_hat()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _sense():
+    #A sense set on this module (tests) wins over the shared one
+    return globals().get("sense") or hardware.sense_hat()
+
+@profiling.stage("read_values")
 def read_values():
+    sense = _sense()
     if sense is None:
         #Return fake values if RPi isnt available (testing)
         return {"humidity": 50.0, "temperature": 22.0}
@@ -27,22 +44,76 @@ def read_values():
     }
 
 
+def combine_samples(samples, method="median", outlier_k=3.0):
+    """
+    One reading from several: per field, samples further than outlier_k
+    scaled MADs from the median are dropped and the rest reduced with
+    method ("median" or "mean"). <field>_min/_max give the spread of all
+    valid samples and "samples" how many reads went in.
+    """
+    reduce = statistics.median if method == "median" else statistics.fmean
+    data = {"samples": len(samples)}
+    for field in FIELDS:
+        values = [s[field] for s in samples if s.get(field) is not None]
+        if not values:
+            data[field] = data[f"{field}_min"] = data[f"{field}_max"] = None
+            continue
+        median = statistics.median(values)
+        mad = statistics.median(abs(v - median) for v in values)
+        if mad > 0:
+            limit = outlier_k * _MAD_SCALE * mad
+            values_kept = [v for v in values if abs(v - median) <= limit]
+        else:
+            #Most samples agree exactly; nothing to measure outliers against
+            values_kept = values
+        data[field] = reduce(values_kept)
+        data[f"{field}_min"] = min(values)
+        data[f"{field}_max"] = max(values)
+    return data
+
+
 class SensorReader(threading.Thread):
-    def __init__(self, interval = 10, callback = None):
+    def __init__(self, interval = 10, callback = None, samples = 1, method = "median", outlier_k = 3.0):
         super().__init__()
         self.interval = interval
         self.callback = callback #Function to call with sensor data after each reading
         self.running = False #Flag to control the thread's loop
+        #Reads per interval, spread evenly and combined into one report
+        self.samples = max(1, int(samples))
+        self.method = method
+        self.outlier_k = outlier_k
+        self.overruns = 0 #Slots skipped because a read or callback ran long
 
-    #Reads sensor data repeatedly until stopped
+    #Reads sensor data on a fixed cadence until stopped. Slots are timed
+    #from the monotonic clock, so a slow callback delays nothing after it
+    #unless it runs past the next slot; then the missed slots are skipped
+    #rather than run back to back.
     def run(self):
         self.running = True
+        period = self.interval / self.samples
+        batch = []
+        next_slot = time.monotonic()
         while self.running:
-            data = read_values() #Get humidity and temperature
-            if self.callback:
-                self.callback(data) #Call the callback function
-            time.sleep(self.interval) #Wait
+            with READ_SECONDS.time():
+                batch.append(read_values()) #Get humidity and temperature
+
+            if len(batch) == self.samples:
+                data = batch[0] if self.samples == 1 else combine_samples(batch, self.method, self.outlier_k)
+                batch = []
+                if self.callback:
+                    with CALLBACK_SECONDS.time():
+                        self.callback(data) #Call the callback function
+
+            next_slot += period
+            delay = next_slot - time.monotonic()
+            if delay < 0:
+                missed = int(-delay // period) + 1
+                self.overruns += missed
+                OVERRUNS.inc(missed)
+                print(f"[sensors] Running {-delay:.2f}s behind schedule, skipping {missed} slot(s)")
+                next_slot += missed * period
+                delay = next_slot - time.monotonic()
+            time.sleep(max(0.0, delay)) #Wait for the next slot
 
     def stop(self):
         self.running = False
-        
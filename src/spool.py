@@ -0,0 +1,184 @@
+import os
+import json
+import logging
+import threading
+
+class Spool:
+    """
+    Append-only on-disk queue of JSON records, split into segment files.
+    Records stay until ack()ed; when the spool grows past max_bytes the
+    oldest segments are evicted first.
+    """
+
+    CURSOR_FILE = "cursor.json"
+
+    def __init__(self, directory, max_bytes = 50 * 1024 * 1024,
+                 segment_bytes = 1024 * 1024, fsync = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.evicted_bytes = 0 #Unsent data lost to the size cap
+
+        self._lock = threading.Lock()
+        self._writer = None
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments = sorted(
+            int(name[:-4]) for name in os.listdir(directory)
+            if name.endswith(".log") and name[:-4].isdigit()
+        )
+        self._cursor = self._load_cursor()
+
+        #Segments may have been removed while we were down
+        if self._cursor[0] not in self._segments:
+            if self._segments:
+                self._cursor = (self._segments[0], 0)
+            else:
+                self._cursor = (self._cursor[0] + 1, 0)
+
+    # -------------------------------
+    # Files
+    # -------------------------------
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:010d}.log")
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, self.CURSOR_FILE)) as f:
+                data = json.load(f)
+            return (int(data["segment"]), int(data["offset"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            first = self._segments[0] if self._segments else 0
+            return (first, 0)
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, self.CURSOR_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"segment": self._cursor[0], "offset": self._cursor[1]}, f)
+        #Atomic so a crash leaves either the old or the new cursor
+        os.replace(tmp, path)
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _size(self, segment):
+        try:
+            return os.path.getsize(self._path(segment))
+        except OSError:
+            return 0
+
+    def _delete_segment(self, segment):
+        if self._segments and segment == self._segments[-1]:
+            self._close_writer()
+        try:
+            os.remove(self._path(segment))
+        except FileNotFoundError:
+            pass
+        self._segments.remove(segment)
+
+    # -------------------------------
+    # Queue operations
+    # -------------------------------
+    def append(self, record):
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+
+        with self._lock:
+            if not self._segments or self._size(self._segments[-1]) >= self.segment_bytes:
+                self._close_writer()
+                self._segments.append(self._segments[-1] + 1 if self._segments else self._cursor[0])
+
+            if self._writer is None:
+                self._writer = open(self._path(self._segments[-1]), "ab")
+            self._writer.write(line)
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+
+            self._evict()
+
+    def _evict(self):
+        total = sum(self._size(s) for s in self._segments)
+        while total > self.max_bytes and len(self._segments) > 1:
+            oldest = self._segments[0]
+            size = self._size(oldest)
+            segment, offset = self._cursor
+            if segment <= oldest:
+                self.evicted_bytes += size - (offset if segment == oldest else 0)
+            self._delete_segment(oldest)
+            total -= size
+
+            if self._cursor[0] <= oldest:
+                self._cursor = (self._segments[0], 0)
+                self._save_cursor()
+            logging.warning(f"[spool] Size cap reached, evicted segment {oldest}")
+
+    def read_batch(self, max_records):
+        """
+        Up to max_records unacknowledged records, oldest first, plus the
+        position to pass to ack() once they have been delivered.
+        """
+        records = []
+        with self._lock:
+            segment, offset = self._cursor
+            for seg in [s for s in self._segments if s >= segment]:
+                if seg != segment:
+                    offset = 0
+                last = seg == self._segments[-1]
+                with open(self._path(seg), "rb") as f:
+                    f.seek(offset)
+                    while len(records) < max_records:
+                        line = f.readline()
+                        if not line:
+                            break
+                        if not line.endswith(b"\n"):
+                            #Half-written tail: wait for the writer to finish it
+                            if last:
+                                break
+                        else:
+                            try:
+                                records.append(json.loads(line))
+                            except ValueError:
+                                logging.warning(f"[spool] Skipping corrupt record in segment {seg}")
+                        offset = f.tell()
+                segment = seg
+                if len(records) >= max_records:
+                    break
+
+        return records, (segment, offset)
+
+    def ack(self, position):
+        """Drop everything up to position (from read_batch)."""
+        with self._lock:
+            if position < self._cursor:
+                return
+            segment, offset = position
+            for seg in [s for s in self._segments if s < segment]:
+                self._delete_segment(seg)
+
+            #A fully read segment that is no longer being written can go too
+            if self._segments and segment != self._segments[-1] and offset >= self._size(segment):
+                self._delete_segment(segment)
+                segment, offset = self._segments[0], 0
+
+            self._cursor = (segment, offset)
+            self._save_cursor()
+
+    def is_empty(self):
+        with self._lock:
+            if not self._segments:
+                return True
+            segment, offset = self._cursor
+            return segment == self._segments[-1] and offset >= self._size(segment)
+
+    def pending_bytes(self):
+        with self._lock:
+            segment, offset = self._cursor
+            return sum(self._size(s) for s in self._segments if s >= segment) - offset
+
+    def close(self):
+        with self._lock:
+            self._close_writer()
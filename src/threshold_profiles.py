@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import time
+
+#Per-Pi, per-sensor (min, max) limits read from a JSON file:
+#  {
+#    "default": {"temperature": [18, 26], "humidity": [40, 70]},
+#    "pis": {"pi-12": {"temperature": [20, 24]}}
+#  }
+#Anything the file leaves out falls back to the defaults it was built
+#with (the TEMP_/HUMIDITY_ environment variables). The file is checked
+#for changes at most every CHECK_INTERVAL seconds and a new version
+#replaces the old in one step; a file that doesn't parse is logged and
+#the previous limits stay in force. Write it with a rename to be safe.
+
+#Seconds between looks at the file's mtime
+CHECK_INTERVAL = 2.0
+
+def _limits(value, where):
+    try:
+        if not isinstance(value, (list, tuple)):
+            raise TypeError
+        low, high = (float(v) for v in value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{where}: expected [min, max], got {value!r}")
+    if low > high:
+        raise ValueError(f"{where}: min {low} is above max {high}")
+    return (low, high)
+
+class ThresholdProfiles:
+    """Compiled limits: one dict lookup per (pi_id, sensor)."""
+
+    def __init__(self, defaults, pis=None):
+        self.defaults = {sensor: _limits(v, f"default.{sensor}") for sensor, v in defaults.items()}
+        #Every Pi with overrides gets a full row, so lookups never merge
+        self._table = {}
+        for pi_id, overrides in (pis or {}).items():
+            limits = dict(self.defaults)
+            limits.update((sensor, _limits(v, f"pis.{pi_id}.{sensor}")) for sensor, v in overrides.items())
+            for sensor, pair in limits.items():
+                self._table[(pi_id, sensor)] = pair
+
+    @classmethod
+    def from_config(cls, config, defaults):
+        """Profiles from a parsed config file layered over defaults."""
+        default = config.get("default", {}) if isinstance(config, dict) else None
+        pis = config.get("pis", {}) if isinstance(config, dict) else None
+        if not isinstance(default, dict) or not isinstance(pis, dict) \
+                or not all(isinstance(v, dict) for v in pis.values()):
+            raise ValueError("expected {\"default\": {sensor: [min, max]}, \"pis\": {pi_id: {...}}}")
+        return cls({**defaults, **default}, pis)
+
+    def limits(self, sensor, pi_id=None):
+        """(min, max) for a sensor on a Pi, or the default for the sensor."""
+        pair = self._table.get((pi_id, sensor))
+        return pair if pair is not None else self.defaults[sensor]
+
+    def pis(self):
+        """Pis that have limits of their own."""
+        return {pi_id for pi_id, _ in self._table}
+
+class ThresholdStore:
+    """The current ThresholdProfiles for a config file, reloaded on change."""
+
+    def __init__(self, path, defaults, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.defaults = dict(defaults)
+        self.check_interval = check_interval
+        self.profiles = ThresholdProfiles(self.defaults)
+        self._stamp = None
+        self._next_check = 0.0
+
+    def current(self):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self.check()
+        return self.profiles
+
+    def limits(self, sensor, pi_id=None):
+        return self.current().limits(sensor, pi_id)
+
+    def check(self):
+        """Reload if the file changed since the last look. True if it did."""
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._stamp:
+            return False
+        #Remembered even if loading fails, so a bad file is reported once
+        self._stamp = stamp
+
+        if stamp is None:
+            self.profiles = ThresholdProfiles(self.defaults)
+            logging.info(f"No threshold file at {self.path}, using defaults")
+            return True
+        try:
+            with open(self.path) as f:
+                profiles = ThresholdProfiles.from_config(json.load(f), self.defaults)
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring threshold file {self.path}: {e}")
+            return False
+        self.profiles = profiles
+        logging.info(f"Loaded thresholds from {self.path} ({len(profiles.pis())} Pi profile(s))")
+        return True
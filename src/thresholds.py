@@ -2,7 +2,8 @@ from datetime import datetime
 import logging
 import os
 from dotenv import load_dotenv
-from src.sensor_db import store_result as db_store_result
+from src import profiling
+from src.threshold_profiles import ThresholdStore
 
 #logging.basicConfig(level=loggingINFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
@@ -19,8 +20,25 @@ HUMIDITY_THRESHOLD = (
     float(os.getenv("HUMIDITY_MAX", 70.0)),
 )
 
-def evaluate_sensor(value, min_thresh, max_thresh):
-    if value is None:
+#Per-Pi limits layered over the ones above; edits apply without a restart
+THRESHOLDS_FILE = os.getenv("THRESHOLDS_FILE", "thresholds.json")
+PROFILES = ThresholdStore(THRESHOLDS_FILE, {
+    "temperature": TEMP_THRESHOLD,
+    "humidity": HUMIDITY_THRESHOLD,
+})
+
+#Every status evaluate_sensor can return
+STATUSES = ("LOW", "STABLE", "HIGH", "INVALID")
+
+def evaluate_sensor(value, min_thresh=None, max_thresh=None, sensor=None, pi_id=None):
+    """
+    Classify one value. Without explicit limits, the current profile's
+    limits for sensor on pi_id are used.
+    """
+    if min_thresh is None:
+        min_thresh, max_thresh = PROFILES.limits(sensor, pi_id)
+    #NaN fails every comparison, so without the check it would read as HIGH
+    if value is None or value != value:
         return "INVALID"
     elif value < min_thresh:
         return "LOW"
@@ -29,14 +47,42 @@ def evaluate_sensor(value, min_thresh, max_thresh):
     else:
         return "HIGH"
 
+def evaluate_sensor_codes(values, min_thresh, max_thresh):
+    """
+    evaluate_sensor over a whole array at once, as indexes into STATUSES.
+    values may hold None or NaN for missing readings.
+    """
+    #Imported here so readers and the API don't pay for numpy at startup
+    try:
+        import numpy as np
+    except ImportError:
+        raise RuntimeError("Batch evaluation needs numpy: pip install -r requirements.txt")
+    values = np.asarray(values, dtype=float)
+    return np.select(
+        [np.isnan(values), values < min_thresh, values <= max_thresh],
+        [STATUSES.index("INVALID"), STATUSES.index("LOW"), STATUSES.index("STABLE")],
+        STATUSES.index("HIGH"),
+    ).astype(np.int8)
+
+def evaluate_sensor_batch(values, min_thresh, max_thresh):
+    """Array of the status evaluate_sensor gives each value."""
+    import numpy as np
+    codes = evaluate_sensor_codes(values, min_thresh, max_thresh)
+    return np.array(STATUSES)[codes]
+
 def store_result(result):
+    #Only the host stores results; clients never load the database module
+    from src.sensor_db import store_result as db_store_result
     db_store_result(result)
 
-def process_sensor_reading(sensor_data):
-    now = datetime.now()
-    results = []
+@profiling.stage("evaluate_sensor_reading")
+def evaluate_sensor_reading(sensor_data, pi_id=None):
+    """Build the result rows for one reading without storing them."""
+    pi_id = pi_id or sensor_data.get("pi_id")
+    #Timezone-aware so readings from different Pis compare correctly
+    now = datetime.now().astimezone()
 
-    temp_status = evaluate_sensor(sensor_data.get("temperature"), *TEMP_THRESHOLD)
+    temp_status = evaluate_sensor(sensor_data.get("temperature"), sensor="temperature", pi_id=pi_id)
     temp_result = {
         "timestamp": now,
         "sensor": "temperature",
@@ -44,7 +90,7 @@ def process_sensor_reading(sensor_data):
         "status": temp_status
     }
 
-    humidity_status = evaluate_sensor(sensor_data.get("humidity"), *HUMIDITY_THRESHOLD)
+    humidity_status = evaluate_sensor(sensor_data.get("humidity"), sensor="humidity", pi_id=pi_id)
     humidity_result = {
         "timestamp": now,
         "sensor": "humidity",
@@ -52,7 +98,13 @@ def process_sensor_reading(sensor_data):
         "status": humidity_status
     }
 
-    for r in [temp_result, humidity_result]:
+    return [temp_result, humidity_result]
+
+@profiling.stage("process_sensor_reading")
+def process_sensor_reading(sensor_data, pi_id=None):
+    results = []
+
+    for r in evaluate_sensor_reading(sensor_data, pi_id):
         logging.info(f"Sensor check: {r}")
         store_result(r)
         results.append(r)
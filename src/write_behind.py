@@ -0,0 +1,113 @@
+import threading
+import logging
+from collections import deque
+
+#What put() does when the queue is full
+OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+class WriteBehindQueue:
+    """
+    Bounded queue drained by background worker thread(s), so slow work
+    (SQLite, HTTP) never runs on the caller's thread. Workers hand the
+    handler up to batch_size items at a time.
+    """
+
+    def __init__(self, handler, maxsize = 1000, overflow = "drop_oldest",
+                 workers = 1, batch_size = 100, name = "write-behind"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}")
+        self.handler = handler
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.name = name
+
+        self.processed = 0 #Items handled successfully
+        self.failed = 0 #Items whose handler call raised
+        self.dropped = 0 #Items lost to the overflow policy
+
+        self._items = deque()
+        self._in_flight = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for t in self._threads:
+            t.start()
+        return self
+
+    def put(self, item, timeout = None):
+        """Queue an item. Returns False if it was dropped instead."""
+        with self._cond:
+            if self._closed:
+                self.dropped += 1
+                return False
+
+            if len(self._items) >= self.maxsize:
+                if self.overflow == "drop_newest":
+                    self.dropped += 1
+                    return False
+                elif self.overflow == "drop_oldest":
+                    self._items.popleft()
+                    self.dropped += 1
+                elif not self._cond.wait_for(
+                    lambda: len(self._items) < self.maxsize or self._closed, timeout
+                ) or self._closed:
+                    self.dropped += 1
+                    return False
+
+            self._items.append(item)
+            self._cond.notify_all()
+            return True
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def flush(self, timeout = None):
+        """Wait until everything queued so far has been handled."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._items and not self._in_flight, timeout
+            )
+
+    def stop(self, timeout = None):
+        """Stop accepting items, drain what is queued and stop the workers."""
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for t in self._threads:
+            if t.is_alive():
+                t.join(timeout)
+        return flushed
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._items or self._closed)
+                if not self._items:
+                    return
+                batch = [self._items.popleft() for _ in range(min(self.batch_size, len(self._items)))]
+                self._in_flight += len(batch)
+                #Wake producers blocked on a full queue
+                self._cond.notify_all()
+
+            try:
+                self.handler(batch)
+                ok = True
+            except Exception as e:
+                ok = False
+                logging.error(f"[{self.name}] Handler failed for {len(batch)} item(s): {e}")
+
+            with self._cond:
+                self._in_flight -= len(batch)
+                if ok:
+                    self.processed += len(batch)
+                else:
+                    self.failed += len(batch)
+                self._cond.notify_all()
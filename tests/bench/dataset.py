@@ -0,0 +1,98 @@
+import os
+import random
+import logging
+from src import sensor_db
+
+#Synthetic databases for the benchmarks. The same (rows, pis, seed)
+#always gives the same file, and timestamps are fixed so a cached copy
+#stays comparable between runs.
+
+#Newest reading in every dataset (2025-01-01T00:00:00Z)
+DATASET_END = 1735689600
+
+#Seconds between readings of one Pi's sensor
+INTERVAL = 10
+
+_CHUNK = 100000
+
+def _readings(rows, pi_ids, sensor_ids, seed):
+    rng = random.Random(seed)
+    status = sensor_db.STATUS_IDS
+    per_step = len(pi_ids) * len(sensor_ids)
+    steps = -(-rows // per_step)
+    start = DATASET_END - (steps - 1) * INTERVAL
+
+    emitted = 0
+    for step in range(steps):
+        ts = start + step * INTERVAL
+        for pi in pi_ids:
+            for sensor, sensor_id in sensor_ids.items():
+                if emitted == rows:
+                    return
+                emitted += 1
+                if rng.random() < 0.001:
+                    yield (ts, pi, sensor_id, status["INVALID"], None)
+                    continue
+                if sensor == "temperature":
+                    value = round(rng.gauss(22.0, 3.0), 2)
+                    low, high = 18.0, 26.0
+                else:
+                    value = round(rng.gauss(50.0, 10.0), 2)
+                    low, high = 35.0, 65.0
+                state = "LOW" if value < low else "HIGH" if value > high else "STABLE"
+                yield (ts, pi, sensor_id, status[state], value)
+
+def build_dataset(path, rows, pis=50, seed=0):
+    """
+    Create a database at path holding rows readings spread evenly over
+    pis Pis and both sensors, ending at DATASET_END. The rollup trigger
+    is dropped during the load and the rollups rebuilt in one pass.
+    """
+    old_path = sensor_db.DB_PATH
+    sensor_db.DB_PATH = path
+    try:
+        sensor_db.init_db()
+        con = sensor_db.get_connection()
+        con.execute("PRAGMA synchronous = OFF")
+        trigger = con.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'readings_rollup'"
+        ).fetchone()[0]
+
+        with con:
+            con.execute("DROP TRIGGER readings_rollup")
+            pi_ids = [sensor_db._lookup_id(con, "pis", f"pi-{i:03d}") for i in range(pis)]
+            sensor_ids = {name: sensor_db._lookup_id(con, "sensors", name)
+                          for name in ("temperature", "humidity")}
+
+        readings = _readings(rows, pi_ids, sensor_ids, seed)
+        loaded = 0
+        while loaded < rows:
+            chunk = [row for _, row in zip(range(_CHUNK), readings)]
+            with con:
+                con.executemany("""
+                    INSERT INTO readings (ts, pi_id, sensor_id, status_id, value)
+                    VALUES (?, ?, ?, ?, ?)
+                """, chunk)
+            loaded += len(chunk)
+
+        with con:
+            sensor_db._backfill_rollups(con)
+            con.execute(trigger)
+        con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        logging.info(f"Built {path} with {loaded} readings from {pis} Pis")
+    finally:
+        sensor_db.close_connection()
+        sensor_db.DB_PATH = old_path
+
+def cached_dataset(cache_dir, rows, pis=50, seed=0):
+    """Path of a built dataset in cache_dir, building it on first use."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"readings-{rows}-{pis}-{seed}.db")
+    if not os.path.exists(path):
+        tmp = path + ".building"
+        for leftover in (tmp, tmp + "-wal", tmp + "-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        build_dataset(tmp, rows, pis=pis, seed=seed)
+        os.replace(tmp, path)
+    return path
@@ -0,0 +1,89 @@
+"""
+Import-time benchmark for each entry point.
+
+    python -m tests.bench.imports
+    python -m tests.bench.imports --out imports-before.json
+    python -m tests.bench.imports --compare imports-before.json
+
+Every entry point is imported in a fresh interpreter --repeat times; the
+median milliseconds the import took are reported, with the heavy or
+hardware modules it pulled in along the way.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ENTRY_POINTS = ("api", "serve", "main", "client_sender", "host")
+
+#Modules an entry point ideally only loads when it needs them
+WATCHED = ("sense_hat", "gpiozero", "numpy", "dotenv", "src.sensor_db", "requests", "flask")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {watched!r} if m in sys.modules]}}))
+"""
+
+def measure(module, repeat):
+    env = dict(os.environ)
+    #Off a Pi, gpiozero needs the mock pin factory to claim pins at all
+    env.setdefault("GPIOZERO_PIN_FACTORY", "mock")
+    times = []
+    loaded = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, watched=WATCHED)],
+            capture_output=True, text=True, env=env, timeout=120,
+        )
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"
+            return {"error": error}
+        #Entry points may print while importing; the probe's line is last
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        times.append(result["ms"])
+        loaded = result["loaded"]
+    return {"median_ms": statistics.median(times), "best_ms": min(times), "loaded": loaded}
+
+def _describe(result):
+    if "error" in result:
+        return f"{'failed':>10}     {result['error']}"
+    return f"{result['median_ms']:>10.1f} ms  {', '.join(result['loaded']) or '-'}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time importing each entry point")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per entry point")
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file to compare against")
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    for module in args.modules:
+        results[module] = result = measure(module, args.repeat)
+        line = f"{module:<14} {_describe(result)}"
+        old = baseline.get(module)
+        if old is not None:
+            if "median_ms" in old and "median_ms" in result:
+                line += f"  (was {old['median_ms']:.1f} ms, x{result['median_ms'] / old['median_ms']:.2f})"
+            elif "error" in old:
+                line += "  (failed before)"
+        print(line)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
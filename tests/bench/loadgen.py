@@ -0,0 +1,286 @@
+"""
+Fleet load generator: many virtual client Pis posting to a running api.py.
+
+    python -m tests.bench.loadgen --pis 200 --duration 60
+    python -m tests.bench.loadgen --steps 50,100,200,400,800 --duration 30 --spawn
+
+Each virtual Pi sends DataSender's /remote-data payload every --interval
+seconds (+/- --jitter), from a random phase. With --outage-rate a Pi
+goes quiet for --outage-seconds now and then and, like DataSender's
+spool, delivers what it missed as one /remote-data/batch when it is back.
+
+Reports accepted requests and readings per second (only readings the host
+says it stored; ones it refused are counted as rejected), ingest latency
+percentiles, errors, how far the generator fell behind its own schedule
+(if that grows, the generator and not the host is the bottleneck) and
+how much the database grew. --spawn starts api.py on a scratch database,
+listening on the port in --url.
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import sqlite3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import requests
+
+from src.http_client import make_session
+from src.thresholds import TEMP_THRESHOLD, HUMIDITY_THRESHOLD, evaluate_sensor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class VirtualPi:
+    def __init__(self, pi_id, interval, jitter, outage_rate, outage_seconds, rng):
+        self.pi_id = pi_id
+        self.interval = interval
+        self.jitter = jitter
+        self.outage_rate = outage_rate
+        self.outage_seconds = outage_seconds
+        self.rng = rng
+        self.offline_until = 0.0
+        self.backlog = []
+
+    def next_delay(self):
+        return max(0.0, self.interval * (1 + self.rng.uniform(-self.jitter, self.jitter)))
+
+    def reading(self):
+        """One reading in DataSender.send_data's format."""
+        temperature = round(self.rng.gauss(22.0, 3.0), 2)
+        humidity = round(self.rng.gauss(50.0, 10.0), 2)
+        return {
+            "temperature": temperature,
+            "humidity": humidity,
+            "temp_status": evaluate_sensor(temperature, *TEMP_THRESHOLD),
+            "humidity_status": evaluate_sensor(humidity, *HUMIDITY_THRESHOLD),
+            "pi_id": self.pi_id,
+            "timestamp": datetime.now().astimezone().isoformat(),
+        }
+
+    def tick(self, now):
+        """(path, payload, reading count) to send now, or None while offline."""
+        reading = self.reading()
+        if now < self.offline_until:
+            self.backlog.append(reading)
+            return None
+        if self.outage_rate and self.rng.random() < self.outage_rate:
+            self.offline_until = now + self.outage_seconds
+            self.backlog.append(reading)
+            return None
+        if self.backlog:
+            batch, self.backlog = self.backlog + [reading], []
+            return "/remote-data/batch", batch, len(batch)
+        return "/remote-data", reading, 1
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.lags = []
+        self.outcomes = Counter()
+        self.readings = 0 #Readings the host reported as stored
+        self.rejected = 0 #Readings the host refused to store
+
+    def record(self, outcome, latency=None, lag=None, accepted=0, rejected=0):
+        with self._lock:
+            self.outcomes[outcome] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+            if lag is not None:
+                self.lags.append(lag)
+            self.readings += accepted
+            self.rejected += rejected
+
+def percentiles(values):
+    """(p50, p95, p99) of values, in the same unit."""
+    if not values:
+        return (None, None, None)
+    if len(values) == 1:
+        return (values[0],) * 3
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return (cuts[49], cuts[94], cuts[98])
+
+def db_size(path):
+    """(rows, bytes) of the database at path, WAL included."""
+    if not path or not os.path.exists(path):
+        return (None, None)
+    size = sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+    con = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = con.execute("SELECT COALESCE(MAX(id), 0) FROM readings").fetchone()[0]
+    except sqlite3.Error:
+        rows = None
+    finally:
+        con.close()
+    return (rows, size)
+
+def run_stage(url, pis, args, seed):
+    rng = random.Random(seed)
+    fleet = [
+        VirtualPi(f"load-{i:04d}", args.interval, args.jitter, args.outage_rate,
+                  args.outage_seconds, random.Random(rng.random()))
+        for i in range(pis)
+    ]
+    stats = Stats()
+    local = threading.local()
+
+    def send(path, payload, readings, due):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = make_session(pool_size=1)
+        started = time.monotonic()
+        try:
+            resp = session.post(f"{url}{path}", json=payload, timeout=(3.05, 10))
+            latency = time.monotonic() - started
+            accepted = readings if resp.status_code == 200 else 0
+            if resp.status_code == 200 and path.endswith("/batch"):
+                #A batch is answered 200 even if some items were refused
+                accepted = resp.json().get("accepted", 0)
+            #Readings the host answered for but wouldn't store (not ones it
+            #was too busy for: those count under the outcome only)
+            refused = readings - accepted if resp.status_code in (200, 400, 413, 422) else 0
+            stats.record(str(resp.status_code), latency, started - due, accepted, refused)
+        except requests.exceptions.Timeout:
+            stats.record("timeout", lag=started - due)
+        except requests.exceptions.RequestException:
+            stats.record("connection error", lag=started - due)
+
+    start = time.monotonic()
+    end = start + args.duration
+    schedule = [(start + rng.uniform(0, args.interval), i) for i in range(pis)]
+    heapq.heapify(schedule)
+
+    submitted = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        while schedule:
+            due, i = heapq.heappop(schedule)
+            if due >= end:
+                break
+            time.sleep(max(0.0, due - time.monotonic()))
+            message = fleet[i].tick(due)
+            if message is not None:
+                pool.submit(send, *message, due)
+                submitted += 1
+            heapq.heappush(schedule, (due + fleet[i].next_delay(), i))
+        #Requests in flight finish; ones still queued when time is up mean
+        #the host (or the generator) could not keep pace
+        pool.shutdown(wait=True, cancel_futures=True)
+    elapsed = max(args.duration, time.monotonic() - start)
+
+    p50, p95, p99 = percentiles(stats.latencies)
+    requests_sent = sum(stats.outcomes.values())
+    return {
+        "pis": pis,
+        "seconds": round(elapsed, 2),
+        "requests": requests_sent,
+        "unsent": submitted - requests_sent,
+        "accepted_rps": round(stats.outcomes["200"] / elapsed, 2),
+        "readings_per_second": round(stats.readings / elapsed, 2),
+        "rejected_readings": stats.rejected,
+        "latency_ms": {name: round(v * 1000, 2) if v is not None else None
+                       for name, v in zip(("p50", "p95", "p99"), (p50, p95, p99))},
+        "error_rate": round(1 - stats.outcomes["200"] / requests_sent, 4) if requests_sent else None,
+        "outcomes": dict(stats.outcomes),
+        "schedule_lag_p99_ms": round(percentiles(stats.lags)[2] * 1000, 2) if stats.lags else None,
+    }
+
+def spawn_api(db_path, url, timeout=30):
+    #Serve on the port in url, and refuse if something already holds it:
+    #the run would otherwise quietly measure that server instead
+    parsed = urlsplit(url)
+    host, port = parsed.hostname or "127.0.0.1", parsed.port or 80
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.settimeout(1)
+        if sock.connect_ex((host, port)) == 0:
+            raise RuntimeError(f"{host}:{port} is already in use; stop that server or pick another --url")
+    env = dict(os.environ, SENSOR_DB_PATH=db_path, API_PORT=str(port))
+    proc = subprocess.Popen([sys.executable, "api.py"], env=env, cwd=REPO_ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{url}/live", timeout=1)
+            return proc
+        except requests.exceptions.RequestException:
+            if proc.poll() is not None:
+                raise RuntimeError("api.py exited during start-up")
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"api.py did not answer on {url} within {timeout}s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a fleet of client Pis")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="api.py base URL")
+    parser.add_argument("--pis", type=int, default=100, help="virtual Pis (ignored with --steps)")
+    parser.add_argument("--steps", help="comma separated fleet sizes to run one after another")
+    parser.add_argument("--duration", type=float, default=60, help="seconds per stage")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between readings")
+    parser.add_argument("--jitter", type=float, default=0.1, help="interval jitter fraction")
+    parser.add_argument("--outage-rate", type=float, default=0.0,
+                        help="chance per reading that a Pi drops off the network")
+    parser.add_argument("--outage-seconds", type=float, default=60, help="length of each outage")
+    parser.add_argument("--workers", type=int, default=64, help="concurrent requests")
+    parser.add_argument("--db", default=os.getenv("SENSOR_DB_PATH", "src/sensor_data.db"),
+                        help="database file to measure growth of")
+    parser.add_argument("--spawn", action="store_true",
+                        help="start api.py on a scratch database, on --url's port, and stop it afterwards")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="FILE", help="also write the results here")
+    args = parser.parse_args(argv)
+
+    steps = [int(n) for n in args.steps.split(",")] if args.steps else [args.pis]
+
+    proc = None
+    scratch = None
+    if args.spawn:
+        scratch = tempfile.mkdtemp(prefix="loadgen-")
+        args.db = os.path.join(scratch, "readings.db")
+        proc = spawn_api(args.db, args.url)
+
+    results = []
+    try:
+        for pis in steps:
+            rows_before, bytes_before = db_size(args.db)
+            result = run_stage(args.url, pis, args, args.seed)
+            rows_after, bytes_after = db_size(args.db)
+            if rows_before is not None and rows_after is not None:
+                result["db_rows_added"] = rows_after - rows_before
+            if bytes_before is not None:
+                result["db_bytes_added"] = bytes_after - bytes_before
+            results.append(result)
+
+            lat = result["latency_ms"]
+            errors = f"{result['error_rate']:.2%}" if result["error_rate"] is not None else "-"
+            print(f"{pis:>6} pis  {result['seconds']:>6.1f} s  {result['accepted_rps']:>8.1f} req/s  "
+                  f"{result['readings_per_second']:>8.1f} readings/s  "
+                  f"p50 {lat['p50']} p95 {lat['p95']} p99 {lat['p99']} ms  "
+                  f"errors {errors}  rejected {result['rejected_readings']}  unsent {result['unsent']}  "
+                  f"lag p99 {result['schedule_lag_p99_ms']} ms  "
+                  f"db +{result.get('db_rows_added', '?')} rows "
+                  f"+{result.get('db_bytes_added', '?')} bytes")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+        if scratch is not None:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
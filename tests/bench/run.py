@@ -0,0 +1,182 @@
+"""
+Storage and API benchmarks.
+
+    python -m tests.bench.run                      #10k and 1m rows
+    python -m tests.bench.run --sizes 10k,1m,10m --out bench.json
+    python -m tests.bench.run --compare bench.json --threshold 0.2
+
+Datasets are built once into --cache-dir and copied per run, so write
+benchmarks never change the cached file. Results are median and best
+milliseconds per operation; --compare exits 1 if any median got slower
+than the baseline by more than --threshold (a fraction).
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock
+
+import api
+from src import sensor_db, live_cache
+from tests.bench.dataset import cached_dataset, DATASET_END
+
+SIZES = {"10k": 10000, "1m": 1000000, "10m": 10000000}
+
+DEFAULT_SIZES = "10k,1m"
+
+def measure(fn, repeat=5, number=20):
+    """Median and best milliseconds per call of fn over repeat rounds of number calls."""
+    fn()  #warm caches and lazy setup
+    per_call = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - start) * 1000 / number)
+    return {
+        "median_ms": round(statistics.median(per_call), 4),
+        "best_ms": round(min(per_call), 4),
+        "calls": repeat * number,
+    }
+
+def _reading(pi_id="bench-pi"):
+    return {"pi_id": pi_id, "sensor": "temperature", "value": 21.5, "status": "STABLE",
+            "timestamp": datetime.fromtimestamp(DATASET_END).astimezone().isoformat()}
+
+def cases(client):
+    """(name, fn, calls per round) for every benchmark."""
+    def store_result():
+        sensor_db.store_result({"timestamp": datetime.now(), "sensor": "temperature",
+                                "value": 21.5, "status": "STABLE"})
+
+    def get(url):
+        def call():
+            resp = client.get(url)
+            resp.get_data()
+            assert resp.status_code == 200, resp.status_code
+        return call
+
+    def post_remote():
+        resp = client.post("/remote-data", json=_reading())
+        assert resp.status_code == 200, resp.status_code
+
+    return [
+        ("store_result", store_result, 50),
+        ("store_remote_data", lambda: sensor_db.store_remote_data(_reading()), 50),
+        ("get_recent_data", lambda: sensor_db.get_recent_data(10000), 2),
+        ("get_recent_data_one_pi", lambda: sensor_db.get_recent_data(1000, pi_id="pi-007"), 10),
+        ("get_latest_per_pi", sensor_db.get_latest_per_pi, 10),
+        ("route_live", get("/live"), 50),
+        ("route_history", get("/history"), 2),
+        ("route_history_1h", get("/history?window=1h"), 5),
+        ("route_history_7d", get("/history?window=7d"), 5),
+        ("route_history_7d_columnar", get("/history?window=7d&format=columnar"), 5),
+        ("route_remote_data", post_remote, 50),
+    ]
+
+def run_size(label, rows, cache_dir, repeat):
+    source = cached_dataset(cache_dir, rows)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    path = os.path.join(workdir, "readings.db")
+    shutil.copyfile(source, path)
+
+    old_path = sensor_db.DB_PATH
+    sensor_db.DB_PATH = path
+    live_cache.reset()
+    results = {}
+    try:
+        #Window queries are relative to now; pin it to the dataset's end
+        with mock.patch.object(api.time, "time", return_value=DATASET_END):
+            client = api.app.test_client()
+            for name, fn, number in cases(client):
+                results[name] = measure(fn, repeat=repeat, number=number)
+                print(f"{label:>4} {name:<28} {results[name]['median_ms']:>10.3f} ms")
+    finally:
+        sensor_db.close_connection()
+        sensor_db.DB_PATH = old_path
+        live_cache.reset()
+        shutil.rmtree(workdir)
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline, current, threshold):
+    """Lines describing every shared benchmark, and the list of regressions."""
+    lines = []
+    regressions = []
+    for size, cases_ in current["results"].items():
+        for name, result in cases_.items():
+            old = baseline.get("results", {}).get(size, {}).get(name)
+            if not old:
+                continue
+            ratio = result["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  REGRESSION"
+                regressions.append((size, name, ratio))
+            lines.append(f"{size:>4} {name:<28} {old['median_ms']:>10.3f} -> "
+                         f"{result['median_ms']:>10.3f} ms  x{ratio:.2f}{flag}")
+    return lines, regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the storage and API layers")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"comma separated, from {', '.join(SIZES)} (default {DEFAULT_SIZES})")
+    parser.add_argument("--out", default="bench-results.json", help="where to write results")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown fraction that counts as a regression (default 0.2)")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per benchmark")
+    parser.add_argument("--cache-dir", default=os.path.join(tempfile.gettempdir(), "sensor-bench"),
+                        help="where built datasets are kept between runs")
+    args = parser.parse_args(argv)
+
+    sizes = [s.strip().lower() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)}")
+
+    current = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "date": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    for size in sizes:
+        current["results"][size] = run_size(size, SIZES[size], args.cache_dir, args.repeat)
+
+    with open(args.out, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        lines, regressions = compare(baseline, current, args.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) slower than baseline by more than "
+                  f"{args.threshold:.0%}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
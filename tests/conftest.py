@@ -0,0 +1,14 @@
+import os
+
+#Tests never drive real pins: gpiozero uses its mock pin factory even on
+#a Pi, and whatever claims a pin gets a simulated one
+os.environ["GPIOZERO_PIN_FACTORY"] = "mock"
+
+try:
+    from gpiozero import Device
+    from gpiozero.pins.mock import MockFactory
+except ImportError:
+    Device = None
+
+if Device is not None:
+    Device.pin_factory = MockFactory()
@@ -0,0 +1,44 @@
+from unittest.mock import Mock
+
+from src.actuators import Actuator
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_only_transitions_are_written():
+    device = Mock()
+    relay = Actuator("fan", device)
+
+    assert relay.on()
+    assert not relay.on()
+    assert relay.off()
+
+    assert device.on.call_count == 1
+    assert device.off.call_count == 1
+    assert relay.switches == 1
+
+def test_minimum_on_and_off_times():
+    clock = FakeClock()
+    device = Mock()
+    relay = Actuator("heater", device, min_on=60, min_off=30, clock=clock)
+
+    relay.on()
+    clock.now = 59
+    assert not relay.off()
+    clock.now = 60
+    assert relay.off()
+
+    clock.now = 80
+    assert not relay.on()
+    clock.now = 90
+    assert relay.on()
+    assert relay.held == 2
+
+    #Shutdown doesn't wait out the minimum on time
+    clock.now = 91
+    assert relay.off(force=True)
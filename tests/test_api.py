@@ -0,0 +1,381 @@
+import os
+import gzip
+import json
+import sqlite3
+import tempfile
+import threading
+import pytest
+from datetime import datetime, timedelta
+from src import sensor_db, live_cache
+from src.deadband import Deadband
+import api
+from src.history_format import COLUMNAR_MIMETYPE, from_binary
+
+@pytest.fixture
+def client(monkeypatch):
+    #Point the API at a fresh temporary database
+    tmpfile = tempfile.NamedTemporaryFile(delete=False)
+    tmpfile.close()
+    monkeypatch.setattr(sensor_db, "DB_PATH", tmpfile.name)
+    sensor_db.init_db()
+    live_cache.reset()
+    yield api.app.test_client()
+    live_cache.reset()
+    sensor_db.close_connection()
+    os.remove(tmpfile.name)
+
+def test_remote_data_batch_stores_readings(client):
+    readings = [
+        {"pi_id": "pi-1", "temperature": 21.0, "humidity": 45.0},
+        {"pi_id": "pi-2", "sensor": "humidity", "value": 55.5, "status": "STABLE"},
+        {"pi_id": "pi-2", "sensor": "humidity"},
+    ]
+
+    resp = client.post("/remote-data/batch", json=readings)
+
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["accepted"] == 2
+    assert body["rejected"] == 1
+    assert body["rows"] == 3
+    assert len(sensor_db.get_recent_data()) == 3
+
+def test_remote_data_batch_accepts_wrapped_list(client):
+    resp = client.post("/remote-data/batch", json={"readings": [{"pi_id": "pi-1", "temperature": 20.0}]})
+
+    assert resp.status_code == 200
+    assert resp.get_json()["accepted"] == 1
+
+def test_remote_data_batch_rejects_empty(client):
+    resp = client.post("/remote-data/batch", json=[])
+
+    assert resp.status_code == 400
+
+def test_remote_data_batch_rejects_oversized(client, monkeypatch):
+    monkeypatch.setattr(api, "MAX_BATCH_SIZE", 2)
+
+    resp = client.post("/remote-data/batch", json=[{"temperature": 20.0}] * 3)
+
+    assert resp.status_code == 413
+
+def test_remote_data_rejects_invalid_reading(client):
+    resp = client.post("/remote-data", json={"pi_id": "pi-1", "humidity": "wet"})
+
+    assert resp.status_code == 400
+    assert sensor_db.get_recent_data() == []
+
+def test_remote_data_reports_store_failure(client, monkeypatch):
+    def locked(results):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(sensor_db, "store_results", locked)
+
+    resp = client.post("/remote-data", json={"pi_id": "pi-1", "temperature": 20.0})
+
+    assert resp.status_code == 500
+
+def test_config_reports_offline_threshold(client):
+    assert client.get("/config").get_json() == {"offline_after": api.OFFLINE_AFTER}
+    assert f"sensor_offline_after_seconds {api.OFFLINE_AFTER:g}" in client.get("/metrics").get_data(as_text=True)
+
+def test_offline_threshold_covers_deadband_heartbeat():
+    assert api.offline_after(Deadband(enabled=False)) == api.OFFLINE_MARGIN
+    assert api.offline_after(Deadband(heartbeat=300)) == 300 + api.OFFLINE_MARGIN
+
+def test_live_matches_database(client):
+    client.post("/remote-data/batch", json=[
+        {"pi_id": "pi-1", "temperature": 21.0, "humidity": 45.0, "timestamp": "2025-01-01T10:00:00+00:00"},
+        {"pi_id": "pi-1", "temperature": 22.0, "humidity": 46.0, "timestamp": "2025-01-01T10:00:10+00:00"},
+        {"pi_id": "pi-2", "sensor": "temperature", "value": 30.0, "status": "HIGH"},
+    ])
+
+    resp = client.get("/live")
+
+    assert resp.status_code == 200
+    assert resp.get_json() == sensor_db.get_latest_per_pi()
+
+def test_live_served_without_database(client, monkeypatch):
+    client.post("/remote-data", json={"pi_id": "pi-1", "temperature": 21.0, "humidity": 45.0})
+    client.get("/live")
+    monkeypatch.setattr(sensor_db, "get_latest_readings", lambda: pytest.fail("queried the DB"))
+
+    resp = client.post("/remote-data", json={"pi_id": "pi-1", "sensor": "temperature", "value": 23.5})
+    live = client.get("/live").get_json()
+
+    assert resp.status_code == 200
+    assert live[0]["temperature"] == 23.5
+    assert live[0]["humidity"] == 45.0
+
+def test_live_warms_from_database(client):
+    sensor_db.store_result({
+        "timestamp": datetime.now(), "sensor": "humidity", "value": 51.0, "status": "STABLE"
+    })
+    live_cache.reset()
+
+    live = client.get("/live").get_json()
+
+    assert live == [{"pi_id": "host", "humidity": 51.0, "humidity_status": "STABLE",
+                     "humidity_timestamp": live[0]["humidity_timestamp"]}]
+
+def test_live_ignores_older_backfill(client):
+    client.post("/remote-data", json={"pi_id": "pi-1", "sensor": "temperature", "value": 25.0,
+                                      "timestamp": "2025-01-01T10:00:00+00:00"})
+    client.post("/remote-data", json={"pi_id": "pi-1", "sensor": "temperature", "value": 19.0,
+                                      "timestamp": "2025-01-01T09:00:00+00:00"})
+
+    assert client.get("/live").get_json()[0]["temperature"] == 25.0
+
+def test_live_follows_other_processes(client):
+    client.get("/live")
+    #Written by another process: no insert listener runs here
+    con = sqlite3.connect(sensor_db.DB_PATH)
+    with con:
+        con.execute("INSERT INTO pis (name) VALUES ('pi-9')")
+        pi = con.execute("SELECT id FROM pis WHERE name = 'pi-9'").fetchone()[0]
+        con.execute("INSERT INTO readings (ts, pi_id, sensor_id, status_id, value) VALUES "
+                    "(strftime('%s', 'now'), ?, (SELECT id FROM sensors WHERE name = 'humidity'), "
+                    "(SELECT id FROM statuses WHERE name = 'HIGH'), 80.0)", (pi,))
+    con.close()
+
+    assert live_cache.catch_up() == {"pi-9"}
+    assert live_cache.catch_up() == set()
+    live = client.get("/live").get_json()
+    assert [(e["pi_id"], e["humidity"]) for e in live] == [("pi-9", 80.0)]
+
+def _sse_event(chunk):
+    event, data = chunk.decode().strip().splitlines()[-2:]
+    return event.split(": ", 1)[1], json.loads(data.split(": ", 1)[1])
+
+def test_stream_pushes_live_updates(client):
+    client.post("/remote-data", json={"pi_id": "pi-1", "sensor": "temperature", "value": 21.0})
+
+    resp = client.get("/stream")
+    events = iter(resp.response)
+    assert resp.mimetype == "text/event-stream"
+    assert _sse_event(next(events)) == ("snapshot", client.get("/live").get_json())
+
+    client.post("/remote-data", json={"pi_id": "pi-2", "sensor": "humidity", "value": 40.0})
+    event, entries = _sse_event(next(events))
+
+    assert event == "live"
+    assert [(e["pi_id"], e["humidity"]) for e in entries] == [("pi-2", 40.0)]
+
+    resp.close()
+    assert len(api.live_events) == 0
+
+def test_stream_refused_past_cap(client, monkeypatch):
+    monkeypatch.setattr(api.live_events, "max_subscribers", 2)
+    streams = [client.get("/stream") for _ in range(2)]
+
+    resp = client.get("/stream")
+
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == str(api.STREAM_RETRY_AFTER)
+    assert len(api.live_events) == 2
+
+    #A closed stream frees its slot
+    streams[0].close()
+    resp = client.get("/stream")
+    assert resp.status_code == 200
+    resp.close()
+    streams[1].close()
+    assert len(api.live_events) == 0
+
+def test_live_under_concurrent_inserts(client):
+    def post_readings(pi):
+        c = api.app.test_client()
+        for i in range(20):
+            c.post("/remote-data", json={"pi_id": pi, "sensor": "temperature", "value": float(i),
+                                         "timestamp": f"2025-01-01T10:00:{i:02d}+00:00"})
+        sensor_db.close_connection()
+
+    threads = [threading.Thread(target=post_readings, args=(f"pi-{n}",)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    live = client.get("/live").get_json()
+
+    assert len(live) == 4
+    assert all(entry["temperature"] == 19.0 for entry in live)
+
+def test_history_window_uses_rollups(client):
+    now = datetime.now().astimezone()
+    client.post("/remote-data/batch", json=[
+        {"pi_id": "pi-1", "sensor": "temperature", "value": 20.0 + i, "status": "STABLE",
+         "timestamp": (now - timedelta(hours=i)).isoformat()}
+        for i in range(5)
+    ])
+
+    resp = client.get("/history?window=7d&resolution=auto")
+
+    assert resp.status_code == 200
+    assert resp.headers["X-History-Resolution"] == "hour"
+    rows = resp.get_json()
+    assert len(rows) == 5
+    assert all(r["count"] == 1 for r in rows)
+
+def test_history_window_raw(client):
+    client.post("/remote-data", json={"pi_id": "pi-1", "temperature": 21.0, "humidity": 45.0})
+
+    resp = client.get("/history?window=10m")
+
+    assert resp.headers["X-History-Resolution"] == "raw"
+    assert len(resp.get_json()) == 2
+
+def test_history_fill_previous(client):
+    now = datetime.now().astimezone().replace(microsecond=0)
+    #A deadbanded Pi: a report, then silence, then a change
+    client.post("/remote-data/batch", json=[
+        {"pi_id": "pi-1", "sensor": "temperature", "value": value, "status": "STABLE",
+         "timestamp": (now - timedelta(seconds=age)).isoformat()}
+        for value, age in ((20.0, 600), (21.0, 100))
+    ])
+
+    resp = client.get("/history?window=5m&fill=previous&step=10s")
+
+    assert resp.status_code == 200
+    assert resp.headers["X-History-Step"] == "10"
+    rows = resp.get_json()
+    #The reading from before the window carries in until the next one
+    assert len(rows) in (30, 31)
+    assert {r["value"] for r in rows} == {20.0, 21.0}
+    values = [r["value"] for r in reversed(rows)]
+    assert values == sorted(values)
+
+def test_history_fill_rejects_bad_combinations(client):
+    assert client.get("/history?fill=previous").status_code == 400
+    assert client.get("/history?window=1h&fill=cubic").status_code == 400
+    assert client.get("/history?window=1h&fill=linear&since=5").status_code == 400
+    assert client.get("/history?window=1h&fill=linear&resolution=hour").status_code == 400
+
+def test_history_rejects_bad_window(client):
+    assert client.get("/history?window=soon").status_code == 400
+    assert client.get("/history?window=1h&resolution=week").status_code == 400
+
+def test_gzip_upload_is_inflated(client):
+    body = gzip.compress(json.dumps([{"pi_id": "pi-1", "temperature": 21.0}] * 3).encode())
+
+    resp = client.post("/remote-data/batch", data=body,
+                       headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+
+    assert resp.status_code == 200
+    assert resp.get_json()["accepted"] == 3
+
+def test_gzip_upload_rejects_garbage(client):
+    resp = client.post("/remote-data", data=b"not gzip",
+                       headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+
+    assert resp.status_code == 400
+
+def test_gzip_upload_rejects_bombs(client, monkeypatch):
+    monkeypatch.setattr(api.app.wsgi_app, "max_size", 1000)
+    body = gzip.compress(b"[" + b" " * 5000 + b"]")
+
+    resp = client.post("/remote-data/batch", data=body,
+                       headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+
+    assert resp.status_code == 413
+
+def _store_rows(n):
+    start = datetime(2025, 1, 1).astimezone()
+    sensor_db.store_results([
+        {"timestamp": start + timedelta(seconds=i // 2), "sensor": "temperature",
+         "value": float(i), "status": "STABLE", "pi_id": "pi-1"}
+        for i in range(n)
+    ])
+
+def test_history_is_streamed(client):
+    _store_rows(5)
+
+    resp = client.get("/history")
+
+    assert resp.is_streamed
+    assert [r["value"] for r in resp.get_json()] == [4.0, 3.0, 2.0, 1.0, 0.0]
+
+def test_history_keyset_pagination(client):
+    _store_rows(25)
+
+    seen = []
+    before = None
+    while True:
+        url = "/history?limit=10" + (f"&before={before}" if before else "")
+        page = client.get(url).get_json()
+        if not page:
+            break
+        seen.extend(r["value"] for r in page)
+        before = page[-1]["id"]
+
+    #Pairs of rows share a timestamp; the id keeps the order stable
+    assert seen == [float(i) for i in reversed(range(25))]
+
+def test_history_ndjson(client):
+    _store_rows(3)
+
+    resp = client.get("/history?format=ndjson")
+    lines = resp.get_data(as_text=True).splitlines()
+
+    assert resp.mimetype == "application/x-ndjson"
+    assert [json.loads(line)["value"] for line in lines] == [2.0, 1.0, 0.0]
+
+def test_binary_history_falls_back_to_columnar(client):
+    sensor_db.store_results([{"timestamp": datetime.now().astimezone(), "sensor": "humidity",
+                              "value": 55.0, "status": "STABLE", "pi_id": "p" * 300}])
+
+    resp = client.get("/history?format=binary")
+
+    assert resp.status_code == 200
+    assert resp.mimetype == COLUMNAR_MIMETYPE
+    assert resp.get_json()["pis"] == ["p" * 300]
+
+def test_history_rejects_unknown_cursor(client):
+    assert client.get("/history?before=999").status_code == 400
+    assert client.get("/history?limit=0").status_code == 400
+
+def test_history_since_cursor_returns_only_new_rows(client):
+    _store_rows(3)
+    first = client.get("/history").get_json()
+    cursor = max(r["id"] for r in first)
+
+    resp = client.get(f"/history?since={cursor}")
+    assert resp.get_json() == []
+    assert resp.headers["X-History-Cursor"] == str(cursor)
+
+    sensor_db.store_results([{"timestamp": datetime.now().astimezone(), "sensor": "humidity",
+                              "value": 55.0, "status": "STABLE", "pi_id": "pi-2"}])
+    resp = client.get(f"/history?since={cursor}")
+    rows = resp.get_json()
+
+    assert [(r["sensor"], r["value"]) for r in rows] == [("humidity", 55.0)]
+    assert resp.headers["X-History-Cursor"] == str(rows[0]["id"])
+
+def test_history_format_negotiation(client):
+    _store_rows(4)
+
+    by_param = client.get("/history?format=columnar")
+    by_accept = client.get("/history", headers={"Accept": COLUMNAR_MIMETYPE})
+    binary = client.get("/history?format=binary")
+
+    assert by_param.mimetype == COLUMNAR_MIMETYPE
+    assert by_param.get_json() == by_accept.get_json()
+    assert by_param.get_json()["series"][0]["v"] == [0.0, 1.0, 2.0, 3.0]
+    decoded = from_binary(binary.get_data())
+    assert decoded["series"][0]["t"] == by_param.get_json()["series"][0]["t"]
+    assert decoded["pis"] == ["pi-1"]
+    assert client.get("/history?format=xml").status_code == 400
+
+def test_metrics_endpoint(client):
+    client.post("/remote-data", json={"pi_id": "pi-m", "temperature": 21.0, "humidity": 45.0})
+    client.post("/remote-data", json={"pi_id": "pi-m", "sensor": "temperature", "value": "warm"})
+    client.get("/live")
+
+    resp = client.get("/metrics")
+    text = resp.get_data(as_text=True)
+
+    assert resp.status_code == 200
+    assert resp.content_type.startswith("text/plain; version=0.0.4")
+    assert 'sensor_readings_accepted_total{pi_id="pi-m"}' in text
+    assert 'sensor_readings_rejected_total{pi_id="pi-m"}' in text
+    assert 'sensor_last_seen_seconds{pi_id="pi-m"}' in text
+    assert 'http_response_bytes_count{route="/live"}' in text
+    assert "sensor_db_rows 2" in text
@@ -16,10 +16,14 @@ def mock_devices(monkeypatch):
     mock_heater = Mock()
     mock_fan = Mock()
 
-    monkeypatch.setattr(env_control, 'humidifier', mock_humidifier)
-    monkeypatch.setattr(env_control, 'dehumidifier', mock_dehumidifier)
-    monkeypatch.setattr(env_control, 'heater', mock_heater)
-    monkeypatch.setattr(env_control, 'fan', mock_fan)
+    #Set in the module dict: setattr would read the old value first, and
+    #that goes through the lazy __getattr__ and claims the real pin
+    monkeypatch.setitem(vars(env_control), 'humidifier', mock_humidifier)
+    monkeypatch.setitem(vars(env_control), 'dehumidifier', mock_dehumidifier)
+    monkeypatch.setitem(vars(env_control), 'heater', mock_heater)
+    monkeypatch.setitem(vars(env_control), 'fan', mock_fan)
+    #Fresh state caches around the mocks, without minimum on/off times
+    monkeypatch.setattr(env_control, 'actuators', env_control.make_actuators(min_on=0, min_off=0))
 
     return {
         'humidifier': mock_humidifier,
@@ -41,8 +45,10 @@ class TestControlHumidity:
         result = control_humidity(None)
 
         assert result == "INVALID"
-        mock_devices['heater'].off.assert_called_once()
-        mock_devices['fan'].off.assert_called_once()
+        mock_devices['humidifier'].off.assert_called_once()
+        mock_devices['dehumidifier'].off.assert_called_once()
+        mock_devices['heater'].off.assert_not_called()
+        mock_devices['fan'].off.assert_not_called()
 
     def test_humidity_low(self, mock_devices, mock_evaluate_sensor):
         mock_evaluate_sensor.return_value = "LOW"
@@ -166,6 +172,79 @@ class TestApplyEnvironmentControl:
             "humidity_action": "INVALID"
         }
 
+class TestStateCache:
+    def test_repeated_decisions_write_once(self, mock_devices, mock_evaluate_sensor):
+        mock_evaluate_sensor.return_value = "LOW"
+
+        for _ in range(3):
+            control_temperature(15.0)
+
+        mock_devices['heater'].on.assert_called_once()
+        mock_devices['fan'].off.assert_called_once()
+        assert env_control.switch_counts()['heater'] == 0
+
+    def test_switch_counts(self, mock_devices, mock_evaluate_sensor):
+        mock_evaluate_sensor.side_effect = ["LOW", "STABLE", "LOW"]
+
+        for value in (15.0, 22.0, 15.0):
+            control_temperature(value)
+
+        #The first write only syncs the relay; the next two are switches
+        assert env_control.switch_counts()['heater'] == 2
+        assert mock_devices['heater'].on.call_count == 2
+
+    def test_minimum_on_time_holds_relay(self, mock_devices, mock_evaluate_sensor, monkeypatch):
+        monkeypatch.setattr(env_control, 'actuators', env_control.make_actuators(min_on=60, min_off=0))
+        mock_evaluate_sensor.side_effect = ["HIGH", "STABLE"]
+
+        control_temperature(30.0)
+        control_temperature(22.0)
+
+        mock_devices['fan'].on.assert_called_once()
+        mock_devices['fan'].off.assert_not_called()
+        assert env_control.actuators['fan'].held == 1
+
+    def test_reversal_waits_for_opposing_relay(self, mock_devices, mock_evaluate_sensor, monkeypatch):
+        monkeypatch.setattr(env_control, 'actuators', env_control.make_actuators(min_on=60, min_off=60))
+        now = [0.0]
+        for a in env_control.actuators.values():
+            a.clock = lambda: now[0]
+        mock_evaluate_sensor.side_effect = ["LOW", "HIGH", "HIGH"]
+
+        assert control_temperature(15.0) == "HEATING"
+        #Heater can't go off yet, so the fan must not start alongside it
+        now[0] = 10
+        assert control_temperature(30.0) == "HEATING"
+        assert env_control.actuators['heater'].state is True
+        assert not env_control.actuators['fan'].state
+        mock_devices['fan'].on.assert_not_called()
+
+        now[0] = 60
+        assert control_temperature(30.0) == "COOLING"
+        assert env_control.actuators['heater'].state is False
+        assert env_control.actuators['fan'].state is True
+
+    def test_humidity_reversal_waits_for_opposing_relay(self, mock_devices, mock_evaluate_sensor, monkeypatch):
+        monkeypatch.setattr(env_control, 'actuators', env_control.make_actuators(min_on=60, min_off=60))
+        mock_evaluate_sensor.side_effect = ["HIGH", "LOW"]
+
+        assert control_humidity(80.0) == "DEHUMIDIFYING"
+        assert control_humidity(20.0) == "DEHUMIDIFYING"
+        mock_devices['humidifier'].on.assert_not_called()
+        assert not env_control.actuators['humidifier'].state
+
+    def test_hysteresis_keeps_heater_on_near_threshold(self, mock_devices, mock_evaluate_sensor, monkeypatch):
+        monkeypatch.setitem(env_control.HYSTERESIS, 'temperature', 0.5)
+        monkeypatch.setattr(env_control.PROFILES, 'limits', lambda sensor, pi_id=None: (18.0, 26.0))
+        mock_evaluate_sensor.side_effect = ["LOW", "STABLE", "STABLE"]
+
+        assert control_temperature(17.9) == "HEATING"
+        #Just over the minimum: still inside the band, keep heating
+        assert control_temperature(18.1) == "HEATING"
+        assert control_temperature(18.6) == "STABLE"
+        mock_devices['heater'].on.assert_called_once()
+        mock_devices['heater'].off.assert_called_once()
+
 class TestShutdown:
     def test_shutdown_devices(self, mock_devices):
         shutdown_devices()
@@ -0,0 +1,56 @@
+import queue
+
+from src.broadcast import Broadcaster
+
+
+def test_publish_fans_out_to_every_subscriber():
+    b = Broadcaster()
+    q1, q2 = b.subscribe(), b.subscribe()
+
+    b.publish("a")
+
+    assert q1.get_nowait() == "a"
+    assert q2.get_nowait() == "a"
+
+def test_slow_subscriber_loses_oldest_events():
+    b = Broadcaster(queue_size=2)
+    q = b.subscribe()
+
+    for event in "abc":
+        b.publish(event)
+
+    assert [q.get_nowait(), q.get_nowait()] == ["b", "c"]
+    assert b.dropped == 1
+
+def test_unsubscribed_queue_gets_nothing():
+    b = Broadcaster()
+    q = b.subscribe()
+    b.unsubscribe(q)
+
+    b.publish("a")
+
+    assert len(b) == 0
+    try:
+        q.get_nowait()
+        assert False, "unsubscribed queue received an event"
+    except queue.Empty:
+        pass
+
+def test_listen_yields_none_on_heartbeat():
+    b = Broadcaster()
+    q = b.subscribe()
+    events = b.listen(q, heartbeat=0.01)
+
+    assert next(events) is None
+    b.publish("a")
+    assert next(events) == "a"
+
+def test_subscribers_refused_past_max():
+    b = Broadcaster(max_subscribers=1)
+    q = b.subscribe()
+
+    assert b.subscribe() is None
+    assert b.refused == 1
+
+    b.unsubscribe(q)
+    assert b.subscribe() is not None
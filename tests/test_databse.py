@@ -1,6 +1,7 @@
 import os
 import sqlite3
 import tempfile
+import threading
 import pytest
 import datetime
 import logging
@@ -15,19 +16,25 @@ def temp_db(monkeypatch):
     tmpfile.close()
     monkeypatch.setattr(sensor_db, "DB_PATH", tmpfile.name)
     yield tmpfile.name
+    sensor_db.close_connection()
     os.remove(tmpfile.name)
 
 def test_init_db_makes_table(temp_db):
-    #Test that init_db creates the sensor_data table correctly
+    #Test that init_db creates the readings table and the sensor_data view
     sensor_db.init_db()
 
     con = sqlite3.connect(temp_db)
     cur = con.cursor()
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='sensor_data';")
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='readings';")
     result = cur.fetchone()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='view' AND name='sensor_data';")
+    view = cur.fetchone()
+    version = cur.execute("PRAGMA user_version").fetchone()[0]
     con.close()
 
     assert result is not None
+    assert view is not None
+    assert version == sensor_db.SCHEMA_VERSION
 
 def test_store_result_inserts_row(temp_db, monkeypatch):
     #Test that store_result correctly inserts a row into the database
@@ -91,5 +98,271 @@ def test_get_recent_data_returns_correct_rows(temp_db):
 
      assert isinstance(data, list)
      assert len(data) == 2
-     assert data[0]["timestamp"] == "2025-01-03T00:00:00"
+     #Naive timestamps are local time and come back as ISO with an offset
+     assert datetime.datetime.fromisoformat(data[0]["timestamp"]) == datetime.datetime(2025, 1, 3).astimezone()
      assert all(k in data[0] for k in ("timestamp", "sensor", "value", "status"))
+
+def test_connection_uses_wal(temp_db):
+    #Test that connections are switched to WAL with the tuned pragmas
+    con = sensor_db.get_connection()
+
+    assert con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert con.execute("PRAGMA synchronous").fetchone()[0] == 1  #NORMAL
+
+def test_connection_reused_per_thread(temp_db):
+    #Test that a thread keeps its connection but other threads get their own
+    import threading
+
+    con = sensor_db.get_connection()
+    assert sensor_db.get_connection() is con
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(sensor_db.get_connection()))
+    t.start()
+    t.join()
+
+    assert other[0] is not con
+
+def test_connection_reopened_when_path_changes(temp_db, monkeypatch):
+    #Test that changing DB_PATH gives a connection to the new file
+    con = sensor_db.get_connection()
+
+    other_db = temp_db + "-other"
+    monkeypatch.setattr(sensor_db, "DB_PATH", other_db)
+    try:
+        assert sensor_db.get_connection() is not con
+    finally:
+        sensor_db.close_connection()
+        os.remove(other_db)
+
+def test_store_remote_batch_mixed_payloads(temp_db):
+    #Test that a batch stores both payload formats and reports rejects
+    sensor_db.init_db()
+    items = [
+        {"pi_id": "pi-1", "temperature": 21.0, "humidity": 45.0,
+         "temp_status": "STABLE", "humidity_status": "STABLE"},
+        {"pi_id": "pi-2", "sensor": "temperature", "value": 30.5, "status": "HIGH",
+         "timestamp": "2025-01-01T12:00:00"},
+        {"pi_id": "pi-3", "sensor": "humidity", "value": "wet"},
+        "not a reading",
+        {"pi_id": "pi-4"},
+    ]
+
+    summary = sensor_db.store_remote_batch(items)
+
+    assert summary["accepted"] == 2
+    assert summary["rejected"] == 3
+    assert summary["rows"] == 3
+    assert [e["index"] for e in summary["errors"]] == [2, 3, 4]
+
+    con = sqlite3.connect(temp_db)
+    rows = con.execute("SELECT pi_id, sensor, value FROM sensor_data ORDER BY id").fetchall()
+    con.close()
+
+    assert rows == [
+        ("pi-1", "temperature", 21.0),
+        ("pi-1", "humidity", 45.0),
+        ("pi-2", "temperature", 30.5),
+    ]
+
+def test_store_results_single_transaction(temp_db):
+    #Test that a failing row rolls back the whole batch
+    sensor_db.init_db()
+    now = datetime.datetime.now()
+    results = [
+        {"timestamp": now, "sensor": "temperature", "value": 20.0, "status": "STABLE"},
+        {"timestamp": now, "sensor": "humidity", "value": 50.0, "status": None},
+    ]
+
+    with pytest.raises(sqlite3.IntegrityError):
+        sensor_db.store_results(results)
+
+    con = sqlite3.connect(temp_db)
+    count = con.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+    con.close()
+
+    assert count == 0
+
+def _make_legacy_db(path, rows):
+    #Build a database with the original (v1) sensor_data table
+    con = sqlite3.connect(path)
+    con.execute("""
+        CREATE TABLE sensor_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            sensor TEXT NOT NULL,
+            value REAL,
+            status TEXT NOT NULL,
+            pi_id TEXT NOT NULL DEFAULT 'host'
+        )
+    """)
+    con.executemany(
+        "INSERT INTO sensor_data (timestamp, sensor, value, status, pi_id) VALUES (?, ?, ?, ?, ?)",
+        rows
+    )
+    con.commit()
+    con.close()
+
+def test_init_db_migrates_legacy_rows(temp_db):
+    #Test that an old text-timestamp database is upgraded in place
+    _make_legacy_db(temp_db, [
+        ("2025-01-01T10:00:00", "temperature", 21.5, "STABLE", "host"),
+        ("2025-01-01T10:00:00", "humidity", 44.0, "STABLE", "host"),
+        ("2025-01-01T10:00:10.123456", "temperature", 27.0, "HIGH", "pi-7"),
+        ("2025-01-01T10:00:20", "humidity", None, "UNKNOWN", "pi-7"),
+    ])
+
+    sensor_db.init_db()
+
+    con = sqlite3.connect(temp_db)
+    rows = con.execute("SELECT id, ts, value FROM readings ORDER BY id").fetchall()
+    indexes = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    tables = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    con.close()
+
+    base = int(datetime.datetime(2025, 1, 1, 10).timestamp())
+    assert rows == [(1, base, 21.5), (2, base, 44.0), (3, base + 10, 27.0), (4, base + 20, None)]
+    assert "idx_readings_pi_sensor_ts" in indexes
+    assert "sensor_data_v1" not in tables
+
+    latest = {p["pi_id"]: p for p in sensor_db.get_latest_per_pi()}
+    assert latest["pi-7"]["temperature"] == 27.0
+    assert latest["pi-7"]["humidity_status"] == "UNKNOWN"
+    assert datetime.datetime.fromisoformat(latest["host"]["temp_timestamp"]) == datetime.datetime(2025, 1, 1, 10).astimezone()
+
+def test_init_db_is_idempotent(temp_db):
+    #Test that running init_db on a current database changes nothing
+    sensor_db.init_db()
+    sensor_db.store_result({
+        "timestamp": datetime.datetime.now(),
+        "sensor": "temperature",
+        "value": 20.0,
+        "status": "STABLE"
+    })
+
+    sensor_db.init_db()
+
+    assert len(sensor_db.get_recent_data()) == 1
+
+def test_init_db_waits_out_another_migration(temp_db, monkeypatch):
+    #Test that a second process waits past busy_timeout for a long migration
+    _make_legacy_db(temp_db, [("2025-01-01T10:00:00", "temperature", 21.5, "STABLE", "host")])
+    monkeypatch.setitem(sensor_db.PRAGMAS, "busy_timeout", 100)
+    #As left by the process that got there first and is now migrating
+    other = sqlite3.connect(temp_db, check_same_thread=False)
+    other.execute("PRAGMA journal_mode=WAL")
+    other.execute("BEGIN IMMEDIATE")
+    release = threading.Timer(0.5, other.commit)
+    release.start()
+
+    sensor_db.init_db()
+
+    release.join()
+    other.close()
+    assert len(sensor_db.get_recent_data()) == 1
+
+def test_init_db_gives_up_after_migration_timeout(temp_db, monkeypatch):
+    #Test that init_db still raises if the lock is never released
+    monkeypatch.setitem(sensor_db.PRAGMAS, "busy_timeout", 50)
+    monkeypatch.setattr(sensor_db, "MIGRATION_LOCK_TIMEOUT", 0.2)
+    other = sqlite3.connect(temp_db)
+    other.execute("BEGIN IMMEDIATE")
+
+    with pytest.raises(sqlite3.OperationalError):
+        sensor_db.init_db()
+    other.rollback()
+    other.close()
+
+def test_timestamps_with_offsets_sort_correctly(temp_db):
+    #Test that readings from Pis in different zones order by real time
+    sensor_db.init_db()
+    sensor_db.store_remote_batch([
+        {"pi_id": "pi-nz", "sensor": "temperature", "value": 1.0, "timestamp": "2025-01-01T12:00:00+13:00"},
+        {"pi_id": "pi-uk", "sensor": "temperature", "value": 2.0, "timestamp": "2025-01-01T00:30:00+00:00"},
+    ])
+
+    data = sensor_db.get_recent_data()
+
+    assert [r["pi_id"] for r in data] == ["pi-uk", "pi-nz"]
+
+def test_rollups_updated_on_insert(temp_db):
+    #Test that minute/hour/day rollups track count, min, max, mean and statuses
+    sensor_db.init_db()
+    base = datetime.datetime(2025, 1, 1, 10, 0, tzinfo=datetime.timezone.utc)
+    sensor_db.store_results([
+        {"timestamp": base, "sensor": "temperature", "value": 20.0, "status": "STABLE"},
+        {"timestamp": base + datetime.timedelta(seconds=30), "sensor": "temperature", "value": 28.0, "status": "HIGH"},
+        {"timestamp": base + datetime.timedelta(seconds=50), "sensor": "temperature", "value": None, "status": "INVALID"},
+        {"timestamp": base + datetime.timedelta(minutes=5), "sensor": "temperature", "value": 24.0, "status": "STABLE"},
+    ])
+    since = int(base.timestamp())
+
+    minutes = sensor_db.get_rollup_data("minute", since)
+    hours = sensor_db.get_rollup_data("hour", since)
+
+    assert [m["count"] for m in minutes] == [1, 3]
+    first = minutes[1]
+    assert (first["min"], first["max"], first["value"]) == (20.0, 28.0, 24.0)
+    assert first["status_counts"] == {"LOW": 0, "STABLE": 1, "HIGH": 1, "INVALID": 1}
+
+    assert len(hours) == 1
+    assert hours[0]["count"] == 4
+    assert hours[0]["value"] == 24.0
+    assert hours[0]["status"] == "STABLE"
+
+def test_rollups_backfilled_on_migration(temp_db):
+    #Test that upgrading an old database builds rollups from existing rows
+    _make_legacy_db(temp_db, [
+        ("2025-01-01T10:00:00", "temperature", 21.0, "STABLE", "host"),
+        ("2025-01-01T10:00:30", "temperature", 23.0, "STABLE", "host"),
+        ("2025-01-01T11:00:00", "temperature", 30.0, "HIGH", "host"),
+    ])
+
+    sensor_db.init_db()
+
+    hours = sensor_db.get_rollup_data("hour", 0)
+    assert [(h["count"], h["value"]) for h in hours] == [(1, 30.0), (2, 22.0)]
+
+def test_choose_resolution():
+    #Test that the coarsest bucket giving enough points is picked
+    assert sensor_db.choose_resolution(600) == "raw"
+    assert sensor_db.choose_resolution(86400) == "minute"
+    assert sensor_db.choose_resolution(7 * 86400) == "hour"
+    assert sensor_db.choose_resolution(365 * 86400) == "day"
+
+def test_fork_drops_inherited_connection(temp_db):
+    sensor_db.init_db()
+    parent = sensor_db.get_connection()
+
+    sensor_db._reset_after_fork()
+    child = sensor_db.get_connection()
+
+    assert child is not parent
+    #The inherited handle is left alone, never closed from the child
+    assert parent.execute("SELECT 1").fetchone()[0] == 1
+    assert parent in sensor_db._inherited
+    sensor_db._inherited.remove(parent)
+    parent.close()
+
+def test_fill_series_previous_and_linear():
+    points = [(100, 1, 20.0, "STABLE"), (130, 2, 23.0, "STABLE"), (160, 3, None, "INVALID")]
+
+    previous = sensor_db._fill_series(points, 90, 170, 10, "previous")
+    linear = sensor_db._fill_series(points, 90, 170, 10, "linear")
+
+    #Nothing before the first reading; each point keeps its source id
+    assert [(t, i, v) for t, i, v, _ in previous] == [
+        (100, 1, 20.0), (110, 1, 20.0), (120, 1, 20.0), (130, 2, 23.0),
+        (140, 2, 23.0), (150, 2, 23.0), (160, 3, None), (170, 3, None),
+    ]
+    assert [v for _, _, v, _ in linear][:4] == [20.0, 21.0, 22.0, 23.0]
+    #No interpolating towards a missing value
+    assert [v for _, _, v, _ in linear][4:] == [23.0, 23.0, None, None]
+
+def test_fill_series_stops_at_max_gap():
+    points = [(0, 1, 20.0, "STABLE"), (100, 2, 25.0, "STABLE")]
+
+    filled = sensor_db._fill_series(points, 0, 100, 25, "linear", max_gap=30)
+
+    #Too far apart to join up, and not carried more than 30s
+    assert [(t, v) for t, _, v, _ in filled] == [(0, 20.0), (25, 20.0), (100, 25.0)]
@@ -0,0 +1,45 @@
+from src.deadband import Deadband
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_small_moves_held_back():
+    band = Deadband({"temperature": 0.2}, heartbeat=300, clock=FakeClock())
+
+    sent = [band.check("temperature", v, "STABLE") for v in (22.0, 22.1, 22.2, 22.25, 22.0)]
+
+    #Compared with the last value sent, so slow drift still gets through
+    assert sent == [True, False, False, True, True]
+    assert band.suppressed == 2
+
+def test_status_change_and_heartbeat_force_a_report():
+    clock = FakeClock()
+    band = Deadband({"humidity": 1.0}, heartbeat=300, clock=clock)
+
+    assert band.check("humidity", 69.9, "STABLE")
+    assert band.check("humidity", 70.1, "HIGH")
+    assert not band.check("humidity", 70.1, "HIGH")
+
+    clock.now = 300
+    assert band.check("humidity", 70.1, "HIGH")
+
+def test_missing_values_and_unknown_sensors():
+    band = Deadband({"temperature": 0.2}, clock=FakeClock())
+
+    assert band.check("temperature", None, "INVALID")
+    assert not band.check("temperature", None, "INVALID")
+    assert band.check("temperature", 21.0, "STABLE")
+    #No delta configured: every reading is forwarded
+    assert band.check("pressure", 1000.0, "STABLE")
+    assert band.check("pressure", 1000.0, "STABLE")
+
+def test_disabled_forwards_everything(monkeypatch):
+    monkeypatch.delenv("DEADBAND", raising=False)
+    band = Deadband.from_env()
+
+    assert all(band.check("temperature", 22.0, "STABLE") for _ in range(3))
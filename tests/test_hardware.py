@@ -0,0 +1,46 @@
+import sys
+import types
+from unittest.mock import MagicMock
+
+import pytest
+
+from src import hardware
+
+
+@pytest.fixture
+def fresh(monkeypatch):
+    monkeypatch.setattr(hardware, "_sense", hardware._UNSET)
+    monkeypatch.setattr(hardware, "_outputs", {})
+    yield
+    hardware.close()
+
+def test_sense_hat_opened_once_and_shared(fresh, monkeypatch):
+    fake = types.ModuleType("sense_hat")
+    fake.SenseHat = MagicMock()
+    monkeypatch.setitem(sys.modules, "sense_hat", fake)
+
+    assert hardware.sense_hat() is hardware.sense_hat()
+    fake.SenseHat.assert_called_once()
+
+def test_missing_sense_hat_is_none(fresh, monkeypatch):
+    fake = types.ModuleType("sense_hat")
+    fake.SenseHat = MagicMock(side_effect=OSError("no HAT"))
+    monkeypatch.setitem(sys.modules, "sense_hat", fake)
+
+    assert hardware.sense_hat() is None
+    assert hardware.sense_hat() is None
+    fake.SenseHat.assert_called_once()
+
+def test_output_devices_claimed_on_first_use(fresh, monkeypatch):
+    fake = types.ModuleType("gpiozero")
+    fake.OutputDevice = MagicMock()
+    monkeypatch.setitem(sys.modules, "gpiozero", fake)
+    from src import GPIO_environment_control as env_control
+
+    #Importing the control module claimed nothing
+    assert 21 not in hardware._outputs
+    device = hardware.output_device(21)
+
+    assert hardware.output_device(21) is device
+    fake.OutputDevice.assert_called_once_with(21, active_high=True, initial_value=False)
+    assert env_control.actuators["heater"].device is None
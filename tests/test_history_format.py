@@ -0,0 +1,67 @@
+import json
+import pytest
+from datetime import datetime, timezone
+
+from src.history_format import to_columnar, to_binary, from_binary
+
+
+def _row(epoch, sensor, value, status, pi_id):
+    ts = datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+    return {"id": epoch, "ts": epoch, "timestamp": ts, "sensor": sensor, "value": value,
+            "status": status, "pi_id": pi_id}
+
+#Newest first, as /history returns them
+ROWS = [
+    _row(1700000020, "temperature", 22.5, "STABLE", "pi-1"),
+    _row(1700000010, "humidity", None, "INVALID", "host"),
+    _row(1700000010, "temperature", 30.0, "HIGH", "host"),
+    _row(1700000000, "temperature", 21.5, "STABLE", "pi-1"),
+]
+
+def test_columnar_groups_series_oldest_first():
+    data = to_columnar(ROWS)
+
+    assert data["pis"] == ["pi-1", "host"]
+    assert data["statuses"] == ["STABLE", "INVALID", "HIGH"]
+    assert data["series"] == [
+        {"pi": 0, "sensor": "temperature", "t": [1700000000, 1700000020], "v": [21.5, 22.5], "s": [0, 0],
+         "id": [1700000000, 1700000020]},
+        {"pi": 1, "sensor": "humidity", "t": [1700000010], "v": [None], "s": [1], "id": [1700000010]},
+        {"pi": 1, "sensor": "temperature", "t": [1700000010], "v": [30.0], "s": [2], "id": [1700000010]},
+    ]
+
+def test_columnar_keeps_rollup_extras():
+    row = dict(_row(1700000000, "temperature", 21.0, "STABLE", "host"), min=20.0, max=22.0, count=6)
+
+    series = to_columnar([row])["series"][0]
+
+    assert (series["min"], series["max"], series["n"]) == ([20.0], [22.0], [6])
+
+def test_binary_round_trips_to_columnar():
+    decoded = from_binary(to_binary(ROWS))
+    expected = to_columnar(ROWS)
+    for series in expected["series"]:
+        del series["id"]
+
+    assert decoded == expected
+
+def test_binary_is_smaller_than_rows():
+    rows = [_row(1700000000 + i, "temperature", 20.0 + i / 10, "STABLE", "pi-1") for i in range(1000)]
+
+    assert len(to_binary(rows)) * 10 < len(json.dumps(rows))
+
+@pytest.mark.parametrize("row", [
+    _row(-1, "temperature", 20.0, "STABLE", "pi-1"),
+    _row(2 ** 32, "temperature", 20.0, "STABLE", "pi-1"),
+    _row(1700000000, "temperature", 20.0, "STABLE", "p" * 256),
+    _row(1700000000, "temperature", 20.0, "S" * 256, "pi-1"),
+])
+def test_binary_refuses_what_its_fields_cant_hold(row):
+    with pytest.raises(ValueError):
+        to_binary([row])
+
+def test_binary_accepts_field_limits():
+    rows = [_row(2 ** 32 - 1, "temperature", 21.0, "STABLE", "p" * 255),
+            _row(0, "temperature", 20.0, "STABLE", "p" * 255)]
+
+    assert from_binary(to_binary(rows))["series"][0]["t"] == [0, 2 ** 32 - 1]
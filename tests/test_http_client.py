@@ -0,0 +1,63 @@
+import gzip
+import json
+import pytest
+import requests
+from unittest.mock import MagicMock
+from src import http_client
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(http_client.time, "sleep", MagicMock())
+
+def _response(status):
+    resp = MagicMock()
+    resp.status_code = status
+    return resp
+
+def test_post_json_retries_connection_errors():
+    session = MagicMock()
+    session.post.side_effect = [requests.exceptions.ConnectionError("down"), _response(200)]
+
+    resp = http_client.post_json(session, "http://host/remote-data", {"a": 1}, retries=2)
+
+    assert resp.status_code == 200
+    assert session.post.call_count == 2
+
+def test_post_json_raises_after_last_retry():
+    session = MagicMock()
+    session.post.side_effect = requests.exceptions.ConnectionError("down")
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_client.post_json(session, "http://host/remote-data", {"a": 1}, retries=2)
+    assert session.post.call_count == 3
+
+def test_post_json_retries_unavailable_but_not_client_errors():
+    session = MagicMock()
+    session.post.side_effect = [_response(503), _response(400)]
+
+    resp = http_client.post_json(session, "http://host/remote-data", {"a": 1}, retries=3)
+
+    assert resp.status_code == 400
+    assert session.post.call_count == 2
+
+def test_post_json_gzips_large_bodies():
+    session = MagicMock()
+    session.post.return_value = _response(200)
+    payload = [{"temperature": 21.0, "pi_id": "pi-1"}] * 100
+
+    http_client.post_json(session, "http://host/remote-data/batch", payload, compress=True)
+
+    kwargs = session.post.call_args.kwargs
+    assert kwargs["headers"]["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(kwargs["data"])) == payload
+
+def test_post_json_leaves_small_bodies_alone():
+    session = MagicMock()
+    session.post.return_value = _response(200)
+
+    http_client.post_json(session, "http://host/remote-data", {"a": 1}, compress=True)
+
+    assert "Content-Encoding" not in session.post.call_args.kwargs["headers"]
+
+def test_backoff_delay_is_capped():
+    assert all(0 <= http_client.backoff_delay(n, base=0.5, cap=2.0) <= 2.0 for n in range(10))
@@ -0,0 +1,74 @@
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from src import lights
+
+
+@pytest.fixture
+def fake_hat(monkeypatch):
+    hat = MagicMock()
+    monkeypatch.setitem(vars(lights), "sense", hat)
+    monkeypatch.setattr(lights, "_display_mode", "temperature")
+    yield hat
+    lights.clear()
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("display thread did not render in time")
+        time.sleep(0.01)
+
+def _drawn_pixels(text, colour):
+    #What set_pixel-per-pixel drawing put on a cleared screen
+    pixels = {}
+    for x, digit in zip((0, 4), text):
+        for row in range(5):
+            for col in range(3):
+                if lights._digits[digit][row][col]:
+                    pixels[(x + col, 1 + row)] = colour
+    pixels[(7, 0)] = colour
+    return pixels
+
+def test_frames_match_digit_patterns():
+    for mode, colour in lights._MODE_COLOURS.items():
+        for text in ("00", "07", "23", "99"):
+            frame = lights._frames[(mode, text)]
+            expected = _drawn_pixels(text, colour)
+            assert len(frame) == 64
+            assert {(i % 8, i // 8): p for i, p in enumerate(frame) if p != lights._OFF} == expected
+
+def test_update_renders_one_frame_off_thread(fake_hat):
+    lights.update_display({"temperature": 22.6, "humidity": 50.0})
+
+    _wait_for(lambda: fake_hat.set_pixels.called)
+    fake_hat.set_pixels.assert_called_once_with(lights._frames[("temperature", "23")])
+    fake_hat.set_pixel.assert_not_called()
+    fake_hat.clear.assert_not_called()
+
+def test_unchanged_frame_not_rewritten(fake_hat):
+    lights.update_display({"temperature": 22.6, "humidity": 50.0})
+    _wait_for(lambda: fake_hat.set_pixels.call_count == 1)
+
+    #Rounds to the same value, so the screen already shows it
+    lights.update_display({"temperature": 23.4, "humidity": 50.0})
+    lights.update_display({"temperature": 24.0, "humidity": 50.0})
+    _wait_for(lambda: fake_hat.set_pixels.call_count == 2)
+    assert fake_hat.set_pixels.call_args.args[0] == lights._frames[("temperature", "24")]
+
+def test_missing_value_shows_error(fake_hat):
+    lights.update_display({"temperature": None, "humidity": 50.0})
+
+    _wait_for(lambda: fake_hat.show_letter.called)
+    fake_hat.show_letter.assert_called_once_with('E', text_colour=[255, 0, 0])
+
+def test_clear_stops_display_thread(fake_hat):
+    lights.update_display({"temperature": 20.0, "humidity": 50.0})
+    display = lights._display
+
+    lights.clear()
+
+    assert not display.is_alive()
+    fake_hat.clear.assert_called_once()
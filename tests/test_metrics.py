@@ -0,0 +1,76 @@
+import urllib.request
+
+import pytest
+
+from src import metrics
+
+
+@pytest.fixture
+def registry():
+    return metrics.Registry()
+
+def test_counter_and_gauge_render(registry):
+    requests = registry.counter("requests_total", "Requests seen", ["route"])
+    temp = registry.gauge("temperature", "Current temperature")
+
+    requests.labels("/live").inc()
+    requests.labels(route="/live").inc(2)
+    requests.labels("/history").inc()
+    temp.set(21.5)
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests seen",
+        "# TYPE requests_total counter",
+        'requests_total{route="/history"} 1',
+        'requests_total{route="/live"} 3',
+        "# HELP temperature Current temperature",
+        "# TYPE temperature gauge",
+        "temperature 21.5",
+    ]
+
+def test_histogram_buckets_are_cumulative(registry):
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+
+    for value in (0.05, 0.5, 0.5, 5.0):
+        latency.observe(value)
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "latency_seconds_sum 6.05" in lines
+    assert "latency_seconds_count 4" in lines
+
+def test_function_gauges_and_collectors_run_at_scrape(registry):
+    size = registry.gauge("size_bytes", "Size")
+    seen = registry.gauge("last_seen_seconds", "Age", ["pi_id"])
+    calls = []
+    size.set_function(lambda: len(calls))
+    registry.add_collector(lambda: (calls.append(1), seen.labels("pi-1").set(3)))
+
+    text = registry.render()
+
+    assert "size_bytes 1" in text
+    assert 'last_seen_seconds{pi_id="pi-1"} 3' in text
+
+def test_label_values_are_escaped(registry):
+    registry.counter("odd_total", "Odd labels", ["name"]).labels('a"b\\c').inc()
+
+    assert 'odd_total{name="a\\"b\\\\c"} 1' in registry.render()
+
+def test_reregistering_returns_same_metric(registry):
+    assert registry.counter("x_total", "X") is registry.counter("x_total", "X")
+    with pytest.raises(ValueError):
+        registry.gauge("x_total", "X")
+
+def test_http_server_serves_metrics(registry):
+    registry.counter("hits_total", "Hits").inc()
+    server = metrics.start_http_server(0, host="127.0.0.1", registry=registry)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as resp:
+            body = resp.read().decode()
+    finally:
+        server.shutdown()
+
+    assert "hits_total 1" in body
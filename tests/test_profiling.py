@@ -0,0 +1,98 @@
+import glob
+import json
+import os
+
+import pytest
+from flask import Flask
+
+from src import profiling
+
+
+def work(x):
+    return x * 2
+
+def test_off_returns_function_unchanged():
+    profiler = profiling.Profiler("off")
+
+    assert profiler.stage("work")(work) is work
+    assert profiler.snapshot() == {}
+
+def test_unknown_mode_rejected():
+    with pytest.raises(ValueError):
+        profiling.Profiler("sometimes")
+
+def test_bad_environment_falls_back_to_off(monkeypatch):
+    monkeypatch.setenv("PROFILE", "1")
+    monkeypatch.setenv("PROFILE_SAMPLE", "often")
+
+    profiler = profiling.Profiler.from_env()
+
+    assert not profiler.enabled
+    assert profiler.sample_every == 100
+
+def test_timers_record_stage_stats(tmp_path):
+    profiler = profiling.Profiler("timers", directory=str(tmp_path))
+    timed = profiler.stage("work")(work)
+
+    assert [timed(i) for i in range(5)] == [0, 2, 4, 6, 8]
+    assert timed.__name__ == "work"
+
+    stats = profiler.snapshot()["work"]
+    assert stats["count"] == 5
+    assert 0 <= stats["p95"] <= stats["max"] <= stats["total"]
+
+def test_exceptions_still_timed(tmp_path):
+    profiler = profiling.Profiler("timers", directory=str(tmp_path))
+
+    @profiler.stage("fails")
+    def fails():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        fails()
+    assert profiler.snapshot()["fails"]["count"] == 1
+
+def test_cprofile_samples_and_rotates_dumps(tmp_path):
+    profiler = profiling.Profiler("cprofile", sample_every=2, directory=str(tmp_path), keep=3)
+    root = profiler.stage("root", root=True)(work)
+    inner = profiler.stage("inner")(work)
+
+    for i in range(10):
+        inner(i)
+        root(i)
+
+    #Every second root call sampled, oldest dumps rotated away
+    assert len(glob.glob(str(tmp_path / "root-*.prof"))) == 3
+    stats = json.loads((tmp_path / f"stages-{os.getpid()}.json").read_text())["stages"]
+    assert stats["root"]["count"] == 10
+    assert stats["inner"]["count"] == 10
+
+def test_summary_orders_by_total_time(tmp_path, capsys):
+    (tmp_path / "stages-1.json").write_text(json.dumps({"stages": {
+        "fast": {"count": 10, "total": 0.01, "max": 0.002, "p95": 0.001},
+        "slow": {"count": 2, "total": 4.0, "max": 3.0, "p95": 3.0},
+    }}))
+    (tmp_path / "stages-2.json").write_text(json.dumps({"stages": {
+        "slow": {"count": 1, "total": 1.0, "max": 1.0, "p95": 1.0},
+    }}))
+
+    merged = profiling.load_stats(str(tmp_path))
+    assert merged["slow"] == {"count": 3, "total": 5.0, "max": 3.0, "p95": 3.0}
+
+    profiling.main(["summary", "--dir", str(tmp_path)])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[1].startswith("slow")
+    assert lines[2].startswith("fast")
+
+def test_instrument_app_times_routes(tmp_path):
+    app = Flask(__name__)
+
+    @app.route("/ping")
+    def ping():
+        return "pong"
+
+    profiler = profiling.Profiler("timers", directory=str(tmp_path))
+    profiler.instrument_app(app)
+
+    assert app.test_client().get("/ping").data == b"pong"
+    assert profiler.snapshot()["route:ping"]["count"] == 1
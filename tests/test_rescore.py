@@ -0,0 +1,87 @@
+import os
+import tempfile
+from datetime import datetime
+
+import pytest
+
+from src import sensor_db, rescore
+from src.threshold_profiles import ThresholdProfiles
+
+
+@pytest.fixture
+def temp_db(monkeypatch):
+    tmpfile = tempfile.NamedTemporaryFile(delete=False)
+    tmpfile.close()
+    monkeypatch.setattr(sensor_db, "DB_PATH", tmpfile.name)
+    sensor_db.init_db()
+    yield tmpfile.name
+    sensor_db.close_connection()
+    os.remove(tmpfile.name)
+
+PROFILES = ThresholdProfiles(
+    {"temperature": (18.0, 26.0), "humidity": (40.0, 70.0)},
+    {"pi-3": {"temperature": (10.0, 15.0)}},
+)
+
+def _store(rows):
+    ts = datetime(2025, 1, 1, 12, 0, 0)
+    sensor_db.store_results([
+        {"timestamp": ts, "sensor": sensor, "value": value, "status": status, "pi_id": pi}
+        for pi, sensor, value, status in rows
+    ])
+
+def _statuses():
+    con = sensor_db.get_connection()
+    return [row[0] for row in con.execute("SELECT status FROM sensor_data ORDER BY id")]
+
+def _rollup_counts():
+    con = sensor_db.get_connection()
+    return {
+        name: tuple(con.execute(f"""
+            SELECT SUM(n_low), SUM(n_stable), SUM(n_high), SUM(n_invalid) FROM rollup_{name}
+        """).fetchone())
+        for name in sensor_db.ROLLUPS
+    }
+
+def test_rescore_updates_statuses_and_rollups(temp_db):
+    #Statuses as stored under older thresholds
+    _store([
+        ("pi-1", "temperature", 17.0, "STABLE"),
+        ("pi-1", "temperature", 22.0, "STABLE"),
+        ("pi-1", "humidity", 75.0, "STABLE"),
+        ("pi-2", "humidity", None, "UNKNOWN"),
+        ("pi-2", "pressure", 1000.0, "STABLE"),
+    ])
+
+    result = rescore.rescore(chunk=2, profiles=PROFILES)
+
+    assert result["scanned"] == 5
+    assert result["changed"] == 3
+    assert _statuses() == ["LOW", "STABLE", "HIGH", "INVALID", "STABLE"]
+    assert set(_rollup_counts().values()) == {(1, 2, 1, 1)}
+
+    #Nothing left to change on a second pass
+    assert rescore.rescore(profiles=PROFILES)["changed"] == 0
+
+def test_rescore_dry_run_and_pi_filter(temp_db):
+    _store([
+        ("pi-1", "temperature", 30.0, "STABLE"),
+        ("pi-2", "temperature", 30.0, "STABLE"),
+    ])
+
+    assert rescore.rescore(dry_run=True, profiles=PROFILES)["changed"] == 2
+    assert _statuses() == ["STABLE", "STABLE"]
+
+    assert rescore.rescore(pi_id="pi-2", profiles=PROFILES)["changed"] == 1
+    assert _statuses() == ["STABLE", "HIGH"]
+
+def test_rescore_uses_each_pis_profile(temp_db):
+    _store([
+        ("pi-1", "temperature", 14.0, "STABLE"),
+        ("pi-3", "temperature", 14.0, "LOW"),
+        ("pi-3", "humidity", 80.0, "STABLE"),
+    ])
+
+    rescore.rescore(profiles=PROFILES)
+
+    assert _statuses() == ["LOW", "STABLE", "HIGH"]
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import tempfile
+import datetime
+import pytest
+from src import sensor_db, retention, metrics
+
+DAY = 86400
+
+@pytest.fixture
+def temp_db(monkeypatch):
+    tmpfile = tempfile.NamedTemporaryFile(delete=False)
+    tmpfile.close()
+    monkeypatch.setattr(sensor_db, "DB_PATH", tmpfile.name)
+    sensor_db.init_db()
+    yield tmpfile.name
+    sensor_db.close_connection()
+    os.remove(tmpfile.name)
+
+def _store_days_ago(now, days_list, per_day=50):
+    results = []
+    for days in days_list:
+        for i in range(per_day):
+            ts = datetime.datetime.fromtimestamp(now - days * DAY + i * 10, datetime.timezone.utc)
+            results.append({"timestamp": ts, "sensor": "temperature", "value": 20.0, "status": "STABLE"})
+    sensor_db.store_results(results)
+
+def _count(path, table):
+    con = sqlite3.connect(path)
+    n = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    con.close()
+    return n
+
+def test_new_database_uses_incremental_vacuum(temp_db):
+    assert sensor_db.get_connection().execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+def test_enforce_retention_trims_each_tier(temp_db):
+    now = 200 * DAY
+    _store_days_ago(now, [1, 10, 100])
+    policy = {"raw": 7, "minute": 90, "hour": None, "day": None}
+
+    stats = retention.enforce_retention(policy, now=now, batch_size=7, pause=0)
+
+    assert stats["rows"]["raw"] == 100
+    assert stats["rows"]["minute"] == 9
+    assert "hour" not in stats["rows"]
+    assert _count(temp_db, "readings") == 50
+    #Rollups outlive the raw rows they were built from
+    assert _count(temp_db, "rollup_minute") == 18
+    assert _count(temp_db, "rollup_hour") == 3
+
+def test_enforce_retention_reclaims_space(temp_db):
+    now = 200 * DAY
+    _store_days_ago(now, [30], per_day=5000)
+
+    stats = retention.enforce_retention({"raw": 7}, now=now, pause=0)
+
+    assert stats["rows"]["raw"] == 5000
+    assert stats["bytes"] > 0
+    assert sensor_db.get_connection().execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+def test_enforce_retention_exports_metrics(temp_db):
+    now = 200 * DAY
+    _store_days_ago(now, [30], per_day=500)
+    rows_before = retention.ROWS_DELETED.labels("raw").get()
+    bytes_before = retention.BYTES_RECLAIMED.labels().get()
+
+    stats = retention.enforce_retention({"raw": 7}, now=now, pause=0)
+
+    assert retention.ROWS_DELETED.labels("raw").get() - rows_before == 500
+    assert retention.BYTES_RECLAIMED.labels().get() - bytes_before == stats["bytes"]
+    assert retention.LAST_RUN.labels().get() > 0
+    assert "retention_rows_deleted_total{tier=\"raw\"}" in metrics.render()
+
+def test_load_policy_from_env(monkeypatch):
+    monkeypatch.setenv("RETENTION_RAW_DAYS", "3")
+    monkeypatch.setenv("RETENTION_MINUTE_DAYS", "forever")
+
+    policy = retention.load_policy()
+
+    assert policy == {"raw": 3.0, "minute": None, "hour": None, "day": None}
+
+def test_load_policy_rejects_zero_days(monkeypatch):
+    monkeypatch.setenv("RETENTION_RAW_DAYS", "0")
+
+    with pytest.raises(ValueError):
+        retention.load_policy()
+
+def test_only_upgrading_process_converts_to_incremental_vacuum(tmp_path, monkeypatch):
+    path = str(tmp_path / "old.db")
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE sensor_data (id INTEGER PRIMARY KEY, timestamp TEXT, sensor TEXT, value REAL, status TEXT, pi_id TEXT)")
+    con.commit()
+    con.close()
+    monkeypatch.setattr(sensor_db, "DB_PATH", path)
+    statements = []
+    real_execute = sensor_db._execute_when_free
+
+    def execute_when_free(con, sql, timeout):
+        statements.append(sql)
+        return real_execute(con, sql, timeout)
+
+    monkeypatch.setattr(sensor_db, "_execute_when_free", execute_when_free)
+
+    sensor_db.init_db()
+    sensor_db.init_db()
+    mode = sensor_db.get_connection().execute("PRAGMA auto_vacuum").fetchone()[0]
+    sensor_db.close_connection()
+
+    #The second init finds the schema current and leaves the file alone
+    assert statements.count("VACUUM") == 1
+    assert mode == 2
+
+def test_only_one_worker_holds_the_lock(tmp_path):
+    lock = str(tmp_path / "retention.lock")
+    first = retention.RetentionWorker(policy={}, lock_path=lock)
+    second = retention.RetentionWorker(policy={}, lock_path=lock)
+
+    assert first._acquire()
+    assert not second._acquire()
+
+    first._lock_file.close()
+    first._lock_file = None
+    assert second._acquire()
+    second._lock_file.close()
@@ -13,7 +13,7 @@ def test_reads_humidity_temperature(monkeypatch):
     fake_hat = MagicMock()
     fake_hat.get_humidity.return_value = 55.0
     fake_hat.get_temperature.return_value = 22.5
-    monkeypatch.setattr(sensors, "sense", fake_hat)
+    monkeypatch.setitem(vars(sensors), "sense", fake_hat)
 
     data = sensors.read_values()
 
@@ -38,7 +38,7 @@ def test_reads_handles_invalid_values(monkeypatch):
     fake_hat = MagicMock()
     fake_hat.get_humidity.return_value = None
     fake_hat.get_temperature.return_value = float('nan')
-    monkeypatch.setattr(sensors, "sense", fake_hat)
+    monkeypatch.setitem(vars(sensors), "sense", fake_hat)
 
     data = sensors.read_values()
 
@@ -51,7 +51,7 @@ def test_sensor_reader_thread(monkeypatch):
     fake_hat = MagicMock()
     fake_hat.get_humidity.return_value = 60.0
     fake_hat.get_temperature.return_value = 25.0
-    monkeypatch.setattr(sensors, "sense", fake_hat)
+    monkeypatch.setitem(vars(sensors), "sense", fake_hat)
 
     callback = MagicMock()
     reader = SensorReader(interval = 0.1, callback = callback)
@@ -74,14 +74,15 @@ def test_sensor_reader_thread(monkeypatch):
     assert callback.called
     callback.assert_called_with(expected_data)
 
-    #Verify time.sleep was called with correct interval
-    time.sleep.assert_called_with(0.1)
+    #Verify the first wait was for the next slot, at most one interval away
+    delay = time.sleep.call_args_list[0].args[0]
+    assert 0 <= delay <= 0.1
 
 def test_sensor_reader_no_callback(monkeypatch):
     fake_hat = MagicMock()
     fake_hat.get_humidity.return_value = 60.0
     fake_hat.get_temperature.return_value = 25.0
-    monkeypatch.setattr(sensors, "sense", fake_hat)
+    monkeypatch.setitem(vars(sensors), "sense", fake_hat)
     monkeypatch.setattr(time, "sleep", MagicMock())
 
     reader = SensorReader(interval = 0.1, callback = None)
@@ -96,7 +97,7 @@ def test_sensor_reader_invalid_data(monkeypatch):
     fake_hat = MagicMock()
     fake_hat.get_humidity.return_value = None
     fake_hat.get_temperature.return_value = float('nan')
-    monkeypatch.setattr(sensors, "sense", fake_hat)
+    monkeypatch.setitem(vars(sensors), "sense", fake_hat)
     callback = MagicMock()
     reader = SensorReader(interval = 0.1, callback = callback)
     monkeypatch.setattr(time, "sleep", MagicMock())
@@ -106,4 +107,85 @@ def test_sensor_reader_invalid_data(monkeypatch):
     reader.stop()
     reader.join()
 
-    callback.assert_called_with({"humidity": None, "temperature": None})
\ No newline at end of file
+    callback.assert_called_with({"humidity": None, "temperature": None})
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 6))
+        self.now += seconds
+
+def _run_for(reader, clock, monkeypatch, reports, work=0.0):
+    monkeypatch.setattr(time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(time, "sleep", clock.sleep)
+    received = []
+
+    def callback(data):
+        received.append(data)
+        clock.now += work
+        if len(received) == reports:
+            reader.stop()
+
+    reader.callback = callback
+    #Run in this thread so the fake clock is the only one it sees
+    reader.run()
+    return received
+
+def test_schedule_does_not_drift_with_slow_callback(monkeypatch):
+    clock = FakeClock()
+    reader = SensorReader(interval = 1.0)
+
+    _run_for(reader, clock, monkeypatch, reports = 3, work = 0.3)
+
+    #Callback time comes out of the wait instead of adding to it
+    assert clock.sleeps == [0.7, 0.7, 0.7]
+    assert reader.overruns == 0
+
+def test_schedule_skips_missed_slots(monkeypatch):
+    clock = FakeClock()
+    reader = SensorReader(interval = 1.0)
+
+    _run_for(reader, clock, monkeypatch, reports = 2, work = 2.5)
+
+    #2.5s of work misses two 1s slots; the next starts back on the grid
+    assert clock.sleeps == [0.5, 0.5]
+    assert reader.overruns == 4
+
+def test_oversampling_reports_once_per_interval(monkeypatch):
+    readings = iter([
+        {"temperature": 22.0, "humidity": 50.0},
+        {"temperature": 22.2, "humidity": None},
+        {"temperature": 35.0, "humidity": 51.0},
+        {"temperature": 21.9, "humidity": 49.0},
+    ])
+    monkeypatch.setattr(sensors, "read_values", lambda: next(readings))
+    clock = FakeClock()
+    reader = SensorReader(interval = 1.0, samples = 4)
+
+    received = _run_for(reader, clock, monkeypatch, reports = 1)
+
+    assert clock.sleeps == [0.25, 0.25, 0.25, 0.25]
+    assert received == [{
+        "samples": 4,
+        "temperature": 22.0,  #35.0 rejected as an outlier
+        "temperature_min": 21.9,
+        "temperature_max": 35.0,
+        "humidity": 50.0,
+        "humidity_min": 49.0,
+        "humidity_max": 51.0,
+    }]
+
+def test_combine_samples_mean_and_missing_field():
+    samples = [{"temperature": 20.0, "humidity": None}, {"temperature": 21.0, "humidity": None}]
+
+    data = sensors.combine_samples(samples, method = "mean")
+
+    assert data["temperature"] == 20.5
+    assert data["humidity"] is None
+    assert data["humidity_min"] is None
@@ -0,0 +1,114 @@
+import os
+import json
+from unittest.mock import MagicMock
+import client_sender
+from src.deadband import Deadband
+from src.spool import Spool
+
+def test_records_survive_reopen(tmp_path):
+    spool = Spool(str(tmp_path))
+    for i in range(5):
+        spool.append({"n": i})
+    spool.close()
+
+    reopened = Spool(str(tmp_path))
+    records, _ = reopened.read_batch(10)
+
+    assert records == [{"n": i} for i in range(5)]
+
+def test_ack_removes_delivered_records(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=30)
+    for i in range(10):
+        spool.append({"n": i})
+
+    records, position = spool.read_batch(4)
+    spool.ack(position)
+    spool.close()
+
+    reopened = Spool(str(tmp_path), segment_bytes=30)
+    rest, position = reopened.read_batch(100)
+    assert [r["n"] for r in records] == [0, 1, 2, 3]
+    assert [r["n"] for r in rest] == [4, 5, 6, 7, 8, 9]
+
+    reopened.ack(position)
+    assert reopened.is_empty()
+    assert reopened.pending_bytes() == 0
+
+def test_size_cap_evicts_oldest(tmp_path):
+    spool = Spool(str(tmp_path), max_bytes=100, segment_bytes=40)
+    for i in range(20):
+        spool.append({"n": i})
+
+    records, _ = spool.read_batch(100)
+
+    assert records[-1] == {"n": 19}
+    assert records[0]["n"] > 0
+    assert spool.evicted_bytes > 0
+    assert sum(os.path.getsize(tmp_path / f) for f in os.listdir(tmp_path) if f.endswith(".log")) <= 100 + 40
+
+def test_half_written_record_is_not_read(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append({"n": 1})
+    spool.close()
+    with open(tmp_path / "0000000000.log", "ab") as f:
+        f.write(b'{"n": 2')
+
+    records, position = Spool(str(tmp_path)).read_batch(10)
+
+    assert records == [{"n": 1}]
+
+def _sender(tmp_path, monkeypatch, *responses):
+    monkeypatch.setattr(client_sender.time, "sleep", MagicMock())
+    post = MagicMock(side_effect=list(responses))
+    monkeypatch.setattr(client_sender, "post_json", post)
+    sender = client_sender.DataSender("http://host:5000", "pi-1", spool_dir=str(tmp_path),
+                                      deadband=Deadband(enabled=False))
+    for i in range(3):
+        sender.spool.append({"pi_id": "pi-1", "temperature": float(i)})
+    return sender, post
+
+def _response(status, body=None):
+    resp = MagicMock()
+    resp.status_code = status
+    resp.json.return_value = body
+    return resp
+
+def _kept(tmp_path):
+    with open(tmp_path / client_sender.DataSender.REJECTED_FILE) as f:
+        return [json.loads(line) for line in f]
+
+def test_drain_keeps_items_the_host_rejected(tmp_path, monkeypatch):
+    body = {"accepted": 2, "rejected": 1, "errors": [{"index": 1, "error": "bad value"}]}
+    sender, _ = _sender(tmp_path, monkeypatch, _response(200, body))
+
+    assert sender.drain_spool() == 2
+
+    assert sender.spool.is_empty()
+    assert _kept(tmp_path) == [{"record": {"pi_id": "pi-1", "temperature": 1.0}, "error": "bad value"}]
+
+def test_drain_sets_aside_a_batch_refused_with_4xx(tmp_path, monkeypatch):
+    sender, _ = _sender(tmp_path, monkeypatch, _response(413))
+
+    assert sender.drain_spool() == 0
+
+    assert sender.spool.is_empty()
+    assert sender.rejected == 3
+    assert [k["error"] for k in _kept(tmp_path)] == ["HTTP 413"] * 3
+
+def test_drain_stops_and_keeps_spool_on_5xx(tmp_path, monkeypatch):
+    sender, post = _sender(tmp_path, monkeypatch, _response(503))
+
+    assert sender.drain_spool() == 0
+
+    assert not sender.spool.is_empty()
+    assert post.call_count == 1
+    assert not (tmp_path / client_sender.DataSender.REJECTED_FILE).exists()
+
+def test_drain_keeps_spool_when_throttled(tmp_path, monkeypatch):
+    sender, _ = _sender(tmp_path, monkeypatch, _response(429))
+
+    assert sender.drain_spool() == 0
+
+    records, _ = sender.spool.read_batch(10)
+    assert len(records) == 3
+    assert sender.rejected == 0
@@ -0,0 +1,75 @@
+import json
+import os
+
+import pytest
+
+from src.threshold_profiles import ThresholdProfiles, ThresholdStore
+from src import thresholds
+
+DEFAULTS = {"temperature": (18.0, 26.0), "humidity": (40.0, 70.0)}
+
+def _write(path, config, mtime):
+    path.write_text(json.dumps(config))
+    #Pin the mtime so reloads don't depend on the filesystem's resolution
+    os.utime(path, ns=(mtime, mtime))
+
+def test_profiles_fall_back_to_defaults():
+    profiles = ThresholdProfiles.from_config(
+        {"default": {"humidity": [30, 60]}, "pis": {"pi-7": {"temperature": [20, 22]}}},
+        DEFAULTS,
+    )
+
+    assert profiles.limits("temperature") == (18.0, 26.0)
+    assert profiles.limits("humidity", "pi-unknown") == (30.0, 60.0)
+    assert profiles.limits("temperature", "pi-7") == (20.0, 22.0)
+    #Overrides keep the (file) defaults for the sensors they leave out
+    assert profiles.limits("humidity", "pi-7") == (30.0, 60.0)
+
+@pytest.mark.parametrize("config", [
+    [],
+    {"default": {"temperature": "cold"}},
+    {"default": {"temperature": [26, 18]}},
+    {"pis": {"pi-7": [20, 22]}},
+])
+def test_invalid_config_rejected(config):
+    with pytest.raises(ValueError):
+        ThresholdProfiles.from_config(config, DEFAULTS)
+
+def test_store_reloads_on_change_and_keeps_last_good(tmp_path):
+    path = tmp_path / "thresholds.json"
+    store = ThresholdStore(str(path), DEFAULTS, check_interval=0)
+    assert store.limits("temperature", "pi-7") == (18.0, 26.0)
+
+    _write(path, {"pis": {"pi-7": {"temperature": [20, 22]}}}, 1_000_000_000)
+    assert store.limits("temperature", "pi-7") == (20.0, 22.0)
+
+    #A broken edit is ignored until the file is fixed
+    path.write_text("{not json")
+    os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+    assert store.limits("temperature", "pi-7") == (20.0, 22.0)
+
+    _write(path, {"pis": {"pi-7": {"temperature": [21, 23]}}}, 3_000_000_000)
+    assert store.limits("temperature", "pi-7") == (21.0, 23.0)
+
+    path.unlink()
+    assert store.limits("temperature", "pi-7") == (18.0, 26.0)
+
+def test_store_checks_file_at_most_every_interval(tmp_path):
+    path = tmp_path / "thresholds.json"
+    store = ThresholdStore(str(path), DEFAULTS, check_interval=3600)
+    store.current()
+
+    _write(path, {"default": {"temperature": [0, 1]}}, 1_000_000_000)
+    assert store.limits("temperature") == (18.0, 26.0)
+    assert store.check()
+    assert store.limits("temperature") == (0.0, 1.0)
+
+def test_evaluate_sensor_uses_profiles(monkeypatch):
+    profiles = ThresholdProfiles(DEFAULTS, {"pi-7": {"temperature": (20, 22)}})
+    monkeypatch.setattr(thresholds.PROFILES, "current", lambda: profiles)
+
+    assert thresholds.evaluate_sensor(19.0, sensor="temperature") == "STABLE"
+    assert thresholds.evaluate_sensor(19.0, sensor="temperature", pi_id="pi-7") == "LOW"
+
+    results = thresholds.evaluate_sensor_reading({"temperature": 23.0, "humidity": 50.0}, "pi-7")
+    assert [r["status"] for r in results] == ["HIGH", "STABLE"]
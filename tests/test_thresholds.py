@@ -84,3 +84,12 @@ def test_sensor_slightly_above(monkeypatch):
     for r in results:
         assert r["status"] == expected_status[r["sensor"]]
     assert len(mock_store.results) == 2
+
+def test_batch_matches_scalar():
+    from src.thresholds import evaluate_sensor, evaluate_sensor_batch
+
+    values = [None, float("nan"), -5.0, 17.99, 18.0, 22.0, 26.0, 26.01, 80.0]
+    batch = evaluate_sensor_batch(values, 18.0, 26.0)
+
+    assert list(batch) == [evaluate_sensor(v, 18.0, 26.0) for v in values]
+    assert list(batch[:2]) == ["INVALID", "INVALID"]
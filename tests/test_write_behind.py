@@ -0,0 +1,75 @@
+import time
+import threading
+import pytest
+from src.write_behind import WriteBehindQueue
+
+def test_items_handled_in_batches():
+    batches = []
+    q = WriteBehindQueue(batches.append, batch_size=3)
+    for i in range(7):
+        q.put(i)
+
+    q.start()
+    assert q.stop(timeout=2)
+
+    assert [i for b in batches for i in b] == list(range(7))
+    assert max(len(b) for b in batches) <= 3
+    assert q.processed == 7
+
+def test_put_does_not_wait_for_handler():
+    release = threading.Event()
+    q = WriteBehindQueue(lambda batch: release.wait(2)).start()
+
+    start = time.monotonic()
+    for i in range(5):
+        q.put(i)
+    elapsed = time.monotonic() - start
+
+    release.set()
+    assert q.stop(timeout=2)
+    assert elapsed < 0.5
+
+def test_drop_oldest_keeps_newest():
+    handled = []
+    q = WriteBehindQueue(handled.extend, maxsize=3, overflow="drop_oldest")
+    for i in range(5):
+        assert q.put(i)
+
+    q.start()
+    q.stop(timeout=2)
+
+    assert handled == [2, 3, 4]
+    assert q.dropped == 2
+
+def test_drop_newest_rejects_incoming():
+    handled = []
+    q = WriteBehindQueue(handled.extend, maxsize=3, overflow="drop_newest")
+    results = [q.put(i) for i in range(5)]
+
+    q.start()
+    q.stop(timeout=2)
+
+    assert results == [True, True, True, False, False]
+    assert handled == [0, 1, 2]
+
+def test_block_times_out_when_full():
+    q = WriteBehindQueue(lambda batch: None, maxsize=1, overflow="block")
+    q.put(1)
+
+    assert q.put(2, timeout=0.05) is False
+    assert q.dropped == 1
+
+def test_handler_errors_are_counted():
+    def handler(batch):
+        raise RuntimeError("disk full")
+
+    q = WriteBehindQueue(handler).start()
+    q.put(1)
+    q.stop(timeout=2)
+
+    assert q.failed == 1
+    assert q.processed == 0
+
+def test_rejects_unknown_overflow():
+    with pytest.raises(ValueError):
+        WriteBehindQueue(print, overflow="spill")